@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# Synthetic clinic dataset generator for the benchmarks.
+#
+#     python -m benchmarks.datasets --patients 10000 --out /tmp/clinic
+#
+# Writes patients.json, medicines.json, schedules.json and users.txt in the
+# same shapes the services produce. Sizes scale from the patient count
+# (medicines/schedules per patient and patients per doctor are configurable).
+import argparse
+import json
+import random
+from datetime import date, timedelta
+from pathlib import Path
+
+from services.passwords import LegacySHA256Hasher
+
+FIRST_NAMES = ["Kelly", "Jolly", "John", "Aline", "Eric", "Grace", "Jean", "Divine", "Claude", "Alice",
+               "Patrick", "Diane", "Olivier", "Sandrine", "Emmanuel", "Chantal", "David", "Yvette"]
+LAST_NAMES = ["Uwase", "Doe", "Mugisha", "Niyonzima", "Uwimana", "Habimana", "Ingabire", "Nshuti",
+              "Mukamana", "Kamanzi", "Iradukunda", "Mutoni", "Ndayisaba", "Umutoni"]
+MEDICINES = ["Paracetamol", "Doliprame", "Ibuprofene", "Amoxicillin", "Metformin", "Omeprazole",
+             "Amlodipine", "Atorvastatin", "Ciprofloxacin", "Salbutamol", "Losartan", "Azithromycin",
+             "Cetirizine", "Diclofenac", "Insulin", "Aspirin"]
+DOSAGES = ["100mg", "250mg", "300mg", "400mg", "500mg", "1g", "0.2l"]
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+# users.txt rows for generated patients/doctors use the cheap legacy hash so generation stays fast
+BENCH_PASSWORD = "benchpass123"
+
+
+def doctor_name(i):
+    return f"doctor{i}"
+
+
+def generate(out_dir, patients=1000, meds_per_patient=3, schedules_per_patient=2,
+             patients_per_doctor=200, seed=42):
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n_doctors = max(1, patients // patients_per_doctor)
+    pwd_hash = LegacySHA256Hasher().hash(BENCH_PASSWORD)
+
+    patient_ids = []
+    with open(out_dir / "users.txt", "w", encoding="utf-8") as users, \
+            open(out_dir / "patients.json", "w", encoding="utf-8") as pat:
+        for d in range(n_doctors):
+            users.write(f"{doctor_name(d)}:{pwd_hash}:{doctor_name(d)}:{doctor_name(d)}@clinic.test:doctor:Clinic:2025-11-19 13:21:57\n")
+        pat.write('{\n  "patients": [\n')
+        for i in range(patients):
+            pid = f"P{1700000000 + i}"
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+            patient_ids.append(pid)
+            rec = {"id": pid, "name": name, "doctor": doctor_name(i % n_doctors),
+                   "user_username": name, "created_at": "2025-11-19 13:21:57"}
+            pat.write(("    " if i == 0 else ",\n    ") + json.dumps(rec))
+            users.write(f"{name}:{pwd_hash}:{name}::patient::2025-11-19 13:21:57\n")
+        pat.write("\n  ]\n}\n")
+
+    start = date(2026, 1, 1)
+    with open(out_dir / "medicines.json", "w", encoding="utf-8") as med:
+        med.write('{\n  "medicines": [\n')
+        first = True
+        for i, pid in enumerate(patient_ids):
+            for k in range(meds_per_patient):
+                rec = {"id": f"M{1700000000 + i * meds_per_patient + k}", "patient_id": pid, "name": rng.choice(MEDICINES), "dosage": rng.choice(DOSAGES),
+                       "quantity": str(rng.randint(5, 120)),
+                       "expiry_date": (start + timedelta(days=rng.randint(0, 1500))).isoformat(),
+                       "added_by": doctor_name(i % n_doctors), "added_at": "2025-11-19 13:28:46"}
+                med.write(("    " if first else ",\n    ") + json.dumps(rec))
+                first = False
+        med.write("\n  ]\n}\n")
+
+    with open(out_dir / "schedules.json", "w", encoding="utf-8") as sch:
+        sch.write('{\n  "schedules": [\n')
+        first = True
+        for i, pid in enumerate(patient_ids):
+            for k in range(schedules_per_patient):
+                days = sorted(rng.sample(range(7), rng.randint(1, 7)))
+                rec = {"id": f"S{1700000000 + i * schedules_per_patient + k}", "patient_id": pid, "medicine_name": rng.choice(MEDICINES), "dosage": rng.choice(DOSAGES),
+                       "time": f"{rng.randint(0, 23):02d}:{rng.choice([0, 15, 30, 45]):02d}:00",
+                       "days": [DAYS[d] for d in days], "created_by": doctor_name(i % n_doctors)}
+                sch.write(("    " if first else ",\n    ") + json.dumps(rec))
+                first = False
+        sch.write("\n  ]\n}\n")
+
+    return {"patients": patients, "medicines": patients * meds_per_patient,
+            "schedules": patients * schedules_per_patient, "doctors": n_doctors,
+            "users": patients + n_doctors, "patient_ids": patient_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic clinic dataset")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--meds-per-patient", type=int, default=3)
+    parser.add_argument("--schedules-per-patient", type=int, default=2)
+    parser.add_argument("--patients-per-doctor", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    info = generate(args.out, args.patients, args.meds_per_patient, args.schedules_per_patient,
+                    args.patients_per_doctor, args.seed)
+    info.pop("patient_ids")
+    print(json.dumps(info))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+# Login latency for each password hashing scheme and cost setting.
+#
+# Run from the src folder:
+#     python -m benchmarks.hashing
+#     python -m benchmarks.hashing --rounds 20 --json hashing_results.json
+#
+# "hash" is the cost of sign-up / hash upgrade, "login" is a full
+# UserRepository.authenticate() against a temporary users.txt (index lookup +
+# KDF verification), "cached login" is the same login served by the
+# verification cache. Pick the highest cost whose login latency still fits
+# your login throughput, then set MEDITRACKER_PASSWORD_SCHEME / _COST.
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from services import user_service
+from services.passwords import PasswordContext, VerificationCache, get_hasher
+
+SETTINGS = [
+    ("sha256", None),
+    ("pbkdf2_sha256", 100_000),
+    ("pbkdf2_sha256", 300_000),
+    ("pbkdf2_sha256", 600_000),
+    ("scrypt", 2 ** 13),
+    ("scrypt", 2 ** 14),
+    ("scrypt", 2 ** 15),
+]
+
+
+def _ms(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+    }
+
+
+def bench_setting(scheme, cost, rounds, workdir):
+    context = PasswordContext(get_hasher(scheme, cost), VerificationCache())
+    hash_times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        context.hash("correct horse battery")
+        hash_times.append(time.perf_counter() - start)
+
+    # authenticate() goes through the module-level password helpers, so point them at this context
+    original = user_service.verify_password, user_service.needs_rehash, user_service.hash_password
+    user_service.verify_password, user_service.needs_rehash, user_service.hash_password = \
+        context.verify, context.needs_rehash, context.hash
+    try:
+        repo = user_service.UserRepository(Path(workdir) / f"users_{scheme}_{cost}.txt")
+        repo.save_user("drbench", "correct horse battery", "drbench", "bench@example.org", "doctor", "org")
+        uncached, cached = [], []
+        for _ in range(rounds):
+            context.cache = VerificationCache()
+            start = time.perf_counter()
+            assert repo.authenticate("drbench", "correct horse battery")
+            uncached.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            assert repo.authenticate("drbench", "correct horse battery")
+            cached.append(time.perf_counter() - start)
+    finally:
+        user_service.verify_password, user_service.needs_rehash, user_service.hash_password = original
+
+    return {
+        "scheme": scheme,
+        "cost": context.hasher.cost,
+        "hash": _ms(hash_times),
+        "login": _ms(uncached),
+        "cached_login": _ms(cached),
+        "logins_per_second": round(1 / statistics.median(uncached), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password hashing cost settings")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'scheme':<15}{'cost':>10}{'hash p50':>12}{'login p50':>12}{'login p99':>12}{'cached':>10}{'logins/s':>10}")
+        for scheme, cost in SETTINGS:
+            r = bench_setting(scheme, cost, args.rounds, workdir)
+            results.append(r)
+            print(f"{r['scheme']:<15}{str(r['cost'] or '-'):>10}{r['hash']['p50_ms']:>10}ms"
+                  f"{r['login']['p50_ms']:>10}ms{r['login']['p99_ms']:>10}ms"
+                  f"{r['cached_login']['p50_ms']:>8}ms{r['logins_per_second']:>10}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
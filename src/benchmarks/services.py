@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+# Service-level benchmark over synthetic clinic datasets.
+#
+# Run from the src folder:
+#     python -m benchmarks.services --sizes 1000 10000 100000 --output bench_results.json
+#     python -m benchmarks.services --sizes 1000 --compare bench_results.json
+#
+# For every size it generates a dataset (benchmarks/datasets.py) in a temporary
+# folder, points fresh repositories at it and times the service calls used by
+# main.py. Each operation reports p50/p99 latency and throughput; every size
+# also reports cold-load time, peak traced memory and the memory of each store's
+# records held as dicts vs. compact records (services/records.py). Results go to a JSON file
+# so runs can be compared (--compare prints the p50 ratio against an older file).
+import argparse
+import json
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.datasets import BENCH_PASSWORD, doctor_name, generate
+from services import user_service
+from services.inventory import MedicineInventory
+from services.passwords import LegacySHA256Hasher, PasswordContext
+from services.records import compact
+from services.patient_service import PatientRepository
+from services.reminder_service import ScheduleManager
+from services.user_service import UserRepository
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "n": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 4),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 4),
+        "ops_per_sec": round(len(samples) / total, 1) if total else None,
+    }
+
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def open_stores(folder):
+    folder = Path(folder)
+    repo = PatientRepository(folder / "patients.json", folder / "medicines.json", folder / "schedules.json")
+    inventory = MedicineInventory(folder / "medicines.json")
+    schedules = ScheduleManager(folder / "schedules.json")
+    users = UserRepository(folder / "users.txt")
+    return repo, inventory, schedules, users
+
+
+def cold_load(repo, inventory, schedules, users):
+    for store in (repo.pat_store, inventory, schedules):
+        store.invalidate()
+    timings = {}
+    for name, store in (("patients", repo.pat_store), ("medicines", inventory), ("schedules", schedules)):
+        start = time.perf_counter()
+        store.load()
+        timings[f"load_{name}_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    start = time.perf_counter()
+    users.get_user("nobody")
+    timings["load_users_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return timings
+
+
+# traced MB of each store's records parsed into dicts, then converted to compact records
+def record_memory(folder):
+    sizes = {}
+    for root_key in ("patients", "medicines", "schedules"):
+        text = (Path(folder) / f"{root_key}.json").read_text()
+        tracemalloc.start()
+        records = json.loads(text)[root_key]
+        as_dicts = tracemalloc.get_traced_memory()[0]
+        records = compact(root_key, records)
+        as_records = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        sizes[root_key] = {"dicts_mb": round(as_dicts / (1024 * 1024), 2),
+                           "records_mb": round(as_records / (1024 * 1024), 2), "count": len(records)}
+    return sizes
+
+
+def bench_size(size, iterations, seed, workdir):
+    folder = Path(workdir) / f"clinic_{size}"
+    info = generate(folder, patients=size, seed=seed)
+    rng = random.Random(seed)
+    patient_ids = info["patient_ids"]
+    doctors = [doctor_name(d) for d in range(info["doctors"])]
+
+    repo, inventory, schedules, users = open_stores(folder)
+    result = {"size": size, "records": {k: v for k, v in info.items() if k != "patient_ids"}}
+    result["cold_load"] = cold_load(repo, inventory, schedules, users)
+
+    pick_pids = [rng.choice(patient_ids) for _ in range(iterations)]
+    pick_docs = [rng.choice(doctors) for _ in range(iterations)]
+    now = datetime(2026, 10, 19, 8, 0)
+    ops = {
+        "list_patients": timed(repo.list_patients, [(d,) for d in pick_docs]),
+        "search_patients": timed(repo.search_patients, [(d, rng.choice(["uwase", "john", "P17"])) for d in pick_docs]),
+        "list_medicines": timed(inventory.list_medicines, [(p,) for p in pick_pids]),
+        "edit_medicine": timed(inventory.edit_medicine,
+                               [(p, inventory.list_medicines(p, limit=1)[0]["id"], "Paracetamol", "500mg", "10",
+                                 "2027-01-01") for p in pick_pids]),
+        "due_reminders_for_patient": timed(schedules.due_reminders_for_patient, [(p, now) for p in pick_pids]),
+    }
+
+    # the dataset uses legacy SHA-256 hashes; keep them (no upgrade) so this measures
+    # the lookup path, benchmarks/hashing.py covers the KDF cost
+    legacy = PasswordContext(LegacySHA256Hasher())
+    original = user_service.verify_password, user_service.needs_rehash
+    user_service.verify_password, user_service.needs_rehash = legacy.verify, legacy.needs_rehash
+    try:
+        ops["authenticate"] = timed(users.authenticate, [(d, BENCH_PASSWORD) for d in pick_docs])
+    finally:
+        user_service.verify_password, user_service.needs_rehash = original
+
+    # destructive, so each call removes a different patient (after the reads above)
+    victims = rng.sample(patient_ids, min(len(patient_ids), max(1, iterations // 10)))
+    owner = {p["id"]: p["doctor"] for p in repo.pat_store.load()["patients"]}
+    ops["delete_patient"] = timed(repo.delete_patient, [(owner[p], p) for p in victims])
+    result["operations"] = ops
+
+    # memory pass on a fresh set of stores
+    repo, inventory, schedules, users = open_stores(folder)
+    tracemalloc.start()
+    cold_load(repo, inventory, schedules, users)
+    repo.list_patients(doctors[0])
+    inventory.list_medicines(patient_ids[-1])
+    schedules.list_reminders(patient_ids[-1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["peak_memory_mb"] = round(peak / (1024 * 1024), 2)
+    result["record_memory"] = record_memory(folder)
+    return result
+
+
+def compare(results, previous_file):
+    previous = {r["size"]: r for r in json.loads(Path(previous_file).read_text())["results"]}
+    print("\nchange in p50 vs", previous_file)
+    for r in results:
+        old = previous.get(r["size"])
+        if not old:
+            continue
+        for op, stats in r["operations"].items():
+            before = old["operations"].get(op)
+            if before and before["p50_ms"]:
+                print(f"  {r['size']:>8} {op:<28} {stats['p50_ms'] / before['p50_ms']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MediTracker services on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            r = bench_size(size, args.iterations, args.seed, workdir)
+            results.append(r)
+            print(f"\n== {size} patients  (peak {r['peak_memory_mb']} MB, cold load {r['cold_load']})")
+            for op, stats in r["operations"].items():
+                print(f"  {op:<28} p50 {stats['p50_ms']:>9.4f}ms  p99 {stats['p99_ms']:>9.4f}ms  {stats['ops_per_sec']:>10} ops/s")
+            for kind, mem in r["record_memory"].items():
+                print(f"  {kind + ' in memory':<28} dicts {mem['dicts_mb']:>8} MB  records {mem['records_mb']:>8} MB")
+
+    report = {"generated_at": datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "results": results}
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"\nresults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
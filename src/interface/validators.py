@@ -1,6 +1,6 @@
 #This file is for error handling and validating if the user input is true.
 import re
-from datetime import datetime
+from datetime import date, datetime
 
 VALID_DAYS = ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"]
 #Function to validate if the input is only letters
@@ -19,6 +19,40 @@ def is_valid_time_hms(text: str) -> bool:
         return bool(re.fullmatch(r"\d{2}:\d{2}:\d{2}", text))
     except ValueError:
         return False
+# Dates are accepted as 2026-01-01, 2026/05/05 or 2026.05.05 (the shipped data mixes the first two)
+DATE_PATTERN = re.compile(r"\s*(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\s*")
+#Returns the date, or None when the text is not a real date (date/datetime values pass through)
+def parse_date(text):
+    if isinstance(text, datetime):
+        return text.date()
+    if isinstance(text, date):
+        return text
+    m = DATE_PATTERN.fullmatch(str(text or ""))
+    if not m:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+#Dates are stored as YYYY-MM-DD; text that is not a date is kept as typed
+def normalize_date(text):
+    d = parse_date(text)
+    return d.isoformat() if d else text
+#Day number of the date (date.toordinal), None when the text is not a date
+def date_ordinal(text):
+    d = parse_date(text)
+    return d.toordinal() if d else None
+#Medicine quantities are stored as text ("10", "2.5"); returns the number or None
+def parse_quantity(text):
+    try:
+        value = float(str(text).strip())
+    except ValueError:
+        return None
+    return value if 0 <= value < float("inf") else None
+#Writes a quantity back the way it is typed: 10 rather than 10.0
+def format_quantity(value):
+    value = round(value, 3)
+    return str(int(value)) if value == int(value) else str(value)
 # Function to verify if the days entered is in VALID_DAYS List
 def normalize_days(days_list):
     out = []
@@ -1,7 +1,6 @@
 #!/usr/bin/python3
 
 import os
-import threading
 from colorama import init, Fore, Back, Style
 
 #This is really to integrate or initialize colorama so that it can work properly on all systems 
@@ -11,19 +10,31 @@ init(autoreset=True)
 from interface.menu import print_header
 from interface.validators import (
     is_letters_only, is_alnum_username, is_valid_dosage,
-    is_valid_time_hms, normalize_days
+    is_valid_time_hms, normalize_days, parse_date
 )
 from services.user_service import save_user, authenticate, user_exists, list_doctors, get_user
 from services.patient_service import (
-    list_patients, add_patient, delete_patient, search_patients,
+    list_patients, page_patients, add_patient, delete_patient, search_patients,
     link_patient_user, get_patient_id_for_user, get_patient_by_id, add_patient_if_absent
 )
-from services.inventory_service import list_medicines, add_medicine, edit_medicine, delete_medicine, search_medicines
-from services.reminder_service import add_reminder, list_reminders, edit_reminder, patient_notification_daemon
+from services.inventory import (
+    list_medicines, page_medicines, add_medicine, edit_medicine, delete_medicine, search_medicines,
+    search_doctor_medicines, backfill_medicine_ids
+)
+from services.reminder_service import (
+    add_reminder, list_reminders, page_reminders, edit_reminder, backfill_reminder_ids,
+    subscribe_patient_notifications, unsubscribe_patient_notifications
+)
+from services.dose_service import confirm_dose
+from services.adherence import doctor_adherence
 
 
 ADMIN_USER = "admin"
 ADMIN_PASS = "admin123"
+# most patients / medicines shown by the doctor search screen
+SEARCH_LIMIT = 20
+# days covered by the adherence screen
+ADHERENCE_DAYS = 30
 
 class MediTrackerApp:
     def __init__(self):
@@ -112,22 +123,55 @@ class MediTrackerApp:
             print(f"\nWelcome back, {user['name']}!")
             return user
 
+    def browse(self, fetch_page, render, select_prompt=None, empty_message="Nothing to show."):
+#Shows records one page at a time (fetch_page(cursor) -> (records, next cursor)), numbered across pages.
+#With select_prompt the user picks one: returns (number - 1, record), otherwise (None, None)
+        history = []
+        cursor, offset = None, 0
+        while True:
+            items, next_cursor = fetch_page(cursor)
+            if not items and not history:
+                print(empty_message)
+                return None, None
+            for i, rec in enumerate(items, start=offset + 1):
+                render(i, rec)
+            nav = []
+            if next_cursor:
+                nav.append("n = next page")
+            if history:
+                nav.append("p = previous page")
+            if select_prompt is None:
+                if not nav:
+                    return None, None
+                choice = self.get_input(f"({', '.join(nav)}, Enter = done): ", 0).lower()
+            else:
+                hint = f" ({', '.join(nav)})" if nav else ""
+                choice = self.get_input(f"{select_prompt}{hint}: ", 1).lower()
+            if choice == "n" and next_cursor:
+                history.append((cursor, offset))
+                cursor, offset = next_cursor, offset + len(items)
+                continue
+            if choice == "p" and history:
+                cursor, offset = history.pop()
+                continue
+            if select_prompt is None:
+                return None, None
+            try:
+                idx = int(choice) - 1
+                if offset <= idx < offset + len(items):
+                    return idx, items[idx - offset]
+            except ValueError:
+                pass
+            print("Invalid selection.")
+            return None, None
+
     def pick_patient(self, doctor_username):
-        pats = list_patients(doctor_username)
-        if not pats:
-            print("No patients yet.")
-            return None, []
-#Will show numbered list
-        for i, p in enumerate(pats, start=1):
-            print(f"[{i}] {p['name']} (ID: {p['id']})  Linked Full Name: {p.get('user_username','-')}")
-        try:
-            idx = int(self.get_input("Select patient number: ", 1)) - 1
-            if 0 <= idx < len(pats):
-                return pats[idx], pats
-        except ValueError:
-            pass
-        print("Invalid selection.")
-        return None, pats
+#Will show numbered list, PAGE_SIZE patients at a time
+        _, p = self.browse(
+            lambda cursor: page_patients(doctor_username, cursor),
+            lambda i, p: print(f"[{i}] {p['name']} (ID: {p['id']})  Linked Full Name: {p.get('user_username','-')}"),
+            "Select patient number", "No patients yet.")
+        return p, [p] if p else []
 
     def doctor_menu(self, user):
         while True:
@@ -141,8 +185,9 @@ class MediTrackerApp:
             print(Fore.LIGHTBLUE_EX+"5." +Style.RESET_ALL + "Edit Reminder")
             print(Fore.LIGHTBLUE_EX+"6." +Style.RESET_ALL + " View Reminders for a Patient")
             print(Fore.LIGHTBLUE_EX+"7." +Style.RESET_ALL + "Search/Filter (Patients & Medicines)")
-            print(Fore.LIGHTBLUE_EX+"8." +Style.RESET_ALL + " Logout")
-            choice = self.get_input("Choose option (1-8): ", 1)
+            print(Fore.LIGHTBLUE_EX+"8." +Style.RESET_ALL + "Patient Adherence (doses taken)")
+            print(Fore.LIGHTBLUE_EX+"9." +Style.RESET_ALL + " Logout")
+            choice = self.get_input("Choose option (1-9): ", 1)
 #This enable the doctor to have choices and have options in order to select what he/she wants to do
             if choice == "1":
                 pname = self.get_input("Patient FULL NAME (letters only): ", 2)
@@ -183,14 +228,36 @@ class MediTrackerApp:
                 self.search_flow(user)
 
             elif choice == "8":
+                self.adherence_flow(user)
+
+            elif choice == "9":
                 print(Fore.LIGHTYELLOW_EX + "Logging out..." + Style.RESET_ALL)
                 break
             else:
                 print("Invalid choice.")
                 self.pause()
 
+    def adherence_flow(self, user):
+#Shows how many reminded doses each patient confirmed taking, least adherent first
+        print_header(f"Adherence - last {ADHERENCE_DAYS} days")
+        summary = doctor_adherence(user["username"], days=ADHERENCE_DAYS)
+        if not summary["due"]:
+            print("No reminders were due yet.")
+            self.pause(); return
+        rows = [(pid, s) for pid, s in summary["patients"].items() if s["due"]]
+        rows.sort(key=lambda item: item[1]["rate"])
+        for pid, s in rows[:SEARCH_LIMIT]:
+            p = get_patient_by_id(pid) or {}
+            print(f"{p.get('name', pid)}: {s['rate']:.0%} ({s['taken']}/{s['due']} doses) | "
+                  f"streak {s['current_streak']}, best {s['longest_streak']} | median delay {s['median_delay_minutes']} min")
+        if len(rows) > SEARCH_LIMIT:
+            print(f"... and {len(rows) - SEARCH_LIMIT} more patients")
+        late = ", ".join(f"{label}: {n}" for label, n in summary["late"].items())
+        print(Fore.LIGHTGREEN_EX + f"All patients: {summary['rate']:.0%} of {summary['due']} doses taken ({late})" + Style.RESET_ALL)
+        self.pause()
+
     def manage_patient_medicine(self, doctor_username, patient_id, patient_name):
-        from services.inventory_service import list_medicines, add_medicine, edit_medicine, delete_medicine, search_medicines
+        from services.inventory import list_medicines, page_medicines, add_medicine, edit_medicine, delete_medicine, search_medicines
         while True:
             self.clear_screen()
             print_header(f"Medicines for {patient_name}")
@@ -203,10 +270,9 @@ class MediTrackerApp:
             ch = self.get_input("Choose option (1-6): ", 1)
 
             if ch == "1":
-                meds = list_medicines(patient_id)
-                if not meds: print("No medicines."); self.pause(); continue
-                for i, m in enumerate(meds, start=1):
-                    print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']} | Exp: {m['expiry_date']}")
+                self.browse(lambda cursor: page_medicines(patient_id, cursor),
+                            lambda i, m: print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']} | Exp: {m['expiry_date']}"),
+                            empty_message="No medicines.")
                 self.pause()
 
             elif ch == "2":
@@ -220,21 +286,17 @@ class MediTrackerApp:
                 if not qty.replace('.','',1).isdigit():
                     print("Invalid quantity; enter a number"); self.pause(); continue
                 exp = self.get_input("Expiry date (YYYY-MM-DD): ", 10)
+                if parse_date(exp) is None:
+                    print("Invalid date; enter it as YYYY-MM-DD"); self.pause(); continue
                 add_medicine(patient_id, mname, dosage, qty, exp, added_by=doctor_username)
                 print("Medicine added.")
                 self.pause()
 
             elif ch == "3":
-                meds = list_medicines(patient_id)
-                if not meds: print("No medicines."); self.pause(); continue
-                for i, m in enumerate(meds, start=1):
-                    print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']} | Exp: {m['expiry_date']}")
-                try:
-                    idx = int(self.get_input("Select number to edit: ", 1)) - 1
-                except ValueError:
-                    print("Invalid number"); self.pause(); continue
-                if not (0 <= idx < len(meds)):
-                    print("Invalid selection"); self.pause(); continue
+                _, med = self.browse(lambda cursor: page_medicines(patient_id, cursor),
+                                     lambda i, m: print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']} | Exp: {m['expiry_date']}"),
+                                     "Select number to edit", "No medicines.")
+                if not med: self.pause(); continue
 
                 mname = self.get_input("New name (letters only): ", 2)
                 if not is_letters_only(mname):
@@ -246,26 +308,24 @@ class MediTrackerApp:
                 if not qty.replace('.','',1).isdigit():
                     print("Invalid quantity; enter a number"); self.pause(); continue
                 exp = self.get_input("New expiry date (YYYY-MM-DD): ", 10)
-                ok = edit_medicine(patient_id, idx, mname, dosage, qty, exp)
+                if parse_date(exp) is None:
+                    print("Invalid date; enter it as YYYY-MM-DD"); self.pause(); continue
+                ok = edit_medicine(patient_id, med["id"], mname, dosage, qty, exp)
                 print("Updated." if ok else "Failed to update.")
                 self.pause()
 
             elif ch == "4":
-                meds = list_medicines(patient_id)
-                if not meds: print("No medicines."); self.pause(); continue
-                for i, m in enumerate(meds, start=1):
-                    print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']}")
-                try:
-                    idx = int(self.get_input("Select number to delete: ", 1)) - 1
-                except ValueError:
-                    print("Invalid number"); self.pause(); continue
-                ok = delete_medicine(patient_id, idx)
+                _, med = self.browse(lambda cursor: page_medicines(patient_id, cursor),
+                                     lambda i, m: print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']}"),
+                                     "Select number to delete", "No medicines.")
+                if not med: self.pause(); continue
+                ok = delete_medicine(patient_id, med["id"])
                 print("Deleted." if ok else "Failed to delete.")
                 self.pause()
 
             elif ch == "5":
                 term = self.get_input("Search term: ", 1)
-                results = search_medicines(patient_id, term)
+                results = search_medicines(patient_id, term, fuzzy=True, limit=SEARCH_LIMIT)
                 if not results:
                     print("No medicines match your search.")
                 else:
@@ -282,18 +342,10 @@ class MediTrackerApp:
         print_header("Add Reminder")
         p, _ = self.pick_patient(user["username"])
         if not p: self.pause(); return
-        meds = list_medicines(p["id"])
-        if not meds:
-            print("No medicines for this patient yet. Add medicine first.")
-            self.pause(); return
-        for i, m in enumerate(meds, start=1):
-            print(f"[{i}] {m['name']} ({m['dosage']})")
-        try:
-            midx = int(self.get_input("Select medicine number: ", 1)) - 1
-            if not (0 <= midx < len(meds)):
-                print("Invalid selection."); self.pause(); return
-        except ValueError:
-            print("Invalid selection."); self.pause(); return
+        _, med = self.browse(lambda cursor: page_medicines(p["id"], cursor),
+                             lambda i, m: print(f"[{i}] {m['name']} ({m['dosage']})"),
+                             "Select medicine number", "No medicines for this patient yet. Add medicine first.")
+        if not med: self.pause(); return
         time_hms = self.get_input("Time (HH:MM:SS): ", 8)
         if not is_valid_time_hms(time_hms):
             print(" Invalid input, enter hours, minutes, and seconds")
@@ -305,10 +357,10 @@ class MediTrackerApp:
                 print("Invalid input, please enter days from Mon to Sun"); self.pause(); return
         else:
             days = ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"]
-        d = meds[midx]["dosage"]
+        d = med["dosage"]
         if not is_valid_dosage(d):
             print('Input dosage in mg,g,or liters and write it as a number'); self.pause(); return
-        add_reminder(p["id"], meds[midx]["name"], d, time_hms, days, created_by=user["username"])
+        add_reminder(p["id"], med["name"], d, time_hms, days, created_by=user["username"])
         print(Fore.LIGHTGREEN_EX + "Reminder added successfully." + Style.RESET_ALL)
         self.pause()
 
@@ -316,17 +368,10 @@ class MediTrackerApp:
         print_header("Edit Reminder")
         p, _ = self.pick_patient(user["username"])
         if not p: self.pause(); return
-        rems = list_reminders(p["id"])
-        if not rems:
-            print("No reminders for this patient."); self.pause(); return
-        for i, r in enumerate(rems, start=1):
-            print(f"[{i}] {r['medicine_name']} {r['dosage']} at {r['time']} on {','.join(r['days'])}")
-        try:
-            ridx = int(self.get_input("Select reminder number to edit: ", 1)) - 1
-        except ValueError:
-            print("Invalid number"); self.pause(); return
-        if not (0 <= ridx < len(rems)):
-            print("Invalid selection"); self.pause(); return
+        _, rem = self.browse(lambda cursor: page_reminders(p["id"], cursor),
+                             lambda i, r: print(f"[{i}] {r['medicine_name']} {r['dosage']} at {r['time']} on {','.join(r['days'])}"),
+                             "Select reminder number to edit", "No reminders for this patient.")
+        if not rem: self.pause(); return
         med_name = self.get_input("New medicine name (letters only): ", 2)
         if not is_letters_only(med_name):
             print("Invalid input, please enter medicine name in letters"); self.pause(); return
@@ -343,7 +388,7 @@ class MediTrackerApp:
                 print("Invalid input, please enter days from Mon to Sun"); self.pause(); return
         else:
             days = ["Mon","Tue","Wed","Thu","Fri","Sat","Sun"]
-        ok = edit_reminder(p["id"], ridx, med_name, dosage, time_hms, days)
+        ok = edit_reminder(p["id"], rem["id"], med_name, dosage, time_hms, days)
         print("Reminder updated." if ok else "Failed to update reminder.")
         self.pause()
 
@@ -351,25 +396,23 @@ class MediTrackerApp:
         print_header("View Reminders")
         p, _ = self.pick_patient(user["username"])
         if not p: self.pause(); return
-        rems = list_reminders(p["id"])
-        if not rems:
-            print("No reminders for this patient."); self.pause(); return
-        for i, r in enumerate(rems, start=1):
-            print(f"[{i}] {r['medicine_name']} {r['dosage']} at {r['time']} on {','.join(r['days'])}")
+        self.browse(lambda cursor: page_reminders(p["id"], cursor),
+                    lambda i, r: print(f"[{i}] {r['medicine_name']} {r['dosage']} at {r['time']} on {','.join(r['days'])}"), empty_message="No reminders for this patient.")
         self.pause()
 
     def search_flow(self, user):
         print_header("Search / Filter")
         term = self.get_input("Enter search term: ", 1)
 
-        pats = search_patients(user["username"], term)
-        from services.inventory_service import list_medicines
-        all_pats = list_patients(user["username"])
+        # typo-tolerant, best matches first
+        pats = search_patients(user["username"], term, fuzzy=True, limit=SEARCH_LIMIT)
+        # one lookup in the per-doctor medicine name index instead of scanning every patient;
+        # only the (at most SEARCH_LIMIT) owners of the matches are fetched
         matched_meds = []
-        for p in all_pats:
-            for m in list_medicines(p["id"]):
-                if term.lower() in m.get("name","").lower():
-                    matched_meds.append((p, m))
+        for m in search_doctor_medicines(user["username"], term, fuzzy=True, limit=SEARCH_LIMIT):
+            owner = get_patient_by_id(m["patient_id"])
+            if owner and owner.get("doctor") == user["username"]:
+                matched_meds.append((owner, m))
 
         if not pats and not matched_meds:
             print("No patients or medicines matched your search.")
@@ -385,39 +428,53 @@ class MediTrackerApp:
         self.pause()
   # ===== Patient =====
     def start_patient_notifications_background(self, patient_id):
-        t = threading.Thread(target=patient_notification_daemon, args=(patient_id, 10), daemon=True)
-        t.start()
-        return t
+#One shared notification thread serves every logged-in patient; this just subscribes the session
+        return subscribe_patient_notifications(patient_id)
+
+    def stop_patient_notifications(self, patient_id, token):
+        unsubscribe_patient_notifications(patient_id, token)
 
     def patient_menu(self, user):
-        self.start_patient_notifications_background(user["patient_id"])
+        token = self.start_patient_notifications_background(user["patient_id"])
+        try:
+            self._patient_menu_loop(user)
+        finally:
+            self.stop_patient_notifications(user["patient_id"], token)
+
+    def _patient_menu_loop(self, user):
         while True:
             self.clear_screen()
             print_header(f"Welcome {user['name']}")
             print("(Keep this window open to receive pop-up reminders.)")
             print(Fore.LIGHTCYAN_EX +"1."+  Style.RESET_ALL + "View My Medicines")
             print(Fore.LIGHTCYAN_EX + "2."+  Style.RESET_ALL + "View/Check My Reminders")
-            print(Fore.LIGHTCYAN_EX + "3." + Style.RESET_ALL +   "Logout")
-            ch = self.get_input("Choose option (1-3): ", 1)
+            print(Fore.LIGHTCYAN_EX + "3." + Style.RESET_ALL + "Confirm a Dose Taken")
+            print(Fore.LIGHTCYAN_EX + "4." + Style.RESET_ALL +   "Logout")
+            ch = self.get_input("Choose option (1-4): ", 1)
             if ch == "1":
                 pid = user.get("patient_id")
-                meds = list_medicines(pid)
-                if not meds:
-                    print("No medicines assigned yet.")
-                else:
-                    for i, m in enumerate(meds, start=1):
-                        print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']} | Exp: {m['expiry_date']}")
+                self.browse(lambda cursor: page_medicines(pid, cursor),
+                            lambda i, m: print(f"[{i}] {m['name']} | {m['dosage']} | Qty: {m['quantity']} | Exp: {m['expiry_date']}"),
+                            empty_message="No medicines assigned yet.")
                 self.pause()
             elif ch == "2":
                 pid = user.get("patient_id")
-                rems = list_reminders(pid)
-                if not rems:
-                    print("No reminders set for you yet.")
-                else:
-                    for i, r in enumerate(rems, start=1):
-                        print(f"[{i}] {r['medicine_name']} {r['dosage']} at {r['time']} on {','.join(r['days'])}")
+                self.browse(lambda cursor: page_reminders(pid, cursor),
+                            lambda i, r: print(f"[{i}] {r['medicine_name']} {r['dosage']} at {r['time']} on {','.join(r['days'])}"), empty_message="No reminders set for you yet.")
                 self.pause()
             elif ch == "3":
+                pid = user.get("patient_id")
+                _, rem = self.browse(lambda cursor: page_reminders(pid, cursor),
+                                     lambda i, r: print(f"[{i}] {r['medicine_name']} {r['dosage']} at {r['time']} on {','.join(r['days'])}"),
+                                     select_prompt="Reminder # you took", empty_message="No reminders set for you yet.")
+                if rem:
+                    med = confirm_dose(pid, rem["id"])
+                    if med:
+                        print(Fore.LIGHTGREEN_EX + f"Dose recorded. {med['name']}: {med['quantity']} left." + Style.RESET_ALL)
+                    else:
+                        print(Fore.LIGHTGREEN_EX + "Dose recorded." + Style.RESET_ALL)
+                self.pause()
+            elif ch == "4":
                 print(Fore.LIGHTYELLOW_EX + "Logging out..." + Style.RESET_ALL); break
             else:
                 print(Fore.LIGHTRED_EX + "Invalid choice." + Style.RESET_ALL); self.pause()
@@ -510,5 +567,8 @@ class MediTrackerApp:
                 print(Fore.LIGHTRED_EX + "Invalid choice."); self.pause()
 
 if __name__ == "__main__":
+    # records saved before they had ids get one here, so listing them never writes
+    backfill_medicine_ids()
+    backfill_reminder_ids()
     app = MediTrackerApp()
     app.main()
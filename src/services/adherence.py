@@ -0,0 +1,367 @@
+import bisect
+import functools
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # optional: every statistic also has a plain-Python path
+    np = None
+
+from services import dose_service, patient_service, reminder_service
+from services.records import Schedule
+
+# Adherence: were the reminders actually acted on?
+#
+# Every reminder fires at its time on each of its days; a fire time counts as
+# taken when the dose log has a dose for that reminder from EARLY_SECONDS before
+# it to LATE_SECONDS after it (the delay is measured from the fire time). Fire
+# times less than LATE_SECONDS old that have no dose yet are still pending and
+# are left out. Per patient this gives the adherence rate, a histogram of how
+# late doses were, the median delay and streaks of consecutive taken doses;
+# per doctor the same figures summed over their patients.
+#
+# The fire times of many patients are built and matched against the doses as
+# columns (NumPy arrays) in one batch when NumPy is installed. Results are
+# cached per patient; new lines in the dose log only drop the results of the
+# patients they belong to, and a changed reminder only its patient's.
+#
+# From the src folder:
+#     python -m services.adherence report --doctor drsmith --days 30
+
+# wall-clock seconds are counted from here (no time zone arithmetic involved)
+EPOCH = datetime(1970, 1, 1)
+DAY = 86400
+# a dose taken up to 30 minutes before the reminder still counts for it...
+EARLY_SECONDS = 30 * 60
+# ...and so does one up to 6 hours after; later than that the reminder was missed
+LATE_SECONDS = 6 * 3600
+# late-dose histogram: upper bound (seconds) and label of each bucket, the last one is open
+LATE_BUCKETS = ((15 * 60, "<=15m"), (3600, "15m-1h"), (3 * 3600, "1h-3h"))
+LATE_LABELS = tuple(label for _, label in LATE_BUCKETS) + (">3h",)
+DEFAULT_DAYS = 30
+# above this many patients the reminders are read in one pass over the store
+BULK_PATIENTS = 500
+
+
+def _seconds(dt):
+    return int((dt - EPOCH).total_seconds())
+
+
+# dose times are written as "YYYY-MM-DD HH:MM:SS": the date part is parsed once per day
+@functools.lru_cache(maxsize=4096)
+def _day_start(text):
+    try:
+        return _seconds(datetime.fromisoformat(text))
+    except ValueError:
+        return None
+
+
+def _parse_seconds(text):
+    text = str(text).strip()
+    if len(text) == 19 and text[10] == " " and text[13] == ":" and text[16] == ":" and text[11:19].replace(":", "").isdigit():
+        day = _day_start(text[:10])
+        h, m, s = int(text[11:13]), int(text[14:16]), int(text[17:19])
+        if day is not None and h < 24 and m < 60 and s < 60:
+            return day + h * 3600 + m * 60 + s
+        return None
+    try:
+        return _seconds(datetime.fromisoformat(text))
+    except ValueError:
+        return None
+
+
+def _rates(due, taken, late, median):
+    return {
+        "due": due, "taken": taken, "missed": due - taken,
+        "rate": round(taken / due, 4) if due else None,
+        "late": dict(zip(LATE_LABELS, late)),
+        "median_delay_minutes": None if median is None else round(median / 60, 1),
+    }
+
+
+def _late_bucket(delay):
+    for i, (bound, _) in enumerate(LATE_BUCKETS):
+        if delay <= bound:
+            return i
+    return len(LATE_BUCKETS)
+
+
+def _median(sorted_values):
+    n = len(sorted_values)
+    if not n:
+        return None
+    return (sorted_values[(n - 1) // 2] + sorted_values[n // 2]) / 2
+
+
+# Reminders reduced to what matching needs: (patient_id, id, seconds of day,
+# weekday mask, created_at in seconds or None, the records.Schedule); reminders
+# with a malformed time or no valid day never fire and are dropped.
+def _fire_rules(reminders):
+    rules = []
+    for r in reminders:
+        s = Schedule.of(r)
+        if s.time is None or not s.days:
+            continue
+        created = _parse_seconds(s.created_at) if s.created_at else None
+        rules.append((s.patient_id, s.id, s.time, s.days, created, s))
+    return rules
+
+
+# per-patient (stats, sorted delays) for the fire times in (lo, hi]
+def _batch_python(rules, doses, lo, hi):
+    per_patient = {}
+    for pid, sid, _, _, created, reminder in rules:
+        start = max(lo, created or lo)
+        fires = []
+        fire = reminder.next_fire(EPOCH + timedelta(seconds=start))
+        while fire is not None and _seconds(fire) <= hi:
+            fires.append(_seconds(fire))
+            fire = reminder.next_fire(fire)
+        best = [None] * len(fires)
+        for t in doses.get(sid, ()):
+            j = bisect.bisect_right(fires, t + EARLY_SECONDS) - 1
+            if j >= 0 and t - fires[j] <= LATE_SECONDS:
+                delay = max(t - fires[j], 0)
+                if best[j] is None or delay < best[j]:
+                    best[j] = delay
+        occurrences = per_patient.setdefault(pid, [])
+        for fire_at, delay in zip(fires, best):
+            if delay is not None or fire_at <= hi - LATE_SECONDS:
+                occurrences.append((fire_at, delay))
+    result = {}
+    for pid, occurrences in per_patient.items():
+        occurrences.sort(key=lambda o: o[0])
+        late = [0] * len(LATE_LABELS)
+        delays = []
+        run = longest = 0
+        for _, delay in occurrences:
+            if delay is None:
+                run = 0
+                continue
+            late[_late_bucket(delay)] += 1
+            delays.append(delay)
+            run += 1
+            longest = max(longest, run)
+        delays.sort()
+        stats = _rates(len(occurrences), len(delays), late, _median(delays))
+        stats.update(current_streak=run, longest_streak=longest)
+        result[pid] = (stats, delays)
+    return result
+
+
+def _batch_numpy(rules, doses, lo, hi):
+    patients = sorted({rule[0] for rule in rules})
+    index = {pid: i for i, pid in enumerate(patients)}
+    n_patients = len(patients)
+    rule_patient = np.array([index[rule[0]] for rule in rules], dtype=np.int64)
+    second_of_day = np.array([rule[2] for rule in rules], dtype=np.int64)
+    mask = (np.array([rule[3] for rule in rules], dtype=np.int64)[:, None] >> np.arange(7)) & 1 == 1
+    start = np.array([max(lo, rule[4] or lo) for rule in rules], dtype=np.int64)
+
+    # one row per reminder, one column per day of the window; 1970-01-01 was a Thursday
+    days = np.arange(lo // DAY, hi // DAY + 1, dtype=np.int64)
+    fire = days[None, :] * DAY + second_of_day[:, None]
+    valid = mask[:, (days + 3) % 7] & (fire > start[:, None]) & (fire <= hi)
+    occ_rule = np.nonzero(valid)[0]
+    occ_time = fire[valid]
+
+    # (reminder, time) keys sort like the row-major fire times, so every dose
+    # finds its fire time with one searchsorted over all patients at once
+    best = np.full(len(occ_time), np.inf)
+    dose_rule, dose_time = [], []
+    for i, rule in enumerate(rules):
+        times = doses.get(rule[1])
+        if times:
+            dose_rule.extend([i] * len(times))
+            dose_time.extend(times)
+    if len(occ_time) and dose_time:
+        dose_rule = np.array(dose_rule, dtype=np.int64)
+        dose_time = np.array(dose_time, dtype=np.int64)
+        keep = (dose_time > lo - EARLY_SECONDS) & (dose_time <= hi + LATE_SECONDS)
+        dose_rule, dose_time = dose_rule[keep], dose_time[keep]
+        base = lo - LATE_SECONDS - EARLY_SECONDS
+        span = hi - base + LATE_SECONDS + EARLY_SECONDS + 1
+        found = np.searchsorted(occ_rule * span + (occ_time - base),
+                                dose_rule * span + (dose_time + EARLY_SECONDS - base), side="right") - 1
+        at = np.maximum(found, 0)
+        gap = dose_time - occ_time[at]
+        ok = (found >= 0) & (occ_rule[at] == dose_rule) & (gap <= LATE_SECONDS)
+        np.minimum.at(best, at[ok], np.maximum(gap[ok], 0))
+    taken = np.isfinite(best)
+    counted = taken | (occ_time <= hi - LATE_SECONDS)
+    occ_patient = rule_patient[occ_rule][counted]
+    occ_time, taken, best = occ_time[counted], taken[counted], best[counted]
+
+    due = np.bincount(occ_patient, minlength=n_patients)
+    n_taken = np.bincount(occ_patient[taken], minlength=n_patients)
+    bounds = np.array([bound for bound, _ in LATE_BUCKETS], dtype=float)
+    bucket = np.searchsorted(bounds, best[taken], side="left")
+    late = np.bincount(occ_patient[taken] * len(LATE_LABELS) + bucket,
+                       minlength=n_patients * len(LATE_LABELS)).reshape(n_patients, len(LATE_LABELS))
+
+    # delays sorted within each patient, then medians by position
+    taken_patient = occ_patient[taken]
+    order = np.lexsort((best[taken], taken_patient))
+    delays = best[taken][order].astype(np.int64)
+    ends = np.cumsum(n_taken)
+    starts = ends - n_taken
+    lower = np.minimum(starts + (n_taken - 1) // 2, max(len(delays) - 1, 0))
+    upper = np.minimum(starts + n_taken // 2, max(len(delays) - 1, 0))
+    medians = (delays[lower] + delays[upper]) / 2 if len(delays) else np.zeros(n_patients)
+
+    # streaks: in time order per patient, the run length at each fire time restarts
+    # at the patient's first one and drops to 0 at every missed one
+    order = np.lexsort((occ_time, occ_patient))
+    p, k = occ_patient[order], taken[order]
+    i = np.arange(len(p))
+    first = np.ones(len(p), dtype=bool)
+    first[1:] = p[1:] != p[:-1]
+    restart = np.where(first | ~k, np.where(k, i - 1, i), -1)
+    run = i - np.maximum.accumulate(restart)
+    longest = np.zeros(n_patients, dtype=np.int64)
+    np.maximum.at(longest, p, run)
+    current = np.zeros(n_patients, dtype=np.int64)
+    last = np.ones(len(p), dtype=bool)
+    last[:-1] = p[1:] != p[:-1]
+    current[p[last]] = run[last]
+
+    result = {}
+    for j, pid in enumerate(patients):
+        stats = _rates(int(due[j]), int(n_taken[j]), late[j].tolist(),
+                       float(medians[j]) if n_taken[j] else None)
+        stats.update(current_streak=int(current[j]), longest_streak=int(longest[j]))
+        result[pid] = (stats, delays[starts[j]:ends[j]])
+    return result
+
+
+def _batch(rules, doses, lo, hi):
+    if np is not None and rules:
+        return _batch_numpy(rules, doses, lo, hi)
+    return _batch_python(rules, doses, lo, hi)
+
+
+class AdherenceAnalytics:
+    # Adherence figures over a dose log and a ScheduleManager (JSON or SQLite),
+    # cached per patient and refreshed incrementally from the log.
+
+    def __init__(self, dose_log, scheduler):
+        self.dose_log = dose_log
+        self.scheduler = scheduler
+        self._offset = 0
+        self._doses = {}  # reminder id -> dose times (seconds), in log order
+        self._cache = {}  # patient id -> (window, stats, sorted delays)
+        self._schedules_version = None
+        self._lock = threading.RLock()
+        scheduler.add_listener(self._reminders_changed)
+
+    # a reminder added/edited through this process: only its patient is stale
+    def _reminders_changed(self, patient_id, version_before, version_after):
+        with self._lock:
+            self._cache.pop(patient_id, None)
+            if self._schedules_version == version_before:
+                self._schedules_version = version_after
+
+    # Reads the doses logged since the last call and drops the cached results of
+    # their patients; reminders changed by another process drop everything.
+    def refresh(self):
+        with self._lock:
+            version = self.scheduler.poll_version()
+            if version != self._schedules_version:
+                self._cache.clear()
+                self._schedules_version = version
+            doses, self._offset = self.dose_log.read_from(self._offset)
+            for dose in doses:
+                t = _parse_seconds(dose.taken_at)
+                if t is None or not dose.schedule_id:
+                    continue
+                self._doses.setdefault(dose.schedule_id, []).append(t)
+                self._cache.pop(dose.patient_id, None)
+
+    # (stats, sorted delays) per patient for the window, computing the missing ones in one batch
+    def _entries(self, patient_ids, window):
+        self.refresh()
+        with self._lock:
+            missing = [pid for pid in patient_ids if self._cache.get(pid, (None,))[0] != window]
+            if missing:
+                if len(missing) > BULK_PATIENTS:
+                    wanted = set(missing)
+                    reminders = [r for r in self.scheduler._load().get("schedules", []) if r.get("patient_id") in wanted]
+                else:
+                    reminders = [r for pid in missing for r in self.scheduler.list_reminders(pid)]
+                computed = _batch(_fire_rules(reminders), self._doses, *window)
+                empty = (_rates(0, 0, [0] * len(LATE_LABELS), None), [])
+                empty[0].update(current_streak=0, longest_streak=0)
+                for pid in missing:
+                    stats, delays = computed.get(pid, empty)
+                    self._cache[pid] = (window, stats, delays)
+            return {pid: self._cache[pid][1:] for pid in patient_ids}
+
+    # fire times in the last `days` days up to now (to the minute, so repeated
+    # views within a minute share the cached results)
+    @staticmethod
+    def _window(days, now):
+        hi = _seconds((now or datetime.now()).replace(second=0, microsecond=0))
+        return hi - days * DAY, hi
+
+    def patient_adherence(self, patient_id, days=DEFAULT_DAYS, now=None):
+        stats, _ = self._entries([patient_id], self._window(days, now))[patient_id]
+        return dict(stats, late=dict(stats["late"]))
+
+    # a doctor's totals plus "patients": patient id -> the patient's own figures
+    def doctor_adherence(self, doctor, days=DEFAULT_DAYS, now=None):
+        patient_ids = [p.get("id") for p in patient_service.list_patients(doctor)]
+        entries = self._entries(patient_ids, self._window(days, now))
+        due = sum(stats["due"] for stats, _ in entries.values())
+        taken = sum(stats["taken"] for stats, _ in entries.values())
+        late = [sum(stats["late"][label] for stats, _ in entries.values()) for label in LATE_LABELS]
+        groups = [delays for _, delays in entries.values() if len(delays)]
+        if np is not None and groups:
+            median = float(np.median(np.concatenate(groups)))
+        else:
+            median = _median(list(heapq.merge(*groups)))
+        summary = _rates(due, taken, late, median)
+        summary["patients"] = {pid: dict(stats, late=dict(stats["late"])) for pid, (stats, _) in entries.items()}
+        return summary
+
+
+_analytics = AdherenceAnalytics(dose_service._log, reminder_service._scheduler)
+
+
+def refresh():
+    return _analytics.refresh()
+
+
+def patient_adherence(patient_id, days=DEFAULT_DAYS, now=None):
+    return _analytics.patient_adherence(patient_id, days=days, now=now)
+
+
+def doctor_adherence(doctor, days=DEFAULT_DAYS, now=None):
+    return _analytics.doctor_adherence(doctor, days=days, now=now)
+
+
+def _percent(rate):
+    return "-" if rate is None else f"{rate:.0%}"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Adherence to reminders over the dose log")
+    parser.add_argument("action", choices=["report"])
+    parser.add_argument("--doctor", required=True)
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    args = parser.parse_args()
+
+    summary = doctor_adherence(args.doctor, days=args.days)
+    rows = sorted(summary["patients"].items(), key=lambda item: (item[1]["rate"] is None, item[1]["rate"] or 0))
+    for pid, s in rows:
+        print(f"{pid:28} {_percent(s['rate']):>5}  {s['taken']}/{s['due']} taken  "
+              f"streak {s['current_streak']} (best {s['longest_streak']})  median delay {s['median_delay_minutes']} min")
+    print(f"Dr. {args.doctor}: {_percent(summary['rate'])} of {summary['due']} doses taken over {args.days} days; "
+          + ", ".join(f"{label} {n}" for label, n in summary["late"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from datetime import datetime
+from pathlib import Path
+
+from services.reminder_scheduler import ReminderScheduler, format_reminder
+
+# asyncio variant of the reminder pipeline. One coroutine drives the shared
+# ReminderScheduler heap (no per-patient threads) and fans due reminders out to
+# pluggable async sinks. Every sink gets its own bounded queue and worker task:
+# with overflow="block" a slow sink holds the dispatcher back (backpressure)
+# instead of letting the queue grow without limit, with overflow="drop_oldest"
+# the sink loses its oldest pending notifications and the others keep going.
+
+
+class TerminalSink:
+    # The same pop-up the patient terminal shows (ScheduleManager.notify_popup)
+    name = "terminal"
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    async def send(self, reminder, fire_at, late):
+        self.manager.notify_popup("Medicine Reminder", format_reminder(reminder, fire_at, late))
+
+
+class FileSink:
+    # Appends one JSON line per notification; the write runs in a worker thread
+    name = "file"
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+
+    def _write(self, line):
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    async def send(self, reminder, fire_at, late):
+        line = json.dumps({"patient_id": reminder.get("patient_id"),
+                           "medicine_name": reminder.get("medicine_name"),
+                           "dosage": reminder.get("dosage"),
+                           "fire_at": fire_at.strftime("%Y-%m-%d %H:%M:%S"),
+                           "late": late})
+        await asyncio.to_thread(self._write, line)
+
+
+class LocalWebhookSink:
+    # Stand-in for an HTTP webhook: waits `latency` seconds per call and keeps the
+    # payloads it "received" in self.delivered
+    name = "webhook"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.delivered = []
+
+    async def send(self, reminder, fire_at, late):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.delivered.append({"patient_id": reminder.get("patient_id"),
+                               "message": format_reminder(reminder, fire_at, late),
+                               "fire_at": fire_at.isoformat(),
+                               "late": late})
+
+
+class AsyncReminderEngine:
+    def __init__(self, manager, sinks, patient_ids=None, max_pending=100,
+                 overflow="block", recheck_seconds=60):
+        if overflow not in ("block", "drop_oldest"):
+            raise ValueError("overflow must be 'block' or 'drop_oldest'")
+        self.manager = manager
+        self.sinks = list(sinks)
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.recheck_seconds = recheck_seconds
+        self.scheduler = ReminderScheduler(manager, patient_ids=patient_ids, recheck_seconds=recheck_seconds)
+        self.dropped = {sink.name: 0 for sink in self.sinks}
+        self.failed = {sink.name: 0 for sink in self.sinks}
+        self._queues = []
+        self._loop = None
+        self._wakeup = None
+        self._stopped = False
+
+    # ScheduleManager listener (may run in another thread): wake the dispatcher up
+    def _on_change(self, patient_id, version_before, version_after):
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+    async def _drain(self, sink, queue):
+        while True:
+            reminder, fire_at, late = await queue.get()
+            try:
+                await sink.send(reminder, fire_at, late)
+            except Exception:
+                self.failed[sink.name] += 1
+            finally:
+                queue.task_done()
+
+    async def _fan_out(self, reminder, fire_at, late):
+        for sink, queue in zip(self.sinks, self._queues):
+            if self.overflow == "drop_oldest" and queue.full():
+                queue.get_nowait()
+                queue.task_done()
+                self.dropped[sink.name] += 1
+            await queue.put((reminder, fire_at, late))
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._queues = [asyncio.Queue(maxsize=self.max_pending) for _ in self.sinks]
+        workers = [asyncio.create_task(self._drain(sink, queue)) for sink, queue in zip(self.sinks, self._queues)]
+        self.manager.add_listener(self._on_change)
+        try:
+            await asyncio.to_thread(self.scheduler.rebuild)
+            last_check = datetime.now()
+            while not self._stopped:
+                for fire_at, reminder, late in self.scheduler.pop_due():
+                    await self._fan_out(reminder, fire_at, late)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.scheduler.sleep_seconds())
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                last_check = await asyncio.to_thread(self.scheduler.housekeeping, last_check)
+            # let the sinks finish what was already dispatched
+            for queue in self._queues:
+                await queue.join()
+        finally:
+            self.manager.remove_listener(self._on_change)
+            self.scheduler.stop()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    # safe to call from any thread
+    def stop(self):
+        self._stopped = True
+        self._on_change(None, None, None)
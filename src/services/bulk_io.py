@@ -0,0 +1,275 @@
+import csv
+import json
+from datetime import datetime
+from pathlib import Path
+
+from interface.validators import (
+    VALID_DAYS, is_alnum_username, is_letters_only, is_valid_dosage,
+    is_valid_time_hms, normalize_date, normalize_days, parse_date
+)
+from services import patient_service
+from services.ids import new_medicine_id, new_patient_id, new_schedule_id
+
+# Bulk import/export of patients, medicines and schedules (clinic onboarding).
+# Input files are read row by row (CSV with a header line, or JSON-lines), every
+# row is checked with the same validators the menus use, and all accepted rows of
+# one file are written to their store in a single commit. Rejected rows are
+# collected in an ImportReport with their line number and the reason.
+# Exports stream records to the output file one row at a time.
+#
+# From the src folder:
+#     python -m services.bulk_io import patients clinic_patients.csv --actor drsmith
+#     python -m services.bulk_io import medicines meds.jsonl --actor drsmith --rejects rejected.csv
+#     python -m services.bulk_io export schedules schedules.csv
+
+# columns per record type, in export order
+COLUMNS = {
+    "patients": ("id", "name", "doctor", "user_username", "created_at"),
+    "medicines": ("id", "patient_id", "name", "dosage", "quantity", "expiry_date", "added_by", "added_at"),
+    "schedules": ("id", "patient_id", "medicine_name", "dosage", "time", "days", "created_by", "created_at"),
+}
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.accepted = 0
+        self.rejected = []  # (line number, reason, raw row)
+
+    def reject(self, line_no, reason, row):
+        self.rejected.append((line_no, reason, row))
+
+    def summary(self):
+        return f"{self.kind}: {self.accepted} imported, {len(self.rejected)} rejected"
+
+    # rejected rows as CSV (line, reason, original row as JSON) so they can be fixed and re-imported
+    def write_rejects(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["line", "reason", "row"])
+            for line_no, reason, row in self.rejected:
+                writer.writerow([line_no, reason, json.dumps(row)])
+
+
+def detect_format(path, fmt=None):
+    fmt = fmt or FORMATS.get(Path(path).suffix.lower())
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"can't tell the format of '{path}', use .csv or .jsonl (or pass fmt)")
+    return fmt
+
+
+# yield (line number, row dict or None, error) without reading the whole file
+def iter_rows(path, fmt=None):
+    fmt = detect_format(path, fmt)
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+            return
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, {"raw": line.rstrip("\n")}, "not valid JSON"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, {"raw": row}, "expected a JSON object"
+                continue
+            yield line_no, row, None
+
+
+def _text(row, field, default=""):
+    value = row.get(field)
+    if value is None:
+        return default
+    return str(value).strip() or default
+
+
+def _required(row, field, check, message):
+    value = _text(row, field)
+    if not value:
+        raise RowError(f"missing {field}")
+    if not check(value):
+        raise RowError(message)
+    return value
+
+
+def _days(row):
+    raw = row.get("days")
+    if isinstance(raw, list):
+        parts = [str(d) for d in raw]
+    else:
+        parts = [d for d in str(raw or "").replace(";", ",").split(",") if d.strip()]
+    if not parts:
+        return list(VALID_DAYS)  # blank means daily, like the reminder menu
+    days = normalize_days(parts)
+    if not days:
+        raise RowError("days must be from Mon to Sun")
+    return days
+
+
+def _is_quantity(text):
+    return text.replace(".", "", 1).isdigit()
+
+
+def _is_date(text):
+    return parse_date(text) is not None
+
+
+class _Importer:
+    # Validates rows of one record type; builds the stored record or raises RowError
+
+    def __init__(self, kind, repo, actor):
+        self.kind = kind
+        self.repo = repo
+        self.actor = actor
+        self.now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.store = {"patients": repo.pat_store, "medicines": repo.med_store, "schedules": repo.sch_store}[kind]
+        self.patient_ids = {p.get("id") for p in repo.pat_store.iter_records("patients")}
+        # ids already used by this record type (medicine/schedule ids; patients use patient_ids)
+        self.record_ids = set() if kind == "patients" else {r.get("id") for r in self.store.iter_records(kind)}
+
+    def _known_patient(self, row):
+        pid = _text(row, "patient_id")
+        if not pid:
+            raise RowError("missing patient_id")
+        if pid not in self.patient_ids:
+            raise RowError(f"unknown patient_id '{pid}'")
+        return pid
+
+    # keep the row's id (exported files round-trip) unless it's taken, else mint one
+    def _record_id(self, row, new_id):
+        rid = _text(row, "id")
+        if rid and rid in self.record_ids:
+            raise RowError(f"duplicate {self.kind[:-1]} id '{rid}'")
+        rid = rid or new_id()
+        self.record_ids.add(rid)
+        return rid
+
+    def patients(self, row):
+        name = _required(row, "name", is_letters_only, "patient name must be letters only")
+        doctor = _text(row, "doctor", self.actor or "")
+        if not doctor:
+            raise RowError("missing doctor")
+        username = _text(row, "user_username")
+        if username and not is_alnum_username(username):
+            raise RowError("user_username must be letters and numbers only")
+        pid = _text(row, "id")
+        if pid and pid in self.patient_ids:
+            raise RowError(f"duplicate patient id '{pid}'")
+        pid = pid or new_patient_id()
+        self.patient_ids.add(pid)
+        return {"id": pid, "name": name, "doctor": doctor, "user_username": username,
+                "created_at": _text(row, "created_at", self.now)}
+
+    def medicines(self, row):
+        return {
+            "id": self._record_id(row, new_medicine_id),
+            "patient_id": self._known_patient(row),
+            "name": _required(row, "name", is_letters_only, "medicine name must be letters only"),
+            "dosage": _required(row, "dosage", is_valid_dosage, "dosage must be a number in mg, g or l"),
+            "quantity": _required(row, "quantity", _is_quantity, "quantity must be a number"),
+            "expiry_date": normalize_date(_required(row, "expiry_date", _is_date, "expiry_date must be YYYY-MM-DD")),
+            "added_by": _text(row, "added_by", self.actor or ""),
+            "added_at": _text(row, "added_at", self.now),
+        }
+
+    def schedules(self, row):
+        return {
+            "id": self._record_id(row, new_schedule_id),
+            "patient_id": self._known_patient(row),
+            "medicine_name": _required(row, "medicine_name", is_letters_only, "medicine name must be letters only"),
+            "dosage": _required(row, "dosage", is_valid_dosage, "dosage must be a number in mg, g or l"),
+            "time": _required(row, "time", is_valid_time_hms, "time must be HH:MM:SS"),
+            "days": _days(row),
+            "created_by": _text(row, "created_by", self.actor or ""),
+            "created_at": _text(row, "created_at", self.now),
+        }
+
+
+# import rows from any iterable of (line number, row, error) into one store
+def import_rows(kind, rows, actor=None, repo=None):
+    if kind not in COLUMNS:
+        raise ValueError(f"unknown record type '{kind}'")
+    importer = _Importer(kind, repo or patient_service._repo, actor)
+    build = getattr(importer, kind)
+    report = ImportReport(kind)
+    accepted = []
+    for line_no, row, error in rows:
+        if error is None:
+            try:
+                accepted.append(build(row))
+                continue
+            except RowError as e:
+                error = str(e)
+        report.reject(line_no, error, row)
+    # one commit for the whole file; a running ReminderScheduler picks new
+    # schedules up on its next external-change check
+    importer.store.extend(kind, accepted)
+    report.accepted = len(accepted)
+    return report
+
+
+def import_file(kind, path, actor=None, fmt=None, repo=None):
+    return import_rows(kind, iter_rows(path, fmt), actor=actor, repo=repo)
+
+
+# write every record of one type to path, one row at a time; returns the row count
+def export_file(kind, path, fmt=None, repo=None):
+    if kind not in COLUMNS:
+        raise ValueError(f"unknown record type '{kind}'")
+    fmt = detect_format(path, fmt)
+    repo = repo or patient_service._repo
+    store = {"patients": repo.pat_store, "medicines": repo.med_store, "schedules": repo.sch_store}[kind]
+    columns = COLUMNS[kind]
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(columns)
+        for rec in store.iter_records(kind):
+            if writer:
+                writer.writerow([",".join(rec.get(c) or []) if c == "days" else rec.get(c, "") for c in columns])
+            else:
+                f.write(json.dumps({c: rec.get(c, "") for c in columns}) + "\n")
+            count += 1
+    return count
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import/export MediTracker records (CSV or JSON-lines)")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("kind", choices=sorted(COLUMNS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--actor", help="username recorded as doctor/added_by/created_by when a row has none")
+    parser.add_argument("--rejects", help="write rejected rows to this CSV file")
+    args = parser.parse_args()
+
+    if args.action == "export":
+        count = export_file(args.kind, args.path, args.format)
+        print(f"{args.kind}: {count} exported to {args.path}")
+        return
+    report = import_file(args.kind, args.path, actor=args.actor, fmt=args.format)
+    print(report.summary())
+    for line_no, reason, _ in report.rejected[:20]:
+        print(f"  line {line_no}: {reason}")
+    if len(report.rejected) > 20:
+        print(f"  ... {len(report.rejected) - 20} more")
+    if args.rejects and report.rejected:
+        report.write_rejects(args.rejects)
+        print(f"rejected rows written to {args.rejects}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+from pathlib import Path
+
+# Storage settings shared by the service modules. Everything can be overridden
+# through environment variables so the app code doesn't need to change.
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+
+# "json" (default) keeps the data/*.json files and src/users.txt,
+# "sqlite" stores everything in a single SQLite database file instead,
+# "sharded" splits patients, medicines and schedules into one folder per doctor
+# under SHARD_DIR (see services/shards.py).
+STORAGE_BACKEND = os.environ.get("MEDITRACKER_STORAGE", "json").strip().lower()
+SQLITE_FILE = Path(os.environ.get("MEDITRACKER_DB", DATA_DIR / "meditracker.db"))
+SHARD_DIR = Path(os.environ.get("MEDITRACKER_SHARD_DIR", DATA_DIR / "shards"))
+
+# Password hashing for new and upgraded hashes: "scrypt" (default), "pbkdf2_sha256"
+# or "sha256" (legacy, unsalted). The cost is scrypt's N or the PBKDF2 iteration
+# count; leave it unset for the scheme's default. See benchmarks/hashing.py.
+PASSWORD_SCHEME = os.environ.get("MEDITRACKER_PASSWORD_SCHEME", "scrypt").strip().lower()
+PASSWORD_COST = int(os.environ["MEDITRACKER_PASSWORD_COST"]) if os.environ.get("MEDITRACKER_PASSWORD_COST") else None
+
+# JSON snapshots at least this big are streamed record by record for list/search
+# lookups instead of being parsed into memory whole (see services/storage.py)
+STREAM_THRESHOLD_BYTES = int(os.environ.get("MEDITRACKER_STREAM_BYTES", 64 * 1024 * 1024))
+
+# records per page in the menus and the page_* repository methods
+PAGE_SIZE = int(os.environ.get("MEDITRACKER_PAGE_SIZE", 20))
+
+
+def use_sqlite():
+    return STORAGE_BACKEND == "sqlite"
+
+
+def use_sharded():
+    return STORAGE_BACKEND == "sharded"
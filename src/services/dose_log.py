@@ -0,0 +1,68 @@
+import os
+from collections import namedtuple
+from pathlib import Path
+
+# Append-only log of doses patients confirmed taking. One tab-separated line per
+# dose ("2026-10-18 08:02:11<TAB>P...<TAB>S...<TAB>M...<TAB>1"), written with a
+# single O_APPEND write so sessions logging at the same time never interleave.
+# Readers remember the byte offset they stopped at and later read only what was
+# appended since (read_from), which is how the analytics stay incremental.
+
+Dose = namedtuple("Dose", "taken_at patient_id schedule_id medicine_id amount")
+
+
+class DoseLog:
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+
+    def ensure(self):
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_path.touch(exist_ok=True)
+
+    def append(self, dose: Dose):
+        self.ensure()
+        line = "\t".join(str(v).replace("\t", " ").replace("\n", " ") for v in dose) + "\n"
+        fd = os.open(self.file_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # a crash mid-write leaves a line without its newline; don't glue onto it
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                line = "\n" + line
+            os.write(fd, line.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # doses appended after byte offset `offset`, and the offset to continue from;
+    # a line still being written (no newline yet) is left for the next call
+    def read_from(self, offset=0):
+        doses = []
+        try:
+            f = open(self.file_path, "rb")
+        except FileNotFoundError:
+            return doses, 0
+        with f:
+            f.seek(offset)
+            chunk = f.read()
+        complete = chunk.rfind(b"\n") + 1
+        for line in chunk[:complete].decode("utf-8", "replace").split("\n")[:-1]:
+            parts = line.split("\t")
+            if len(parts) != len(Dose._fields):
+                continue  # damaged line
+            try:
+                parts[4] = float(parts[4])
+            except ValueError:
+                continue
+            doses.append(Dose._make(parts))
+        return doses, offset + complete
+
+    def iter_doses(self):
+        return iter(self.read_from(0)[0])
+
+    # grows with every append
+    @property
+    def version(self):
+        try:
+            return os.stat(self.file_path).st_size
+        except FileNotFoundError:
+            return 0
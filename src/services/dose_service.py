@@ -0,0 +1,226 @@
+import functools
+import math
+from datetime import datetime, timedelta
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # optional: the forecaster falls back to plain Python
+    np = None
+
+from interface.validators import parse_quantity
+from services import inventory, patient_service, reminder_service
+from services.config import SQLITE_FILE, use_sqlite
+from services.dose_log import Dose, DoseLog
+from services.reminder_scheduler import DAY_NAMES, parse_time_hms
+from services.sqlite_backend import SQLiteDoseLog
+
+# Doses taken and stock run-out forecasting.
+#
+# A patient confirms a reminder from the patient menu: the dose goes to the
+# append-only dose log and the matching medicine's quantity goes down by one.
+# forecast_run_out() then works out, for every medicine in the clinic at once,
+# on which day the remaining stock runs out: each schedule contributes its
+# doses per weekday (today only counts the ones still ahead of the clock), and
+# the per-medicine arithmetic runs over NumPy arrays when NumPy is installed.
+#
+# From the src folder:
+#     python -m services.dose_service forecast --within 14
+#     python -m services.dose_service forecast --doctor drsmith
+
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+DOSE_FILE = DATA_DIR / "doses.log"
+# tolerance for fractional quantities ("2.5" tablets)
+EPS = 1e-9
+DAY_INDEX = {day: i for i, day in enumerate(DAY_NAMES)}
+
+if use_sqlite():
+    _log = SQLiteDoseLog(SQLITE_FILE)
+else:
+    _log = DoseLog(DOSE_FILE)
+
+
+# the patient's stock entry for a reminder: same medicine name, preferring one that isn't empty
+def _medicine_for(patient_id, medicine_name):
+    name = str(medicine_name).strip().lower()
+    matches = [m for m in inventory.list_medicines(patient_id) if str(m.get("name", "")).strip().lower() == name]
+    for m in matches:
+        if (parse_quantity(m.get("quantity")) or 0) > 0:
+            return m
+    return matches[0] if matches else None
+
+
+# Log that the patient took the dose of reminder schedule_id and lower the stock.
+# Returns the medicine record with its new quantity, or None when the patient has
+# no stock entry for that medicine (the dose is still logged).
+def confirm_dose(patient_id, schedule_id, amount=1, taken_at=None):
+    reminder = next((r for r in reminder_service.list_reminders(patient_id) if r.get("id") == schedule_id), None)
+    if reminder is None:
+        raise ValueError(f"patient {patient_id} has no reminder {schedule_id}")
+    medicine = _medicine_for(patient_id, reminder.get("medicine_name", ""))
+    updated = None
+    if medicine is not None:
+        updated = inventory.take_dose(patient_id, medicine["id"], amount)
+    taken_at = (taken_at or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    _log.append(Dose(taken_at, patient_id, schedule_id, medicine["id"] if medicine else "", amount))
+    return updated
+
+
+def read_doses(offset=0):
+    return _log.read_from(offset)
+
+
+# a clinic's schedules and stock share a handful of distinct times and quantities, so parse each once
+@functools.lru_cache(maxsize=4096)
+def _time_of(text):
+    return parse_time_hms(text)
+
+
+@functools.lru_cache(maxsize=4096)
+def _quantity_of(text):
+    return parse_quantity(text)
+
+
+# (patient_id, medicine name) -> (doses per weekday Mon..Sun, doses still due today)
+def _weekly_doses(schedules, now):
+    clock = (now.hour, now.minute, now.second)
+    today = now.weekday()
+    counts = {}
+    for s in schedules:
+        hms = _time_of(s.get("time", ""))
+        if hms is None:
+            continue
+        key = (s.get("patient_id"), str(s.get("medicine_name", "")).strip().lower())
+        entry = counts.get(key)
+        if entry is None:
+            entry = counts[key] = ([0] * 7, [0])
+        week, later = entry
+        for day in s.get("days") or ():
+            wd = DAY_INDEX.get(day)
+            if wd is not None:
+                week[wd] += 1
+                if wd == today and hms > clock:
+                    later[0] += 1
+    return counts
+
+
+# Days from today until each stock is used up. quantities[i] is the stock,
+# first[i] the doses on the next 7 days (today: only those still ahead),
+# full[i] the doses per day of a whole week starting on today's weekday.
+# 0 = runs out (or ran out) today, None = no schedule uses it.
+def run_out_offsets(quantities, first, full):
+    if np is not None and quantities:
+        return _offsets_numpy(quantities, first, full)
+    # most medicines share their stock level and weekly pattern with many others
+    memo = {}
+    offsets = []
+    for q, f, w in zip(quantities, first, full):
+        key = (q, tuple(f), tuple(w))
+        if key not in memo:
+            memo[key] = _offset(q, f, w)
+        offsets.append(memo[key])
+    return offsets
+
+
+def _offset(q, first, full):
+    if q <= EPS:
+        return 0
+    total = 0
+    for day, n in enumerate(first):
+        total += n
+        if total >= q - EPS:
+            return day
+    per_week = sum(full)
+    if not per_week:
+        return None
+    # whole weeks after the first one, then the day inside the last week
+    left = q - total
+    weeks = math.ceil(left / per_week - EPS) - 1
+    left -= weeks * per_week
+    total = 0
+    for day, n in enumerate(full):
+        total += n
+        if total >= left - EPS:
+            return 7 + 7 * weeks + day
+    return None
+
+
+def _offsets_numpy(quantities, first, full):
+    q = np.asarray(quantities, dtype=float)
+    first_cum = np.asarray(first, dtype=float).reshape(len(q), 7).cumsum(axis=1)
+    full_cum = np.asarray(full, dtype=float).reshape(len(q), 7).cumsum(axis=1)
+    per_week = full_cum[:, 6]
+    # cumulative sums only grow, so "first day reaching q" = number of days below it
+    in_first = first_cum[:, 6] >= q - EPS
+    day_first = (first_cum < (q - EPS)[:, None]).sum(axis=1)
+    left = q - first_cum[:, 6]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weeks = np.where(per_week > 0, np.ceil(left / per_week - EPS) - 1, 0)
+    left = left - weeks * per_week
+    day_later = 7 + 7 * weeks + (full_cum < (left - EPS)[:, None]).sum(axis=1)
+    offsets = np.where(q <= EPS, 0, np.where(in_first, day_first, day_later))
+    never = (q > EPS) & ~in_first & (per_week == 0)
+    return [None if n else int(o) for o, n in zip(offsets.tolist(), never.tolist())]
+
+
+# Run-out forecast for every medicine (of one doctor's patients, or the whole
+# clinic), soonest first. Each row: id, patient_id, name, quantity,
+# doses_per_week, days_left and runs_out (YYYY-MM-DD); the last two are None
+# for medicines no schedule uses. Medicines whose quantity isn't a number are skipped.
+def forecast_run_out(doctor=None, now=None):
+    now = now or datetime.now()
+    schedules = reminder_service._load().get("schedules", [])
+    patients = None
+    if doctor is not None:
+        patients = {p.get("id") for p in patient_service.list_patients(doctor)}
+        schedules = [s for s in schedules if s.get("patient_id") in patients]
+    counts = _weekly_doses(schedules, now)
+    today = now.weekday()
+    unscheduled = ([0] * 7, [0])
+    rows, quantities, first, full = [], [], [], []
+    for m in inventory._load().get("medicines", []):
+        if patients is not None and m.get("patient_id") not in patients:
+            continue
+        q = _quantity_of(str(m.get("quantity")))
+        if q is None:
+            continue
+        week, later = counts.get((m.get("patient_id"), str(m.get("name", "")).strip().lower()), unscheduled)
+        week = week[today:] + week[:today]
+        rows.append(m)
+        quantities.append(q)
+        full.append(week)
+        first.append([later[0]] + week[1:])
+    day_text = {}
+    result = []
+    for m, week, offset in zip(rows, full, run_out_offsets(quantities, first, full)):
+        if offset is not None and offset not in day_text:
+            day_text[offset] = (now.date() + timedelta(days=offset)).isoformat()
+        result.append({
+            "id": m.get("id"), "patient_id": m.get("patient_id"), "name": m.get("name"),
+            "quantity": m.get("quantity"), "doses_per_week": sum(week),
+            "days_left": offset, "runs_out": day_text.get(offset),
+        })
+    result.sort(key=lambda r: (r["days_left"] is None, r["days_left"] or 0))
+    return result
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Forecast when each medicine's stock runs out")
+    parser.add_argument("action", choices=["forecast"])
+    parser.add_argument("--doctor", help="only this doctor's patients")
+    parser.add_argument("--within", type=int, help="only medicines running out within this many days")
+    args = parser.parse_args()
+
+    rows = forecast_run_out(args.doctor)
+    if args.within is not None:
+        rows = [r for r in rows if r["days_left"] is not None and r["days_left"] <= args.within]
+    for r in rows:
+        when = r["runs_out"] or "not scheduled"
+        print(f"{when:13} {r['patient_id']:28} {r['name']:20} qty {r['quantity']:>6}  {r['doses_per_week']}/week")
+    print(f"{len(rows)} medicines")
+
+
+if __name__ == "__main__":
+    main()
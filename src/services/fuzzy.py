@@ -0,0 +1,88 @@
+import heapq
+import math
+
+# Typo-tolerant matching for the search screens. Texts are compared by their
+# character trigrams (Dice coefficient, 0..1): "dolipram" vs "doliprame" share
+# 6 of their 6+7 trigrams and score 0.92. A multi-word name is scored against
+# the whole text and against each word, so "Mugsha" still finds "John Mugisha".
+# Results are ranked: substring matches first (prefix before infix), then by
+# similarity, then in file order.
+
+GRAM = 3
+# minimum similarity for a non-substring match to be returned
+FUZZY_THRESHOLD = 0.4
+
+
+def trigrams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def dice(a, b):
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+# fewest shared trigrams a text can have with an n-trigram term and still reach
+# FUZZY_THRESHOLD (from 2s / (n + m) >= t and s <= m), used to prune candidates
+def min_shared(n):
+    return max(1, math.ceil(FUZZY_THRESHOLD * n / (2 - FUZZY_THRESHOLD)))
+
+
+# best score a text sharing s of the term's n trigrams could reach (whole text or
+# a single word: both have at least s trigrams), lets callers stop early
+def upper_bound(s, n):
+    return 2 * s / (n + s)
+
+
+# rank key for text (already lowercased) against a lowercased term; None if it
+# doesn't match. Callers scoring many texts can pass the whole-text similarity
+# they already know and a dict that caches per-word similarities.
+def score(term, term_grams, text, whole=None, word_cache=None):
+    pos = text.find(term)
+    if pos >= 0:
+        return (2, 1.0 if pos == 0 else 0.5)
+    best = dice(term_grams, trigrams(text)) if whole is None else whole
+    if " " in text:
+        for word in text.split():
+            if word_cache is None:
+                sim = dice(term_grams, trigrams(word))
+            else:
+                sim = word_cache.get(word)
+                if sim is None:
+                    sim = word_cache[word] = dice(term_grams, trigrams(word))
+            if sim > best:
+                best = sim
+    if best >= FUZZY_THRESHOLD:
+        return (1, best)
+    return None
+
+
+# rank a (small) list of records by how well record[field] matches term
+def rank(records, field, term, limit=None):
+    term = term.lower().strip()
+    if not term:
+        return []
+    grams = trigrams(term)
+    word_cache = {}
+    scored = []
+    for i, rec in enumerate(records):
+        s = score(term, grams, str(rec.get(field, "")).lower(), word_cache=word_cache)
+        if s is not None:
+            scored.append((s, i, rec))
+    return ordered(scored, limit)
+
+
+# [(score, order, record)] -> best first, at most limit records
+def ordered(scored, limit=None):
+    return [rec for _, _, rec in best(scored, limit)]
+
+
+def best(scored, limit=None):
+    if limit is None:
+        return sorted(scored, key=_order)
+    return heapq.nsmallest(limit, scored, key=_order)
+
+
+def _order(item):
+    return (-item[0][0], -item[0][1], item[1])
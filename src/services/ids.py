@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+import weakref
+
+# Record ID generator. IDs look like a prefix letter (P patients, M medicines,
+# S schedules) + 13-digit millisecond timestamp + 4-digit sequence + 8 hex chars
+# of per-process node id, e.g. "P17607732000420000a3f91c07":
+#  - sortable: string order follows creation order, and because the timestamp
+#    digits come first, new IDs still sort after the old "P<unix seconds>" ones
+#  - collision-free inside a process: the sequence counts IDs handed out in the
+#    same millisecond (10,000 per ms before borrowing the next millisecond),
+#    and the clock is never allowed to go backwards
+#  - safe across processes: every process (and every forked child) draws its own
+#    random node id, so two processes minting IDs in the same millisecond differ
+
+SEQ_DIGITS = 4
+SEQ_MAX = 10 ** SEQ_DIGITS - 1
+
+_generators = weakref.WeakSet()
+
+
+def _new_node():
+    return os.urandom(4).hex()
+
+
+class IdGenerator:
+    def __init__(self, prefix, clock=time.time_ns):
+        self.prefix = prefix
+        self._clock = clock
+        self._reseed()
+        _generators.add(self)
+
+    def _reseed(self):
+        self._lock = threading.Lock()
+        self._node = _new_node()
+        self._last_ms = 0
+        self._seq = 0
+
+    def new_id(self):
+        with self._lock:
+            now_ms = self._clock() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms, self._seq = now_ms, 0
+            elif self._seq < SEQ_MAX:
+                self._seq += 1
+            else:
+                # sequence exhausted (or the clock stepped back): move to the next millisecond
+                self._last_ms, self._seq = self._last_ms + 1, 0
+            return f"{self.prefix}{self._last_ms:013d}{self._seq:0{SEQ_DIGITS}d}{self._node}"
+
+
+# a forked child must not reuse its parent's node id (or a lock held during the fork)
+def _after_fork():
+    for gen in list(_generators):
+        gen._reseed()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+_patient_ids = IdGenerator("P")
+_medicine_ids = IdGenerator("M")
+_schedule_ids = IdGenerator("S")
+
+
+def new_patient_id():
+    return _patient_ids.new_id()
+
+
+def new_medicine_id():
+    return _medicine_ids.new_id()
+
+
+def new_schedule_id():
+    return _schedule_ids.new_id()
@@ -1,34 +1,41 @@
-import json
+import functools
+import heapq
 from datetime import datetime
 from pathlib import Path
 
+from interface.validators import date_ordinal, format_quantity, normalize_date, parse_date, parse_quantity
+from services.config import PAGE_SIZE, SQLITE_FILE, use_sharded, use_sqlite
+from services.sqlite_backend import SQLiteMedicineInventory
+from services import patient_service
+from services.shards import ShardSet, shard_name
+from services.fuzzy import rank as fuzzy_rank
+from services.ids import new_medicine_id
+from services.storage import (
+    FieldIndex, JSONStorageBase as SharedJSONStorageBase, NgramIndex, SortedIndex, retry_on_conflict
+)
+
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 MED_FILE = DATA_DIR / "medicines.json"
 
 
-# Creation of JSONStorageBase class that serves as a parent class to the rest of the child classes and that will contain storage details
-class JSONStorageBase:
+# Inventory keeps its own JSONStorageBase signature (root_key + underscore helpers)
+# but inherits the cached load/save logic from the shared storage layer
+class JSONStorageBase(SharedJSONStorageBase):
     # Base class to encapsulate JSON file storage responsibilities.
     # Provides ensure / load / save methods used by subclasses.
     
     def __init__(self, file_path: Path, root_key: str, default_structure=None):
-        self.file_path = Path(file_path)
         self.root_key = root_key
-        self.default_structure = default_structure if default_structure is not None else {self.root_key: []}
+        super().__init__(file_path, default_structure if default_structure is not None else {root_key: []})
 
     def _ensure(self):
-        self.file_path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.file_path.exists():
-            self.file_path.write_text(json.dumps(self.default_structure, indent=2))
+        return self.ensure()
 
     def _load(self):
-        self._ensure()
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return self.load()
 
     def _save(self, data):
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        return self.save(data)
 
 
 class MedicineInventory(JSONStorageBase):
@@ -36,60 +43,227 @@ class MedicineInventory(JSONStorageBase):
     # Medicine-specific storage logic. Inherits file operations from JSONStorageBase\ 
     # and exposes the same behavior/logic as the original procedural module.
    
-    def __init__(self, file_path: Path):
+    def __init__(self, file_path: Path, doctor_of=None):
         super().__init__(file_path, "medicines", {"medicines": []})
+        # patient_id -> positions in data["medicines"], so per-patient lookups are O(k)
+        self._by_patient = FieldIndex(self, "medicines", "patient_id")
+        # medicine id -> its position, for edits and deletes by id
+        self._by_id = FieldIndex(self, "medicines", "id")
+        # medicine name trigrams per doctor, for searching a doctor's whole panel;
+        # without a doctor_of(patient_id) lookup the doctor who added the medicine is used
+        if doctor_of is None:
+            self._by_name = NgramIndex(self, "medicines", "name", "added_by")
+            self._by_expiry = SortedIndex(self, "medicines", _expiry_key, "added_by")
+        else:
+            self._by_name = NgramIndex(self, "medicines", "name", "patient_id", doctor_of)
+            # expiry day numbers, clinic-wide and per doctor
+            self._by_expiry = SortedIndex(self, "medicines", _expiry_key, "patient_id", doctor_of)
+        self._indexes = (self._by_patient, self._by_id, self._by_name, self._by_expiry)
+
+    # One-time migration for medicines saved before they had ids (run at startup);
+    # writes backfill them too, so reads never have to. Returns how many got one.
+    @retry_on_conflict
+    def backfill_ids(self):
+        if self.streaming:
+            return 0
+        return self._by_id.fill_missing(new_medicine_id, self._load())
 # method that lists patient's medicine and their id 
-    def list_medicines(self, patient_id):
-        data = self._load()
-        return [m for m in data.get("medicines", []) if m.get("patient_id") == patient_id]
+    def list_medicines(self, patient_id, offset=0, limit=None):
+        return self._by_patient.records(patient_id, offset=offset, limit=limit)
+
+    # one page of a patient's medicines and the cursor of the next page (None on the last one)
+    def page_medicines(self, patient_id, cursor=None, limit=PAGE_SIZE):
+        return self._by_patient.page(patient_id, cursor, limit, id_field="id")
 # method to search medicine
-    def search_medicines(self, patient_id, term):
+    def search_medicines(self, patient_id, term, fuzzy=False, limit=None):
+        if fuzzy:
+            return fuzzy_rank(self.list_medicines(patient_id), "name", term, limit)
         term = term.lower()
-        return [m for m in self.list_medicines(patient_id) if term in m.get("name", "").lower()]
+        return [m for m in self.list_medicines(patient_id) if term in m.get("name", "").lower()][:limit]
+
+    # medicines of all of a doctor's patients whose name contains term
+    # (fuzzy=True: or nearly matches it, e.g. "Dolipram", best matches first)
+    def search_doctor_medicines(self, doctor_username, term, fuzzy=False, limit=None):
+        if fuzzy:
+            return self._by_name.fuzzy_search(doctor_username, term, limit)
+        return self._by_name.search(doctor_username, term)[:limit]
+
+    # medicines (of one doctor's patients, or all) expiring before `before`
+    # (a date or date text), soonest first; undated records are never included
+    def medicines_expiring_before(self, before, doctor=None):
+        bound = _expiry_bound(before)
+        return self._by_expiry.below(bound, doctor)
 #Added method to add medine
+    @retry_on_conflict
     def add_medicine(self, patient_id, name, dosage, quantity, expiry_date, added_by):
         data = self._load()
-        data["medicines"].append({
+        self._by_id.fill_missing(new_medicine_id, data)
+        for index in self._indexes:
+            index.sync(data)
+        record = {
+            "id": new_medicine_id(),
             "patient_id": patient_id,
             "name": name,
             "dosage": dosage,
             "quantity": quantity,
-            "expiry_date": expiry_date,
+            "expiry_date": normalize_date(expiry_date),
             "added_by": added_by,
             "added_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        self._save(data)
+        }
+        # one journal line instead of rewriting medicines.json
+        self.append(data, "medicines", record)
+        # the indexes keep the compact record append() cached, not our dict
+        pos = len(data["medicines"]) - 1
+        for index in self._indexes:
+            index.note_append(pos, data["medicines"][pos])
+        return record["id"]
+
+    # position of a patient's medicine in data["medicines"] (None if the id is unknown
+    # or belongs to someone else); looked up by id, so it stays right however the
+    # file changed since the list was shown
+    def _position(self, data, patient_id, medicine_id):
+        self._by_id.fill_missing(new_medicine_id, data)
+        for index in self._indexes:
+            index.sync(data)
+        for pos in self._by_id.positions(medicine_id, data):
+            if data["medicines"][pos].get("patient_id") == patient_id:
+                return pos
+        return None
 #Added a method that will enable the doctor to edit patient's medicine specifically adjusting the name, dosage, quantity, and expiry date
-    def edit_medicine(self, patient_id, index, name, dosage, quantity, expiry_date):
+    @retry_on_conflict
+    def edit_medicine(self, patient_id, medicine_id, name, dosage, quantity, expiry_date):
+        data = self._load()
+        pos = self._position(data, patient_id, medicine_id)
+        if pos is None:
+            return False
+        old_record = data["medicines"][pos]
+        record = dict(old_record)
+        record.update({
+            "name": name,
+            "dosage": dosage,
+            "quantity": quantity,
+            "expiry_date": normalize_date(expiry_date)
+        })
+        self.update(data, "medicines", pos, record)
+        for index in self._indexes:
+            index.note_update(pos, old_record, data["medicines"][pos])
+        return True
+    # A dose was taken: lower the stock by amount (not below zero) with one journal
+    # line. Returns the updated record, or None for an unknown medicine or a
+    # quantity that isn't a number.
+    @retry_on_conflict
+    def take_dose(self, patient_id, medicine_id, amount=1):
         data = self._load()
-        meds = [m for m in data.get("medicines", []) if m.get("patient_id") == patient_id]
-        if 0 <= index < len(meds):
-            all_meds = data.get("medicines", [])
-            global_idx = [i for i, m in enumerate(all_meds) if m.get("patient_id") == patient_id][index]
-            data["medicines"][global_idx].update({
-                "name": name,
-                "dosage": dosage,
-                "quantity": quantity,
-                "expiry_date": expiry_date
-            })
-            self._save(data)
-            return True
-        return False
+        pos = self._position(data, patient_id, medicine_id)
+        if pos is None:
+            return None
+        old_record = data["medicines"][pos]
+        quantity = parse_quantity(old_record.get("quantity"))
+        if quantity is None:
+            return None
+        record = dict(old_record, quantity=format_quantity(max(0.0, quantity - amount)))
+        self.update(data, "medicines", pos, record)
+        for index in self._indexes:
+            index.note_update(pos, old_record, data["medicines"][pos])
+        return record
 # I added a method that allows doctor to delete medicine especially when the patient has recovered and is not under doctor's surper
-    def delete_medicine(self, patient_id, index):
+    @retry_on_conflict
+    def delete_medicine(self, patient_id, medicine_id):
         data = self._load()
-        meds = [m for m in data.get("medicines", []) if m.get("patient_id") == patient_id]
-        if 0 <= index < len(meds):
-            all_meds = data.get("medicines", [])
-            global_idx = [i for i, m in enumerate(all_meds) if m.get("patient_id") == patient_id][index]
-            all_meds.pop(global_idx)
-            self._save(data)
-            return True
-        return False
+        pos = self._position(data, patient_id, medicine_id)
+        if pos is None:
+            return False
+        removed = data["medicines"][pos]
+        self.remove(data, "medicines", pos)
+        for index in self._indexes:
+            index.note_remove(pos, removed)
+        return True
+
+
+# Same API as MedicineInventory over the per-doctor folders of services/shards.py:
+# each call works on the medicines.json of the patient's (or doctor's) shard only.
+# Shares the repository's shard map and whole-clinic medicines view.
+class ShardedMedicineInventory:
+    def __init__(self, repo):
+        self.map = repo.map
+        self.shards = ShardSet(repo.shards.root, lambda folder: MedicineInventory(
+            folder / "medicines.json", doctor_of=self.map.doctor_of))
+        self.store = repo.med_store
+
+    def _for_patient(self, patient_id):
+        return self.shards.get(self.map.shard_of(patient_id))
+
+    def _ensure(self):
+        return self.store.ensure()
+
+    def _load(self):
+        return self.store.load()
+
+    def _save(self, data):
+        return self.store.save(data)
+
+    def list_medicines(self, patient_id, offset=0, limit=None):
+        return self._for_patient(patient_id).list_medicines(patient_id, offset=offset, limit=limit)
+
+    def page_medicines(self, patient_id, cursor=None, limit=PAGE_SIZE):
+        return self._for_patient(patient_id).page_medicines(patient_id, cursor=cursor, limit=limit)
+
+    def search_medicines(self, patient_id, term, fuzzy=False, limit=None):
+        return self._for_patient(patient_id).search_medicines(patient_id, term, fuzzy=fuzzy, limit=limit)
+
+    def search_doctor_medicines(self, doctor_username, term, fuzzy=False, limit=None):
+        shard = self.shards.get(shard_name(doctor_username))
+        return shard.search_doctor_medicines(doctor_username, term, fuzzy=fuzzy, limit=limit)
+
+    # one doctor: their shard only; the whole clinic: every shard's list merged by expiry day
+    def medicines_expiring_before(self, before, doctor=None):
+        if doctor is not None:
+            return self.shards.get(shard_name(doctor)).medicines_expiring_before(before, doctor)
+        _expiry_bound(before)  # a bad date is an error even before any shard exists
+        return list(heapq.merge(*(s.medicines_expiring_before(before) for s in self.shards.all()), key=_expiry_key))
+
+    def add_medicine(self, patient_id, name, dosage, quantity, expiry_date, added_by):
+        return self._for_patient(patient_id).add_medicine(patient_id, name, dosage, quantity, expiry_date, added_by)
+
+    def edit_medicine(self, patient_id, medicine_id, name, dosage, quantity, expiry_date):
+        return self._for_patient(patient_id).edit_medicine(patient_id, medicine_id, name, dosage, quantity, expiry_date)
+
+    def take_dose(self, patient_id, medicine_id, amount=1):
+        return self._for_patient(patient_id).take_dose(patient_id, medicine_id, amount)
+
+    def delete_medicine(self, patient_id, medicine_id):
+        return self._for_patient(patient_id).delete_medicine(patient_id, medicine_id)
+
+    def backfill_ids(self):
+        return sum(shard.backfill_ids() for shard in self.shards.all())
+
+
+def _expiry_key(record):
+    return _day_number(record.get("expiry_date"))
+
+
+# a clinic's medicines share a few thousand distinct expiry dates, so parse each once
+@functools.lru_cache(maxsize=8192)
+def _day_number(text):
+    return date_ordinal(text)
+
+
+def _expiry_bound(before):
+    parsed = parse_date(before)
+    if parsed is None:
+        raise ValueError(f"not a date: {before!r}")
+    return parsed.toordinal()
 
 
 # Backward-compatibility wrappers that forward previous function calls before applying OOP organization style
-_inventory = MedicineInventory(MED_FILE)
+# MEDITRACKER_STORAGE=sqlite swaps in the SQLite implementation of the same API,
+# MEDITRACKER_STORAGE=sharded the per-doctor folders
+if use_sqlite():
+    _inventory = SQLiteMedicineInventory(SQLITE_FILE)
+elif use_sharded():
+    _inventory = ShardedMedicineInventory(patient_service._repo)
+else:
+    _inventory = MedicineInventory(MED_FILE, doctor_of=patient_service.doctor_of)
 
 
 # Module-level functions to keep backward compatibility with the rest of the codebase.
@@ -105,22 +279,42 @@ def _save(data):
     return _inventory._save(data)
 
 
-def list_medicines(patient_id):
-    return _inventory.list_medicines(patient_id)
+def list_medicines(patient_id, offset=0, limit=None):
+    return _inventory.list_medicines(patient_id, offset=offset, limit=limit)
+
+
+def page_medicines(patient_id, cursor=None, limit=PAGE_SIZE):
+    return _inventory.page_medicines(patient_id, cursor=cursor, limit=limit)
+
+
+def search_medicines(patient_id, term, fuzzy=False, limit=None):
+    return _inventory.search_medicines(patient_id, term, fuzzy=fuzzy, limit=limit)
+
+
+def search_doctor_medicines(doctor_username, term, fuzzy=False, limit=None):
+    return _inventory.search_doctor_medicines(doctor_username, term, fuzzy=fuzzy, limit=limit)
+
+
+def backfill_medicine_ids():
+    return _inventory.backfill_ids()
+
+
+def take_dose(patient_id, medicine_id, amount=1):
+    return _inventory.take_dose(patient_id, medicine_id, amount)
 
 
-def search_medicines(patient_id, term):
-    return _inventory.search_medicines(patient_id, term)
+def medicines_expiring_before(before, doctor=None):
+    return _inventory.medicines_expiring_before(before, doctor=doctor)
 
 
 def add_medicine(patient_id, name, dosage, quantity, expiry_date, added_by):
     return _inventory.add_medicine(patient_id, name, dosage, quantity, expiry_date, added_by)
 
 
-def edit_medicine(patient_id, index, name, dosage, quantity, expiry_date):
-    return _inventory.edit_medicine(patient_id, index, name, dosage, quantity, expiry_date)
+def edit_medicine(patient_id, medicine_id, name, dosage, quantity, expiry_date):
+    return _inventory.edit_medicine(patient_id, medicine_id, name, dosage, quantity, expiry_date)
 
 
-def delete_medicine(patient_id, index):
-    return _inventory.delete_medicine(patient_id, index)
+def delete_medicine(patient_id, medicine_id):
+    return _inventory.delete_medicine(patient_id, medicine_id)
 
@@ -0,0 +1,157 @@
+import json
+import re
+
+# Tolerant, incremental reader for the data/*.json documents.
+#
+# The files are shaped {"patients": [ {...}, {...} ], "_journal_seq": 3}, but the
+# shipped ones also contain "#" comment lines and may be cut off at the end (a
+# missing "]}" after the last record). Instead of json.load-ing the whole text,
+# the reader walks the top-level object and decodes one array element at a time
+# with json.JSONDecoder.raw_decode, so memory stays bounded by the size of one
+# record plus a read chunk. Lines starting with "#" are skipped (a JSON string
+# can't span lines, so such a line is never part of a value); a truncated tail
+# ends the array; a record that can't be decoded is skipped up to the next "{".
+# Anything that had to be skipped or repaired sets reader.clean = False, so the
+# caller knows the file should be rewritten.
+
+CHUNK_CHARS = 64 * 1024
+# a single record bigger than this is treated as corrupt rather than incomplete
+MAX_RECORD_CHARS = 1024 * 1024
+
+_WS = re.compile(r"[\s,]*")
+_decoder = json.JSONDecoder()
+
+
+class DocumentReader:
+    def __init__(self, f):
+        self._lines = iter(f)
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.clean = True
+
+    # append the next chunk of non-comment lines; False at end of file
+    def _more(self):
+        if self.eof:
+            return False
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        parts, size = [], 0
+        for line in self._lines:
+            if line.lstrip().startswith("#"):
+                self.clean = False
+                continue
+            parts.append(line)
+            size += len(line)
+            if size >= CHUNK_CHARS:
+                break
+        else:
+            self.eof = True
+        self.buf += "".join(parts)
+        return bool(parts) or not self.eof
+
+    # skip whitespace (and stray commas) and return the next character, or None at EOF
+    def _peek(self):
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return None
+
+    def _value(self):
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if len(self.buf) - self.pos > MAX_RECORD_CHARS or not self._more():
+                    raise
+                continue
+            # a number or literal may continue in the next chunk
+            if end == len(self.buf) and not isinstance(value, (dict, list, str)) and self._more():
+                continue
+            self.pos = end
+            return value
+
+    # after a corrupt element: move to the next "{" (or stop at EOF)
+    def _resync(self):
+        self.clean = False
+        while True:
+            nxt = self.buf.find("{", self.pos + 1)
+            if nxt >= 0:
+                self.pos = nxt
+                return True
+            self.pos = len(self.buf)
+            if not self._more():
+                return False
+            self.pos = -1  # search the new chunk from its start
+
+    # yield ("array", key, None), ("item", key, value) and ("value", key, value) events
+    def events(self):
+        if self._peek() != "{":
+            self.clean = False
+            return
+        self.pos += 1
+        while True:
+            c = self._peek()
+            if c is None:
+                self.clean = False  # truncated document
+                return
+            if c == "}":
+                self.pos += 1
+                return
+            try:
+                key = self._value()
+            except ValueError:
+                self.clean = False
+                return
+            if not isinstance(key, str) or self._peek() != ":":
+                self.clean = False
+                return
+            self.pos += 1
+            if self._peek() != "[":
+                try:
+                    yield "value", key, self._value()
+                except ValueError:
+                    self.clean = False
+                    return
+                continue
+            self.pos += 1
+            yield "array", key, None
+            while True:
+                c = self._peek()
+                if c is None:
+                    self.clean = False  # truncated inside the array
+                    return
+                if c == "]":
+                    self.pos += 1
+                    break
+                try:
+                    yield "item", key, self._value()
+                except ValueError:
+                    if not self._resync():
+                        return
+
+
+# yield the elements of document[root_key] one at a time
+def iter_array(path, root_key):
+    with open(path, "r", encoding="utf-8") as f:
+        for kind, key, value in DocumentReader(f).events():
+            if kind == "item" and key == root_key:
+                yield value
+
+
+# parse a whole document tolerantly; returns (document, clean)
+def load_document(path):
+    doc = {}
+    with open(path, "r", encoding="utf-8") as f:
+        reader = DocumentReader(f)
+        for kind, key, value in reader.events():
+            if kind == "array":
+                doc[key] = []
+            elif kind == "item":
+                doc[key].append(value)
+            else:
+                doc[key] = value
+    return doc, reader.clean
@@ -0,0 +1,78 @@
+import itertools
+import threading
+
+from services.reminder_scheduler import ReminderScheduler, format_reminder
+
+# One notification dispatcher for every logged-in patient. Sessions subscribe
+# on login and unsubscribe on logout; a single ReminderScheduler thread serves
+# all of them, so the number of threads doesn't grow with the number of logins.
+
+
+class NotificationService:
+    def __init__(self, manager, recheck_seconds=10):
+        self.manager = manager
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        self._sinks = {}  # patient_id -> {token: sink}
+        self._tokens = itertools.count(1)
+        self._scheduler = None
+        self._thread = None
+
+    # default sink: the terminal pop-up used by patient_notification_daemon
+    def _popup(self, reminder, fire_at, late):
+        self.manager.notify_popup("Medicine Reminder", format_reminder(reminder, fire_at, late))
+
+    # sink(reminder, fire_at, late) is called for each due reminder of patient_id; returns a token for unsubscribe()
+    def subscribe(self, patient_id, sink=None):
+        with self._lock:
+            token = next(self._tokens)
+            first = patient_id not in self._sinks
+            self._sinks.setdefault(patient_id, {})[token] = sink or self._popup
+            if self._thread is None:
+                self._scheduler = ReminderScheduler(self.manager, patient_ids=[], recheck_seconds=self.recheck_seconds)
+                self._thread = threading.Thread(target=self._scheduler.run, args=(self._dispatch,), daemon=True)
+                self._thread.start()
+            scheduler = self._scheduler
+        if first:
+            scheduler.add_patient(patient_id)
+        return token
+
+    # token=None drops every subscription of the patient
+    def unsubscribe(self, patient_id, token=None):
+        with self._lock:
+            sinks = self._sinks.get(patient_id)
+            if sinks is None:
+                return
+            if token is None:
+                sinks.clear()
+            else:
+                sinks.pop(token, None)
+            if sinks:
+                return
+            del self._sinks[patient_id]
+            scheduler = self._scheduler
+        if scheduler is not None:
+            scheduler.remove_patient(patient_id)
+
+    def active_patients(self):
+        with self._lock:
+            return list(self._sinks)
+
+    def _dispatch(self, reminder, fire_at, late):
+        with self._lock:
+            sinks = list(self._sinks.get(reminder.get("patient_id"), {}).values())
+        for sink in sinks:
+            try:
+                sink(reminder, fire_at, late)
+            except Exception:
+                # one broken sink must not stop reminders for everybody else
+                pass
+
+    def shutdown(self):
+        with self._lock:
+            scheduler, thread = self._scheduler, self._thread
+            self._scheduler = self._thread = None
+            self._sinks.clear()
+        if scheduler is not None:
+            scheduler.stop()
+            thread.join(timeout=5)
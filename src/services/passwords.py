@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+
+from services.config import PASSWORD_COST, PASSWORD_SCHEME
+
+# Password hashing strategies. Stored hashes are self-describing
+# ("scheme$params$salt$hash", no ':' so they fit in a users.txt field), which
+# lets old hashes keep verifying after the default scheme or cost changes and
+# lets authenticate() upgrade them on the next successful login. Hashes without
+# a scheme prefix are the original unsalted SHA-256 hex digests.
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class LegacySHA256Hasher:
+    scheme = "sha256"
+
+    def __init__(self, cost=None):
+        self.cost = None
+
+    def hash(self, password):
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def verify(self, password, stored):
+        return hmac.compare_digest(self.hash(password), stored)
+
+    def matches_policy(self, stored):
+        return "$" not in stored
+
+
+class PBKDF2Hasher:
+    # cost = number of PBKDF2-HMAC-SHA256 iterations
+    scheme = "pbkdf2_sha256"
+    default_cost = 600_000
+
+    def __init__(self, cost=None):
+        self.cost = int(cost or self.default_cost)
+
+    def _derive(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        return f"{self.scheme}${self.cost}${_b64(salt)}${_b64(self._derive(password, salt, self.cost))}"
+
+    def verify(self, password, stored):
+        try:
+            _, iterations, salt, digest = stored.split("$")
+            derived = self._derive(password, _unb64(salt), int(iterations))
+        except ValueError:
+            return False
+        return hmac.compare_digest(derived, _unb64(digest))
+
+    def matches_policy(self, stored):
+        parts = stored.split("$")
+        return len(parts) == 4 and parts[0] == self.scheme and parts[1] == str(self.cost)
+
+
+class ScryptHasher:
+    # cost = scrypt N (CPU/memory cost, a power of two); r=8, p=1
+    scheme = "scrypt"
+    default_cost = 2 ** 14
+    r = 8
+    p = 1
+
+    def __init__(self, cost=None):
+        self.cost = int(cost or self.default_cost)
+        if self.cost < 2 or self.cost & (self.cost - 1):
+            raise ValueError("scrypt cost must be a power of two")
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(password, salt, self.cost, self.r, self.p)
+        return f"{self.scheme}${self.cost},{self.r},{self.p}${_b64(salt)}${_b64(digest)}"
+
+    def verify(self, password, stored):
+        try:
+            _, params, salt, digest = stored.split("$")
+            n, r, p = (int(v) for v in params.split(","))
+            derived = self._derive(password, _unb64(salt), n, r, p)
+        except ValueError:
+            return False
+        return hmac.compare_digest(derived, _unb64(digest))
+
+    def matches_policy(self, stored):
+        parts = stored.split("$")
+        return len(parts) == 4 and parts[0] == self.scheme and parts[1] == f"{self.cost},{self.r},{self.p}"
+
+
+HASHERS = {h.scheme: h for h in (LegacySHA256Hasher, PBKDF2Hasher, ScryptHasher)}
+
+
+def get_hasher(scheme, cost=None):
+    try:
+        return HASHERS[scheme](cost)
+    except KeyError:
+        raise ValueError(f"unknown password scheme '{scheme}'") from None
+
+
+# hasher able to check a stored hash, based on its scheme prefix
+def identify(stored):
+    scheme = stored.split("$", 1)[0] if "$" in stored else LegacySHA256Hasher.scheme
+    return HASHERS.get(scheme, LegacySHA256Hasher)()
+
+
+class VerificationCache:
+    # Remembers recent successful (stored hash, password) checks so repeated logins
+    # skip the slow KDF. Keys are HMACs under a per-process random key, so the
+    # cache never holds anything that could be used to recover a password.
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, password, stored):
+        return hmac.new(self._key, stored.encode() + b"\0" + password.encode(), "sha256").digest()
+
+    def __contains__(self, item):
+        fp = self._fingerprint(*item)
+        with self._lock:
+            if fp in self._entries:
+                self._entries.move_to_end(fp)
+                return True
+        return False
+
+    def add(self, password, stored):
+        fp = self._fingerprint(password, stored)
+        with self._lock:
+            self._entries[fp] = True
+            self._entries.move_to_end(fp)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class PasswordContext:
+    # Hashes with the configured scheme, verifies any known scheme
+    def __init__(self, hasher, cache=None):
+        self.hasher = hasher
+        self.cache = cache
+
+    def hash(self, password):
+        return self.hasher.hash(password)
+
+    def verify(self, password, stored):
+        if self.cache is not None and (password, stored) in self.cache:
+            return True
+        ok = identify(stored).verify(password, stored)
+        if ok and self.cache is not None:
+            self.cache.add(password, stored)
+        return ok
+
+    # True when the stored hash uses an older scheme or cost than the configured one
+    def needs_rehash(self, stored):
+        return not self.hasher.matches_policy(stored)
+
+
+default_context = PasswordContext(get_hasher(PASSWORD_SCHEME, PASSWORD_COST), VerificationCache())
+
+
+def hash_password(password):
+    return default_context.hash(password)
+
+
+def verify_password(password, stored):
+    return default_context.verify(password, stored)
+
+
+def needs_rehash(stored):
+    return default_context.needs_rehash(stored)
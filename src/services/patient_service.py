@@ -1,33 +1,24 @@
-import json
+import re
 from datetime import datetime
 from pathlib import Path
+
+from services.config import PAGE_SIZE, SHARD_DIR, SQLITE_FILE, use_sharded, use_sqlite
+from services.ids import new_patient_id
+from services.shards import MAP_FILE_NAME, ShardedStore, ShardMap, ShardSet, shard_name
+from services.sqlite_backend import SQLitePatientRepository
+from services.storage import (
+    JOURNAL_BATCH_MAX, FieldIndex, JSONStorageBase, NgramIndex, log_many, retry_on_conflict, save_many
+)
 # Paths to the JSON files used as our lightweight “database”
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 PAT_FILE = DATA_DIR / "patients.json"
 MED_FILE = DATA_DIR / "medicines.json"
 SCH_FILE = DATA_DIR / "schedules.json"
+# search terms treated as (the start of) a patient ID: "P" + digits, and the
+# lowercase hex node suffix of IDs from services/ids.py; matched in any case
+ID_LIKE = re.compile(r"P[0-9a-f]+", re.IGNORECASE)
 
-# Created JSONBased parent class  and other classes can inherit from this so we don't repeat storage logic everywhere
-
-class JSONStorageBase:
-    def __init__(self, file_path: Path, default_structure):
-        self.file_path = Path(file_path)
-        self.default_structure = default_structure
-# def ensure method make sure the JSON file exists. If it's missing, we create it with an empty structure
-    def ensure(self):
-        self.file_path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.file_path.exists():
-            self.file_path.write_text(json.dumps(self.default_structure, indent=2))
-#def load method read and return the current JSON content
-    def load(self):
-        self.ensure()
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-# def save method writes updated data back to the JSON file
-    def save(self, data):
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-
+# JSONStorageBase lives in services/storage.py so all services share one cached store layer
 #Created PatientRepository child class for JSONStorageBase that give details about patients information"
 """
  It handles all patient-related operations, plus cleanup of
@@ -39,6 +30,13 @@ class PatientRepository:
         self.pat_store = JSONStorageBase(pat_fp, {"patients": []})
         self.med_store = JSONStorageBase(med_fp, {"medicines": []})
         self.sch_store = JSONStorageBase(sch_fp, {"schedules": []})
+        # doctor / id / linked username -> positions in data["patients"]
+        self._by_doctor = FieldIndex(self.pat_store, "patients", "doctor")
+        self._by_id = FieldIndex(self.pat_store, "patients", "id")
+        self._by_user = FieldIndex(self.pat_store, "patients", "user_username")
+        # name trigrams per doctor, for typo-tolerant search
+        self._by_name = NgramIndex(self.pat_store, "patients", "name", "doctor")
+        self._indexes = (self._by_doctor, self._by_id, self._by_user, self._by_name)
 
     def _ensure_files(self):
         self.pat_store.ensure()
@@ -51,26 +49,60 @@ class PatientRepository:
     def _save(self, store: JSONStorageBase, data):
         store.save(data)
 
-    def list_patients(self, doctor_username):
-        data = self._load(self.pat_store)
-        return [p for p in data.get("patients", []) if p.get("doctor") == doctor_username]
-
-    def search_patients(self, doctor_username, term):
+    def _sync_indexes(self, data):
+        for index in self._indexes:
+            index.sync(data)
+
+    def list_patients(self, doctor_username, offset=0, limit=None):
+        return self._by_doctor.records(doctor_username, offset=offset, limit=limit)
+
+    # one page of a doctor's patients and the cursor of the next page (None on the last one)
+    def page_patients(self, doctor_username, cursor=None, limit=PAGE_SIZE):
+        return self._by_doctor.page(doctor_username, cursor, limit, id_field="id")
+
+    # fuzzy=True also returns near misses ("Jolly Uwse"), ID matches first, then by name similarity
+    def search_patients(self, doctor_username, term, fuzzy=False, limit=None):
+        if fuzzy:
+            # an exact ID comes first; partial IDs (any case) only when the term looks like one
+            needle = term.strip()
+            if ID_LIKE.fullmatch(needle):
+                needle = needle.lower()
+                data = self._load(self.pat_store)
+                by_id = []
+                for pos in self._by_doctor.positions(doctor_username, data):
+                    if data["patients"][pos].get("id", "").lower().startswith(needle):
+                        by_id.append(data["patients"][pos])
+                        if len(by_id) == limit:
+                            break
+            else:
+                by_id = [p for p in self._by_id.records(needle) if p.get("doctor") == doctor_username]
+            seen = {id(p) for p in by_id}
+            more = None if limit is None else limit + len(by_id)
+            by_name = [p for p in self._by_name.fuzzy_search(doctor_username, term, more) if id(p) not in seen]
+            return (by_id + by_name)[:limit]
         term = term.lower()
-        return [p for p in self.list_patients(doctor_username)
-                if term in p.get("name", "").lower() or term in p.get("id", "").lower()]
+        found = [p for p in self.list_patients(doctor_username)
+                 if term in p.get("name", "").lower() or term in p.get("id", "").lower()]
+        return found[:limit]
 
+    @retry_on_conflict
     def add_patient(self, doctor_username, patient_name):
         data = self._load(self.pat_store)
-        new_id = f"P{int(datetime.now().timestamp())}"
-        data["patients"].append({
+        self._sync_indexes(data)
+        new_id = new_patient_id()
+        record = {
             "id": new_id,
             "name": patient_name,
             "doctor": doctor_username,
             "user_username": "",
             "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+        }
+        data["patients"].append(record)
         self._save(self.pat_store, data)
+        pos = len(data["patients"]) - 1
+        # the indexes keep the cached record the save put in its place, not our dict
+        for index in self._indexes:
+            index.note_append(pos, data["patients"][pos])
         return new_id
     """
         Only add a patient if they don’t already exist.
@@ -79,13 +111,12 @@ class PatientRepository:
     def add_patient_if_absent(self, doctor_username, patient_name, patient_username=""):
         data = self._load(self.pat_store)
         # If linked to an existing user, return that patient’s ID
-
-        for p in data.get("patients", []):
-            if patient_username and p.get("user_username") == patient_username:
+        if patient_username:
+            for p in self._by_user.records(patient_username, data):
                 return p.get("id")
-            # If same doctor already added this patient manually
-        for p in data.get("patients", []):
-            if p.get("doctor") == doctor_username and p.get("name") == patient_name:
+        # If same doctor already added this patient manually
+        for p in self._by_doctor.records(doctor_username, data):
+            if p.get("name") == patient_name:
                 return p.get("id")
         pid = self.add_patient(doctor_username, patient_name)
         return pid
@@ -96,52 +127,185 @@ class PatientRepository:
     """
 
     def delete_patient(self, doctor_username, patient_id):
-        pat = self._load(self.pat_store)
-        before = len(pat.get("patients", []))
-        pat["patients"] = [p for p in pat.get("patients", [])
-                           if not (p.get("doctor") == doctor_username and p.get("id") == patient_id)]
-        self._save(self.pat_store, pat)
-        removed = before - len(pat["patients"])
+        return self.delete_patients(doctor_username, [patient_id]) > 0
 
-        med = self._load(self.med_store)
-        med["medicines"] = [m for m in med.get("medicines", []) if m.get("patient_id") != patient_id]
-        self._save(self.med_store, med)
-
-        sch = self._load(self.sch_store)
-        sch["schedules"] = [s for s in sch.get("schedules", []) if s.get("patient_id") != patient_id]
-        self._save(self.sch_store, sch)
-
-        return removed > 0
+    """
+        Batch version of delete_patient (e.g. discharging a whole ward).
+        Each file is scanned once and the changes are committed as one batch:
+        a few records go to the journals (one line each, no snapshot rewrite),
+        a bigger discharge rewrites at most three files. The indexes rebuild once.
+        Only patients that belong to doctor_username are removed; returns how many.
+    """
+    @retry_on_conflict
+    def delete_patients(self, doctor_username, patient_ids):
+        wanted = set(patient_ids)
+        if not wanted:
+            return 0
+        pat = self._load(self.pat_store)
+        gone = [i for i, p in enumerate(pat.get("patients", []))
+                if p.get("doctor") == doctor_username and p.get("id") in wanted]
+        if not gone:
+            return 0
+        removed = {pat["patients"][i].get("id") for i in gone}
+        # patients go first: if we crash halfway, what's left behind are orphaned
+        # medicines/schedules nobody can reach, never a patient missing their data
+        changes = [(self.pat_store, pat, "patients", gone)]
+        for store, key in ((self.med_store, "medicines"), (self.sch_store, "schedules")):
+            data = self._load(store)
+            positions = [i for i, r in enumerate(data.get(key, [])) if r.get("patient_id") in removed]
+            if positions:
+                changes.append((store, data, key, positions))
+        if sum(len(positions) for *_, positions in changes) <= JOURNAL_BATCH_MAX:
+            # from the back, so every logged position is still valid when it is replayed
+            log_many([(store, data, [{"op": "del", "key": key, "pos": pos} for pos in reversed(positions)])
+                      for store, data, key, positions in changes])
+        else:
+            writes = []
+            for store, data, key, positions in changes:
+                drop = set(positions)
+                writes.append((store, dict(data, **{key: [r for i, r in enumerate(data[key]) if i not in drop]})))
+            save_many(writes)
+        return len(removed)
 
     def get_patient_by_id(self, pid):
+        for p in self._by_id.records(pid):
+            return p
+        return None
+
+    # doctor in charge of a patient (None if unknown); always served from the id index
+    def doctor_of(self, pid):
         data = self._load(self.pat_store)
-        for p in data.get("patients", []):
-            if p.get("id") == pid:
-                return p
+        for pos in self._by_id.positions(pid, data):
+            return data["patients"][pos].get("doctor")
         return None
 
+    @retry_on_conflict
     def link_patient_user(self, pid, username):
         data = self._load(self.pat_store)
-        updated = False
-        for p in data.get("patients", []):
-            if p.get("id") == pid:
-                p["user_username"] = username
-                updated = True
-                break
-        if updated:
-            self._save(self.pat_store, data)
-        return updated
+        self._sync_indexes(data)
+        positions = self._by_id.positions(pid, data)
+        if not positions:
+            return False
+        pos = positions[0]
+        record = data["patients"][pos]
+        old_record = dict(record)
+        record["user_username"] = username
+        self._save(self.pat_store, data)
+        for index in self._indexes:
+            index.note_update(pos, old_record, data["patients"][pos])
+        return True
 
     def get_patient_id_for_user(self, username):
-        data = self._load(self.pat_store)
-        for p in data.get("patients", []):
-            if p.get("user_username") == username:
-                return p.get("id")
+        for p in self._by_user.records(username):
+            return p.get("id")
         return None
 
 
+# Same API as PatientRepository over the per-doctor folders of services/shards.py:
+# doctor-keyed calls go to that doctor's PatientRepository, patient-keyed ones
+# find the doctor in the shard map first. pat_store/med_store/sch_store are
+# whole-clinic views for bulk import/export and the module-level _load/_save.
+class ShardedPatientRepository:
+    def __init__(self, shard_dir: Path):
+        self.map = ShardMap(Path(shard_dir) / MAP_FILE_NAME)
+        self.shards = ShardSet(shard_dir, lambda folder: PatientRepository(
+            folder / "patients.json", folder / "medicines.json", folder / "schedules.json"))
+        by_doctor = lambda record: shard_name(record.get("doctor"))
+        by_patient = lambda record: self.map.shard_of(record.get("patient_id"))
+        self.pat_store = ShardedStore(self.shards, "patients", lambda r: r.pat_store, by_doctor, self._mapped)
+        self.med_store = ShardedStore(self.shards, "medicines", lambda r: r.med_store, by_patient)
+        self.sch_store = ShardedStore(self.shards, "schedules", lambda r: r.sch_store, by_patient)
+
+    def _shard(self, doctor_username):
+        return self.shards.get(shard_name(doctor_username))
+
+    # repository holding a patient, None if the patient is unknown
+    def _patient_shard(self, pid):
+        doctor = self.map.doctor_of(pid)
+        return None if doctor is None else self._shard(doctor)
+
+    # patients written through pat_store: the map follows before the shards do
+    def _mapped(self, patients, replace):
+        entries = ShardMap.entries(patients)
+        if replace:
+            self.map.save(dict(self.map.load(), patients=entries))
+        else:
+            self.map.extend("patients", entries)
+
+    def _ensure_files(self):
+        self.map.ensure()
+
+    def _load(self, store):
+        return store.load()
+
+    def _save(self, store, data):
+        store.save(data)
+
+    def list_patients(self, doctor_username, offset=0, limit=None):
+        return self._shard(doctor_username).list_patients(doctor_username, offset=offset, limit=limit)
+
+    def page_patients(self, doctor_username, cursor=None, limit=PAGE_SIZE):
+        return self._shard(doctor_username).page_patients(doctor_username, cursor=cursor, limit=limit)
+
+    def search_patients(self, doctor_username, term, fuzzy=False, limit=None):
+        return self._shard(doctor_username).search_patients(doctor_username, term, fuzzy=fuzzy, limit=limit)
+
+    # the patient is written to the shard first: a crash in between leaves a
+    # patient only their doctor's list shows, never a map entry pointing nowhere
+    def add_patient(self, doctor_username, patient_name):
+        pid = self._shard(doctor_username).add_patient(doctor_username, patient_name)
+        self.map.add(pid, doctor_username)
+        return pid
+
+    def add_patient_if_absent(self, doctor_username, patient_name, patient_username=""):
+        if patient_username:
+            pid = self.map.patient_for_user(patient_username)
+            if pid is not None:
+                return pid
+        pid = self._shard(doctor_username).add_patient_if_absent(doctor_username, patient_name)
+        self.map.add(pid, doctor_username)
+        return pid
+
+    def delete_patient(self, doctor_username, patient_id):
+        return self.delete_patients(doctor_username, [patient_id]) > 0
+
+    # the shard drops the patients with their medicines and schedules, then the map forgets them
+    def delete_patients(self, doctor_username, patient_ids):
+        owned = [pid for pid in dict.fromkeys(patient_ids) if self.map.doctor_of(pid) == doctor_username]
+        if not owned:
+            return 0
+        shard = self._shard(doctor_username)
+        removed = shard.delete_patients(doctor_username, owned)
+        self.map.remove_patients([pid for pid in owned if shard.get_patient_by_id(pid) is None])
+        return removed
+
+    def get_patient_by_id(self, pid):
+        shard = self._patient_shard(pid)
+        return None if shard is None else shard.get_patient_by_id(pid)
+
+    def doctor_of(self, pid):
+        return self.map.doctor_of(pid)
+
+    def link_patient_user(self, pid, username):
+        shard = self._patient_shard(pid)
+        if shard is None or not shard.link_patient_user(pid, username):
+            return False
+        self.map.link(pid, username)
+        return True
+
+    def get_patient_id_for_user(self, username):
+        return self.map.patient_for_user(username)
+
+
 # Instantiate repository and provide module-level API for backward compatibility
-_repo = PatientRepository(PAT_FILE, MED_FILE, SCH_FILE)
+# MEDITRACKER_STORAGE=sqlite swaps in the SQLite implementation of the same API,
+# MEDITRACKER_STORAGE=sharded the per-doctor folders
+if use_sqlite():
+    _repo = SQLitePatientRepository(SQLITE_FILE)
+elif use_sharded():
+    _repo = ShardedPatientRepository(SHARD_DIR)
+else:
+    _repo = PatientRepository(PAT_FILE, MED_FILE, SCH_FILE)
 
 
 def _ensure_files():
@@ -172,12 +336,16 @@ def _save(fp, data):
     return store.save(data)
 
 
-def list_patients(doctor_username):
-    return _repo.list_patients(doctor_username)
+def list_patients(doctor_username, offset=0, limit=None):
+    return _repo.list_patients(doctor_username, offset=offset, limit=limit)
 
 
-def search_patients(doctor_username, term):
-    return _repo.search_patients(doctor_username, term)
+def page_patients(doctor_username, cursor=None, limit=PAGE_SIZE):
+    return _repo.page_patients(doctor_username, cursor=cursor, limit=limit)
+
+
+def search_patients(doctor_username, term, fuzzy=False, limit=None):
+    return _repo.search_patients(doctor_username, term, fuzzy=fuzzy, limit=limit)
 
 
 def add_patient(doctor_username, patient_name):
@@ -192,9 +360,16 @@ def delete_patient(doctor_username, patient_id):
     return _repo.delete_patient(doctor_username, patient_id)
 
 
+def delete_patients(doctor_username, patient_ids):
+    return _repo.delete_patients(doctor_username, patient_ids)
+
+
 def get_patient_by_id(pid):
     return _repo.get_patient_by_id(pid)
 
+def doctor_of(pid):
+    return _repo.doctor_of(pid)
+
 #Created link_patient_user method
 def link_patient_user(pid, username):
     return _repo.link_patient_user(pid, username)
@@ -0,0 +1,337 @@
+import functools
+import sys
+from datetime import timedelta
+
+from interface.validators import VALID_DAYS, format_quantity, parse_quantity
+
+# Compact in-memory records for the three stores.
+#
+# On disk a record stays the plain JSON object it always was. In memory (the
+# JSON stores' cache, see services/storage.py, and the reminder heap) a
+# Patient / Medicine / Schedule keeps its fields in __slots__ instead of a dict,
+# with the text fields that repeat across records (patient ids, doctors, names,
+# dates) interned, a schedule's time as seconds of the day, its days as a
+# 7-bit weekday mask (bit 0 = Mon) and a medicine's quantity as a number.
+#
+# Attributes are the compact values (schedule.time == 28800); item access gives
+# the JSON values (schedule["time"] == "08:00:00"), so a record can be handed to
+# code written for the dicts (.get, [], dict(record)). to_dict() gives back the
+# exact object it was built from: keys in their original order, unknown keys,
+# and values the compact form can't reproduce (e.g. quantity "10.0", days typed
+# as ["Wed", "Mon"]) are kept as they were.
+#
+#     s = Schedule.from_dict({"time": "08:00:00", "days": ["Mon", "Wed"], ...})
+#     s.time, s.days   # 28800, 0b101
+#     s.due_at(now)    # integer comparisons only
+
+# datetime.weekday() order
+DAY_NAMES = VALID_DAYS
+
+# key tuples shared by every record with the same layout
+_LAYOUTS = {}
+
+
+def _layout(keys):
+    keys = tuple(keys)
+    return _LAYOUTS.setdefault(keys, keys)
+
+
+def _shared(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+# "HH:MM:SS" -> seconds since midnight, or None if the time is malformed
+def seconds_of_day(text):
+    try:
+        h, m, s = (int(part) for part in str(text).split(":"))
+    except ValueError:
+        return None
+    if 0 <= h < 24 and 0 <= m < 60 and 0 <= s < 60:
+        return h * 3600 + m * 60 + s
+    return None
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return ""
+    return "%02d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+# ["Mon", "Wed"] -> 0b101; unknown names are ignored
+def day_mask(days):
+    mask = 0
+    if isinstance(days, (list, tuple)):
+        for d in days:
+            if d in DAY_NAMES:
+                mask |= 1 << DAY_NAMES.index(d)
+    return mask
+
+
+def mask_days(mask):
+    return [name for i, name in enumerate(DAY_NAMES) if mask >> i & 1]
+
+
+def _quantity_text(number):
+    return "" if number is None else format_quantity(number)
+
+
+# Encoders return (compact value, whether decoding it gives the JSON value back);
+# stores repeat a handful of distinct times, day lists and quantities, so each
+# distinct text is encoded once.
+@functools.lru_cache(maxsize=4096)
+def _encode_time_text(text):
+    seconds = seconds_of_day(text)
+    return seconds, format_seconds(seconds) == text
+
+
+def _encode_time(value):
+    if type(value) is str:
+        return _encode_time_text(value)
+    return seconds_of_day(value), False
+
+
+@functools.lru_cache(maxsize=1024)
+def _encode_day_names(days):
+    mask = day_mask(days)
+    return mask, list(days) == mask_days(mask)
+
+
+def _encode_days(value):
+    if type(value) is list:
+        try:
+            return _encode_day_names(tuple(value))
+        except TypeError:  # unhashable entries
+            pass
+    return day_mask(value), False
+
+
+@functools.lru_cache(maxsize=4096)
+def _encode_quantity_text(text):
+    number = parse_quantity(text)
+    if number is not None and number == int(number):
+        number = int(number)
+    return number, _quantity_text(number) == text
+
+
+def _encode_quantity(value):
+    if type(value) is str:
+        return _encode_quantity_text(value)
+    return _encode_quantity_text(str(value))[0], False
+
+
+# Record._fill plans per (record type, key order), and its step kinds
+_PLANS = {}
+_INTERN = object()
+_EXTRA = object()
+
+
+class Record:
+    # Shared behaviour; subclasses list their FIELDS (in the store's key order),
+    # the ones worth interning (SHARED) and the compact encodings
+    # (CODECS: field -> (json -> (compact, exact), compact -> json)).
+
+    __slots__ = ("_keys", "_raw", "extra")
+    FIELDS = ()
+    SHARED = frozenset()
+    CODECS = {}
+
+    # takes the JSON values, like from_dict: Schedule(time="08:00:00", days=["Mon"])
+    def __init__(self, **values):
+        self._fill(values)
+
+    @classmethod
+    def from_dict(cls, data):
+        rec = cls.__new__(cls)
+        rec._fill(data)
+        return rec
+
+    # The stores convert every record they cache, so this is the hot path: per key
+    # order seen, a plan of slot setters is worked out once and then replayed.
+    def _fill(self, data):
+        cls = type(self)
+        keys = tuple(data)
+        plan = _PLANS.get((cls, keys))
+        if plan is None:
+            plan = _PLANS[(cls, keys)] = cls._plan(keys)
+        layout, steps, missing = plan
+        _set_keys(self, layout)
+        _set_extra(self, None)
+        raw = None
+        for setter in missing:
+            setter(self, None)
+        for key, setter, kind in steps:
+            value = data[key]
+            if kind is None:
+                setter(self, value)
+            elif kind is _INTERN:
+                setter(self, sys.intern(value) if type(value) is str else value)
+            elif kind is _EXTRA:
+                if self.extra is None:
+                    _set_extra(self, {})
+                self.extra[key] = value
+            else:
+                compact, exact = kind(value)
+                setter(self, compact)
+                if not exact:
+                    if raw is None:
+                        raw = {}
+                    raw[key] = value
+        _set_raw(self, raw)
+
+    # (key layout, [(key, slot setter, None / _INTERN / _EXTRA / encoder)], setters of absent fields)
+    @classmethod
+    def _plan(cls, keys):
+        steps = []
+        for key in keys:
+            if key not in cls.FIELDS:
+                steps.append((key, None, _EXTRA))
+                continue
+            setter = getattr(cls, key).__set__
+            if key in cls.CODECS:
+                steps.append((key, setter, cls.CODECS[key][0]))
+            else:
+                steps.append((key, setter, _INTERN if key in cls.SHARED else None))
+        missing = tuple(getattr(cls, f).__set__ for f in cls.FIELDS if f not in keys)
+        return _layout(keys), steps, missing
+
+    # the record itself when it already is one, so callers can accept either form
+    @classmethod
+    def of(cls, record):
+        return record if isinstance(record, cls) else cls.from_dict(record)
+
+    # keep a JSON value: compact when the compact form gives it back, verbatim otherwise
+    def _store(self, key, value):
+        if key not in self.FIELDS:
+            if self.extra is None:
+                object.__setattr__(self, "extra", {})
+            self.extra[key] = value
+            return
+        codec = self.CODECS.get(key)
+        if codec is None:
+            object.__setattr__(self, key, _shared(value) if key in self.SHARED else value)
+            return
+        compact, exact = codec[0](value)
+        object.__setattr__(self, key, compact)
+        if not exact:
+            if self._raw is None:
+                object.__setattr__(self, "_raw", {})
+            self._raw[key] = value
+        elif self._raw is not None:
+            self._raw.pop(key, None)
+
+    # setting a compact attribute drops the verbatim JSON value it replaces
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if self._raw is not None:
+            self._raw.pop(name, None)
+        if name in self.FIELDS and name not in self._keys:
+            object.__setattr__(self, "_keys", _layout(self._keys + (name,)))
+
+    def _json(self, key):
+        if self._raw is not None and key in self._raw:
+            return self._raw[key]
+        if key not in self.FIELDS:
+            return self.extra[key]
+        codec = self.CODECS.get(key)
+        value = getattr(self, key)
+        return codec[1](value) if codec is not None else value
+
+    def to_dict(self):
+        out = {}
+        for key in self._keys:
+            value = self._json(key)
+            out[key] = list(value) if isinstance(value, list) else value
+        return out
+
+    # read access like the dicts the stores return
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        value = self._json(key)
+        return list(value) if isinstance(value, list) else value
+
+    def __setitem__(self, key, value):
+        self._store(key, value)
+        if key not in self._keys:
+            object.__setattr__(self, "_keys", _layout(self._keys + (key,)))
+
+    def get(self, key, default=None):
+        return self[key] if key in self._keys else default
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Patient(Record):
+    __slots__ = ("id", "name", "doctor", "user_username", "created_at")
+    FIELDS = __slots__
+    SHARED = frozenset(("doctor",))
+
+
+class Medicine(Record):
+    __slots__ = ("id", "patient_id", "name", "dosage", "quantity", "expiry_date", "added_by", "added_at")
+    FIELDS = __slots__
+    SHARED = frozenset(("patient_id", "name", "dosage", "expiry_date", "added_by"))
+    CODECS = {"quantity": (_encode_quantity, _quantity_text)}
+
+
+class Schedule(Record):
+    __slots__ = ("id", "patient_id", "medicine_name", "dosage", "time", "days", "created_by", "created_at")
+    FIELDS = __slots__
+    SHARED = frozenset(("patient_id", "medicine_name", "dosage", "created_by"))
+    CODECS = {"time": (_encode_time, format_seconds), "days": (_encode_days, mask_days)}
+
+    def fires_on(self, weekday):
+        return bool(self.days and self.days >> weekday & 1)
+
+    # same minute as `now` on one of the reminder's days
+    def due_at(self, now):
+        return (self.time is not None and self.fires_on(now.weekday())
+                and self.time // 60 == now.hour * 60 + now.minute)
+
+    # first datetime strictly after `after` at which the reminder fires, or None
+    def next_fire(self, after):
+        if self.time is None or not self.days:
+            return None
+        base = after.replace(hour=self.time // 3600, minute=self.time // 60 % 60, second=self.time % 60, microsecond=0)
+        for offset in range(8):
+            candidate = base + timedelta(days=offset)
+            if candidate > after and self.days >> candidate.weekday() & 1:
+                return candidate
+        return None
+
+
+# record type per store root key
+RECORD_TYPES = {"patients": Patient, "medicines": Medicine, "schedules": Schedule}
+
+
+def compact(root_key, records):
+    cls = RECORD_TYPES[root_key]
+    return [cls.of(r) for r in records]
+
+
+_set_keys = Record._keys.__set__
+_set_raw = Record._raw.__set__
+_set_extra = Record.extra.__set__
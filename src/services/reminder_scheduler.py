@@ -0,0 +1,247 @@
+import heapq
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from services.records import DAY_NAMES, Schedule, seconds_of_day
+
+# Central reminder scheduler. Instead of waking every few seconds and checking
+# every reminder against the current minute, it precomputes the next fire time
+# of each schedule into a min-heap and sleeps until the earliest one is due.
+# Changes made through ScheduleManager.add_reminder/edit_reminder only recompute
+# the entries of the patient they touched (older heap entries for that patient
+# are skipped lazily via a per-patient generation number).
+#
+# Occurrences that fall between two evaluations (a long sleep, a GC pause, a
+# laptop lid closed) are still delivered, flagged as late, as long as they are
+# not older than max_catch_up_seconds. Delivered occurrences are remembered in
+# a time-bounded set so a rebuild never sends the same dose twice.
+
+# "HH:MM:SS" -> (hour, minute, second), or None if the time is malformed
+def parse_time_hms(text):
+    seconds = seconds_of_day(text)
+    if seconds is None:
+        return None
+    return seconds // 3600, seconds // 60 % 60, seconds % 60
+
+
+# first datetime strictly after `after` at which the reminder (a dict or a
+# records.Schedule) should fire, or None
+def next_fire_time(reminder, after: datetime):
+    return Schedule.of(reminder).next_fire(after)
+
+
+# text shown for a due reminder, e.g. in the terminal pop-up
+def format_reminder(reminder, fire_at=None, late=False):
+    if late and fire_at is not None:
+        return f"Take {reminder['medicine_name']} - {reminder['dosage']} (missed at {fire_at.strftime('%H:%M')}, late)"
+    return f"Take {reminder['medicine_name']} - {reminder['dosage']} (now)"
+
+
+class RecentKeys:
+    # Set of delivered keys that forgets entries older than ttl_seconds, so memory
+    # stays bounded however long the scheduler runs.
+
+    def __init__(self, ttl_seconds):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._keys = {}
+        self._order = deque()  # (timestamp, key) in insertion order
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, ts: datetime):
+        self._keys[key] = ts
+        self._order.append((ts, key))
+
+    def evict(self, now: datetime):
+        cutoff = now - self.ttl
+        while self._order and self._order[0][0] < cutoff:
+            ts, key = self._order.popleft()
+            if self._keys.get(key) == ts:
+                del self._keys[key]
+
+
+class ReminderScheduler:
+    # patient_ids=None schedules every reminder in the store, otherwise only those
+    # of the given patients. recheck_seconds bounds how long the scheduler sleeps
+    # before checking whether another process changed the schedules (a cheap
+    # version/stat check, the store is only re-read when it actually changed).
+
+    def __init__(self, manager, patient_ids=None, recheck_seconds=60,
+                 late_after_seconds=60, max_catch_up_seconds=6 * 3600):
+        self.manager = manager
+        self.patient_ids = set(patient_ids) if patient_ids is not None else None
+        self.recheck_seconds = recheck_seconds
+        self.late_after = timedelta(seconds=late_after_seconds)
+        self.max_catch_up = timedelta(seconds=max_catch_up_seconds)
+        self._sent = RecentKeys(max_catch_up_seconds + late_after_seconds)
+        self._last_evaluated = None
+        self._heap = []  # (fire_at, tiebreak, patient_id, generation, reminder)
+        self._generation = {}
+        self._tiebreak = itertools.count()
+        self._cond = threading.Condition()
+        self._known_version = None
+        self._stale = True
+        self._stopped = False
+        manager.add_listener(self._on_change)
+
+    def _wanted(self, patient_id):
+        return self.patient_ids is None or patient_id in self.patient_ids
+
+    # occurrences after this point have not been evaluated yet
+    def _window_start(self, now):
+        if self._last_evaluated is None:
+            return now
+        return max(self._last_evaluated, now - self.max_catch_up)
+
+    def _push_patient(self, patient_id, reminders, after):
+        gen = self._generation.get(patient_id, 0) + 1
+        self._generation[patient_id] = gen
+        for r in reminders:
+            # the heap keeps compact records (the JSON stores already cache them; SQLite rows are converted here)
+            r = Schedule.of(r)
+            fire_at = r.next_fire(after)
+            if fire_at is not None:
+                heapq.heappush(self._heap, (fire_at, next(self._tiebreak), patient_id, gen, r))
+
+    # recompute the whole heap from the store
+    def rebuild(self, now=None):
+        if now is None:
+            now = datetime.now()
+        with self._cond:
+            self._known_version = self.manager.poll_version()
+            self._heap = []
+            self._generation = {}
+            if self.patient_ids is None:
+                by_patient = {}
+                for r in self.manager._load().get("schedules", []):
+                    by_patient.setdefault(r.get("patient_id"), []).append(r)
+            else:
+                by_patient = {pid: self.manager.list_reminders(pid) for pid in self.patient_ids}
+            after = self._window_start(now)
+            for pid, reminders in by_patient.items():
+                self._push_patient(pid, reminders, after)
+            self._stale = False
+
+    # recompute only one patient's entries
+    def refresh_patient(self, patient_id, now=None):
+        if now is None:
+            now = datetime.now()
+        with self._cond:
+            self._push_patient(patient_id, self.manager.list_reminders(patient_id), self._window_start(now))
+            self._cond.notify()
+
+    # start scheduling a patient's reminders (patient_ids filter mode only)
+    def add_patient(self, patient_id, now=None):
+        with self._cond:
+            if self.patient_ids is None:
+                return
+            self.patient_ids.add(patient_id)
+        self.refresh_patient(patient_id, now)
+
+    # stop scheduling a patient's reminders; their heap entries are dropped lazily
+    def remove_patient(self, patient_id):
+        with self._cond:
+            if self.patient_ids is not None:
+                self.patient_ids.discard(patient_id)
+            self._generation.pop(patient_id, None)
+
+    # ScheduleManager listener: a reminder of patient_id was added or edited
+    def _on_change(self, patient_id, version_before, version_after):
+        with self._cond:
+            if self._known_version == version_before:
+                self._known_version = version_after
+            else:
+                # somebody else changed the file too, fall back to a full rebuild
+                self._stale = True
+            if self._wanted(patient_id):
+                self._push_patient(patient_id, self.manager.list_reminders(patient_id),
+                                   self._window_start(datetime.now()))
+            self._cond.notify()
+
+    # fire time of the earliest live entry, dropping superseded ones
+    def next_due(self):
+        with self._cond:
+            while self._heap:
+                fire_at, _, pid, gen, _ = self._heap[0]
+                if self._generation.get(pid) == gen:
+                    return fire_at
+                heapq.heappop(self._heap)
+            return None
+
+    # pop every occurrence due in (last evaluation, now] as (fire_at, reminder, late)
+    # and queue each reminder's next occurrence
+    def pop_due(self, now=None):
+        if now is None:
+            now = datetime.now()
+        oldest = now - self.max_catch_up
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, pid, gen, r = heapq.heappop(self._heap)
+                if self._generation.get(pid) != gen:
+                    continue
+                # walk forward through missed occurrences, jumping over the ones too old to deliver
+                next_at = r.next_fire(max(fire_at, oldest))
+                if next_at is not None:
+                    heapq.heappush(self._heap, (next_at, next(self._tiebreak), pid, gen, r))
+                if fire_at < oldest:
+                    continue
+                key = (pid, r.get("medicine_name"), r.get("time"), fire_at)
+                if key in self._sent:
+                    continue
+                self._sent.add(key, fire_at)
+                due.append((fire_at, r, now - fire_at > self.late_after))
+            self._last_evaluated = now
+            self._sent.evict(now)
+        return due
+
+    # pick up changes made by other processes (e.g. a doctor in another terminal)
+    def check_external_changes(self):
+        if self._stale or self.manager.poll_version() != self._known_version:
+            self.rebuild()
+
+    # how long the caller may sleep before the next due reminder or the next external-change check
+    def sleep_seconds(self, now=None):
+        if now is None:
+            now = datetime.now()
+        timeout = self.recheck_seconds
+        next_at = self.next_due()
+        if next_at is not None:
+            until_due = max((next_at - now).total_seconds(), 0)
+            timeout = until_due if timeout is None else min(timeout, until_due)
+        return timeout
+
+    # upkeep between sleeps; returns the time of the latest external-change check
+    def housekeeping(self, last_check):
+        now = datetime.now()
+        if self.recheck_seconds is not None and (now - last_check).total_seconds() >= self.recheck_seconds:
+            self.check_external_changes()
+            return now
+        if self._stale:
+            self.rebuild()
+        return last_check
+
+    # callback(reminder, fire_at, late) is called for every occurrence as it becomes due
+    def run(self, callback):
+        self.rebuild()
+        last_check = datetime.now()
+        while not self._stopped:
+            for fire_at, r, late in self.pop_due():
+                callback(r, fire_at, late)
+            with self._cond:
+                if self._stopped:
+                    break
+                self._cond.wait(timeout=self.sleep_seconds())
+            last_check = self.housekeeping(last_check)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.manager.remove_listener(self._on_change)
@@ -1,35 +1,30 @@
-import json, sys, time, platform, subprocess, ctypes, shutil
+import sys, platform, subprocess, ctypes, shutil
 from datetime import datetime
 from pathlib import Path
 
+from services import patient_service
+from services.config import PAGE_SIZE, SQLITE_FILE, use_sharded, use_sqlite
+from services.ids import new_schedule_id
+from services.notification_service import NotificationService
+from services.records import Schedule
+from services.reminder_scheduler import ReminderScheduler, format_reminder
+from services.shards import ShardSet
+from services.sqlite_backend import SQLiteScheduleStore
+from services.storage import FieldIndex, JSONStorageBase, retry_on_conflict
+
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
 SCH_FILE = DATA_DIR / "schedules.json"
 
-#class that will contain child classes containing data with details about how the doctor will give the patient reminders and how the patient will access them.
-# Other classes can inherit from this, so we don't repeat storage logic everywhere
-class JSONStorageBase:
-    def __init__(self, file_path: Path, default_structure):
-        self.file_path = Path(file_path)
-        self.default_structure = default_structure
-
-    def ensure(self):
-        self.file_path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.file_path.exists():
-            self.file_path.write_text(json.dumps(self.default_structure, indent=2))
-
-    def load(self):
-        self.ensure()
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-
-    def save(self, data):
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-
+# ScheduleManager inherits the cached load/save logic from the shared JSONStorageBase
 # Creates ScheduleManager child class for JSONStorageBase that give details on how the doctor will regulate schedules
 class ScheduleManager(JSONStorageBase):
     def __init__(self, file_path: Path):
         super().__init__(file_path, {"schedules": []})
+        # patient_id -> positions in data["schedules"]
+        self._by_patient = FieldIndex(self, "schedules", "patient_id")
+        # reminder id -> its position, for edits by id
+        self._by_id = FieldIndex(self, "schedules", "id")
+        self._listeners = []
 
     # These helper methods keep the original function-based names intact  
     def _ensure(self):
@@ -41,54 +36,117 @@ class ScheduleManager(JSONStorageBase):
     def _save(self, data):
         return self.save(data)
 
+    # re-check the file and return the store version (used by ReminderScheduler)
+    def poll_version(self):
+        self.load()
+        return self.version
+
+    # fn(patient_id, version_before, version_after) is called after add_reminder/edit_reminder
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    # Call only with no store lock held: a listener may take its own lock (the
+    # scheduler's condition) and then read the store, so notifying from inside a
+    # locked write could deadlock against it.
+    def _changed(self, patient_id, version_before, version_after=None):
+        if version_after is None:
+            version_after = self.version
+        for fn in list(self._listeners):
+            fn(patient_id, version_before, version_after)
+
 # Core reminder operations    
+    # One-time migration for reminders saved before they had ids (run at startup);
+    # writes backfill them too, so reads (also from the notification thread) never write.
+    @retry_on_conflict
+    def backfill_ids(self):
+        if self.streaming:
+            return 0
+        return self._by_id.fill_missing(new_schedule_id, self._load())
+
     def add_reminder(self, patient_id, medicine_name, dosage, time_hms, days, created_by):
+        reminder_id, version_before, version_after = self._append_reminder(
+            patient_id, medicine_name, dosage, time_hms, days, created_by)
+        self._changed(patient_id, version_before, version_after)
+        return reminder_id
+
+    # the write itself, retried on conflict (the last try with the store locked);
+    # returns the new id and the store versions around the write
+    @retry_on_conflict
+    def _append_reminder(self, patient_id, medicine_name, dosage, time_hms, days, created_by):
         data = self._load()
-        data["schedules"].append({
+        self._by_id.fill_missing(new_schedule_id, data)
+        self._by_patient.sync(data)
+        self._by_id.sync(data)
+        record = {
+            "id": new_schedule_id(),
             "patient_id": patient_id,
             "medicine_name": medicine_name,
             "dosage": dosage,
             "time": time_hms,
             "days": days,
-            "created_by": created_by
-        })
-        self._save(data)
-
-    def list_reminders(self, patient_id):
-        data = self._load()
-        return [r for r in data.get("schedules", []) if r.get("patient_id") == patient_id]
+            "created_by": created_by,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        version_before = self.version
+        # one journal line instead of rewriting schedules.json
+        self.append(data, "schedules", record)
+        pos = len(data["schedules"]) - 1
+        # the indexes keep the compact record append() cached, not our dict
+        self._by_patient.note_append(pos, data["schedules"][pos])
+        self._by_id.note_append(pos, data["schedules"][pos])
+        return record["id"], version_before, self.version
+
+    def list_reminders(self, patient_id, offset=0, limit=None):
+        return self._by_patient.records(patient_id, offset=offset, limit=limit)
+
+    # one page of a patient's reminders and the cursor of the next page (None on the last one)
+    def page_reminders(self, patient_id, cursor=None, limit=PAGE_SIZE):
+        return self._by_patient.page(patient_id, cursor, limit, id_field="id")
+
+    # edits the reminder with this id, if it belongs to patient_id
+    def edit_reminder(self, patient_id, reminder_id, medicine_name, dosage, time_hms, days):
+        versions = self._update_reminder(patient_id, reminder_id, medicine_name, dosage, time_hms, days)
+        if versions is None:
+            return False
+        self._changed(patient_id, *versions)
+        return True
 
-    def edit_reminder(self, patient_id, index, medicine_name, dosage, time_hms, days):
+    # (version before, version after) of the edit, or None if there was nothing to edit
+    @retry_on_conflict
+    def _update_reminder(self, patient_id, reminder_id, medicine_name, dosage, time_hms, days):
         data = self._load()
-        rems = [r for r in data.get("schedules", []) if r.get("patient_id") == patient_id]
-        if 0 <= index < len(rems):
-            all_rems = data.get("schedules", [])
-            global_idx = [i for i, r in enumerate(all_rems) if r.get("patient_id") == patient_id][index]
-            all_rems[global_idx].update({
+        self._by_id.fill_missing(new_schedule_id, data)
+        self._by_patient.sync(data)
+        for pos in self._by_id.positions(reminder_id, data):
+            if data["schedules"][pos].get("patient_id") != patient_id:
+                continue
+            record = dict(data["schedules"][pos])
+            record.update({
                 "medicine_name": medicine_name,
                 "dosage": dosage,
                 "time": time_hms,
                 "days": days
             })
-            self._save(data)
-            return True
-        return False
-
+            version_before = self.version
+            self.update(data, "schedules", pos, record)
+            self._by_patient.mark_synced()
+            self._by_id.mark_synced()
+            return version_before, self.version
+        return None
+
+    # same minute and weekday, compared as integers on the cached compact record
+    # (malformed times or days simply never match)
     def _matches_now(self, reminder, now):
-        try:
-            r_hms = reminder.get("time", "00:00:00")
-            r_hm = r_hms[:5]  # HH:MM
-            now_hm = now.strftime("%H:%M")
-            day_ok = now.strftime("%a")[:3] in reminder.get("days", [])
-            return day_ok and (r_hm == now_hm)
-        except Exception:
-            return False
+        return Schedule.of(reminder).due_at(now)
 
     def due_reminders_for_patient(self, patient_id, now=None):
         if now is None:
             now = datetime.now()
-        data = self._load()
-        return [r for r in data.get("schedules", []) if r.get("patient_id") == patient_id and self._matches_now(r, now)]
+        return [r for r in self.list_reminders(patient_id) if self._matches_now(r, now)]
 
     # notification helpers (preserve original behavior)
     def beep(self):
@@ -105,26 +163,107 @@ class ScheduleManager(JSONStorageBase):
 """)
         self.beep()
 
+    # Sleeps until the patient's next reminder is due instead of polling every few seconds.
+    # interval_seconds now only bounds how often the schedules are re-checked for changes
+    # made from another terminal (a stat call; the file is re-read only if it changed).
     def patient_notification_daemon(self, patient_id, interval_seconds=10):
-        last_sent_keys = set()  # (medicine_name, yyyy-mm-dd, HH:MM)
+        scheduler = ReminderScheduler(self, patient_ids=[patient_id], recheck_seconds=interval_seconds)
         try:
-            while True:
-                now = datetime.now()
-                due = self.due_reminders_for_patient(patient_id, now=now)
-                today = now.strftime("%Y-%m-%d")
-                hm = now.strftime("%H:%M")
-                for r in due:
-                    key = (r.get("medicine_name", ""), today, hm)
-                    if key in last_sent_keys:
-                        continue
-                    self.notify_popup("Medicine Reminder", f"Take {r['medicine_name']} - {r['dosage']} (now)")
-                    last_sent_keys.add(key)
-                time.sleep(interval_seconds)
+            scheduler.run(lambda r, fire_at, late: self.notify_popup(
+                "Medicine Reminder", format_reminder(r, fire_at, late)))
         except KeyboardInterrupt:
             pass
+        finally:
+            scheduler.stop()
+
+# Keeps the reminder/notification logic of ScheduleManager but stores schedules in SQLite
+class SQLiteScheduleManager(SQLiteScheduleStore, ScheduleManager):
+    def __init__(self, db_path: Path):
+        SQLiteScheduleStore.__init__(self, db_path)
+        self._listeners = []
+
+    def add_reminder(self, patient_id, medicine_name, dosage, time_hms, days, created_by):
+        version_before = self.version
+        reminder_id = SQLiteScheduleStore.add_reminder(self, patient_id, medicine_name, dosage, time_hms, days, created_by)
+        self._changed(patient_id, version_before)
+        return reminder_id
+
+    def edit_reminder(self, patient_id, reminder_id, medicine_name, dosage, time_hms, days):
+        version_before = self.version
+        ok = SQLiteScheduleStore.edit_reminder(self, patient_id, reminder_id, medicine_name, dosage, time_hms, days)
+        if ok:
+            self._changed(patient_id, version_before)
+        return ok
+
+
+# Keeps the reminder/notification logic of ScheduleManager but reads and writes
+# each patient's reminders in their doctor's shard (services/shards.py); the
+# version covers every shard, so a scheduler watching all patients still sees
+# changes made from any doctor's terminal.
+class ShardedScheduleManager(ScheduleManager):
+    def __init__(self, repo):
+        self.map = repo.map
+        self.shards = ShardSet(repo.shards.root, lambda folder: ScheduleManager(folder / "schedules.json"))
+        self.store = repo.sch_store
+        self._listeners = []
+
+    def _for_patient(self, patient_id):
+        return self.shards.get(self.map.shard_of(patient_id))
+
+    def _ensure(self):
+        return self.store.ensure()
+
+    def _load(self):
+        return self.store.load()
+
+    def _save(self, data):
+        return self.store.save(data)
+
+    @property
+    def version(self):
+        return self.store.version
+
+    def poll_version(self):
+        return self.store.poll_version()
+
+    def add_reminder(self, patient_id, medicine_name, dosage, time_hms, days, created_by):
+        shard = self._for_patient(patient_id)
+        shard.load()
+        version_before = self.version
+        reminder_id = shard.add_reminder(patient_id, medicine_name, dosage, time_hms, days, created_by)
+        self._changed(patient_id, version_before)
+        return reminder_id
+
+    def list_reminders(self, patient_id, offset=0, limit=None):
+        return self._for_patient(patient_id).list_reminders(patient_id, offset=offset, limit=limit)
+
+    def page_reminders(self, patient_id, cursor=None, limit=PAGE_SIZE):
+        return self._for_patient(patient_id).page_reminders(patient_id, cursor=cursor, limit=limit)
+
+    def backfill_ids(self):
+        return sum(shard.backfill_ids() for shard in self.shards.all())
+
+    def edit_reminder(self, patient_id, reminder_id, medicine_name, dosage, time_hms, days):
+        shard = self._for_patient(patient_id)
+        shard.load()
+        version_before = self.version
+        ok = shard.edit_reminder(patient_id, reminder_id, medicine_name, dosage, time_hms, days)
+        if ok:
+            self._changed(patient_id, version_before)
+        return ok
+
 
 # Created JSONStorageBase parent # instantiate manager and expose original module-level API for backward compatibility
-_scheduler = ScheduleManager(SCH_FILE)
+# MEDITRACKER_STORAGE=sqlite selects the SQLite-backed manager, sharded the per-doctor one
+if use_sqlite():
+    _scheduler = SQLiteScheduleManager(SQLITE_FILE)
+elif use_sharded():
+    _scheduler = ShardedScheduleManager(patient_service._repo)
+else:
+    _scheduler = ScheduleManager(SCH_FILE)
+
+# Shared dispatcher serving every logged-in patient from one background thread
+_notifications = NotificationService(_scheduler)
 
 
 def _ensure():
@@ -143,12 +282,20 @@ def add_reminder(patient_id, medicine_name, dosage, time_hms, days, created_by):
     return _scheduler.add_reminder(patient_id, medicine_name, dosage, time_hms, days, created_by)
 
 #Adding list_reminder
-def list_reminders(patient_id):
-    return _scheduler.list_reminders(patient_id)
+def list_reminders(patient_id, offset=0, limit=None):
+    return _scheduler.list_reminders(patient_id, offset=offset, limit=limit)
+
+
+def page_reminders(patient_id, cursor=None, limit=PAGE_SIZE):
+    return _scheduler.page_reminders(patient_id, cursor=cursor, limit=limit)
 
 #Adding edit_reminder method
-def edit_reminder(patient_id, index, medicine_name, dosage, time_hms, days):
-    return _scheduler.edit_reminder(patient_id, index, medicine_name, dosage, time_hms, days)
+def edit_reminder(patient_id, reminder_id, medicine_name, dosage, time_hms, days):
+    return _scheduler.edit_reminder(patient_id, reminder_id, medicine_name, dosage, time_hms, days)
+
+# give reminders saved before they had ids one (run once at startup)
+def backfill_reminder_ids():
+    return _scheduler.backfill_ids()
 
 # Creation of due_reminder method
 def due_reminders_for_patient(patient_id, now=None):
@@ -159,6 +306,10 @@ def due_reminders_for_patient(patient_id, now=None):
 def patient_notification_daemon(patient_id, interval_seconds=10):
     return _scheduler.patient_notification_daemon(patient_id, interval_seconds=interval_seconds)
 
+# Subscribe a logged-in patient to pop-up reminders (returns a token for unsubscribe)
+def subscribe_patient_notifications(patient_id, sink=None):
+    return _notifications.subscribe(patient_id, sink)
 
-
-
+# Stop reminders for a patient session on logout
+def unsubscribe_patient_notifications(patient_id, token=None):
+    return _notifications.unsubscribe(patient_id, token)
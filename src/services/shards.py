@@ -0,0 +1,254 @@
+import hashlib
+import re
+import threading
+from pathlib import Path
+
+from services.config import SHARD_DIR
+from services.storage import FieldIndex, JSONStorageBase, retry_on_conflict, save_many
+
+# Optional per-doctor layout of the JSON stores (MEDITRACKER_STORAGE=sharded).
+#
+#     data/shards/patients_map.json          patient id -> doctor, linked username
+#     data/shards/<doctor>/patients.json     that doctor's patients,
+#     data/shards/<doctor>/medicines.json    their medicines
+#     data/shards/<doctor>/schedules.json    and their reminders
+#
+# A doctor's list/search/add only opens their own folder, and a patient-keyed
+# call (a medicine, a reminder) looks the patient's doctor up in the map, so a
+# write rewrites or journals one doctor's files instead of the whole clinic's.
+# The map is the one file every doctor shares; it only changes when patients are
+# added, linked or removed, one journal line at a time.
+#
+# Records whose patient isn't in the map (orphans of an old crash, imports
+# naming unknown patients) live in the UNASSIGNED folder.
+#
+# From the src folder, to move the data/*.json files into shards and back:
+#     python -m services.shards split
+#     python -m services.shards join
+
+MAP_FILE_NAME = "patients_map.json"
+# doctor slugs never start with "_", so this can't clash with a doctor's folder
+UNASSIGNED = "_unassigned"
+
+
+# folder name of a doctor's shard: readable, filesystem-safe, and unique per username
+def shard_name(doctor):
+    doctor = str(doctor or "")
+    slug = re.sub(r"[^a-z0-9]", "", doctor.lower())[:32]
+    return f"{slug}-{hashlib.sha1(doctor.encode('utf-8')).hexdigest()[:8]}"
+
+
+class ShardMap(JSONStorageBase):
+    # {"patients": [{"id", "doctor", "user_username"}]}: which shard a patient is in,
+    # and which patient a login belongs to, without opening any shard
+
+    def __init__(self, file_path: Path):
+        super().__init__(file_path, {"patients": []})
+        self._by_id = FieldIndex(self, "patients", "id")
+        self._by_user = FieldIndex(self, "patients", "user_username")
+        self._indexes = (self._by_id, self._by_user)
+
+    def doctor_of(self, pid):
+        data = self.load()
+        for pos in self._by_id.positions(pid, data):
+            return data["patients"][pos].get("doctor")
+        return None
+
+    # shard a patient's records belong in
+    def shard_of(self, pid):
+        doctor = self.doctor_of(pid)
+        return UNASSIGNED if doctor is None else shard_name(doctor)
+
+    def patient_for_user(self, username):
+        for entry in self._by_user.records(username):
+            return entry.get("id")
+        return None
+
+    @retry_on_conflict
+    def add(self, pid, doctor, username=""):
+        data = self.load()
+        for index in self._indexes:
+            index.sync(data)
+        if self._by_id.positions(pid, data):
+            return
+        entry = {"id": pid, "doctor": doctor, "user_username": username}
+        self.append(data, "patients", entry)
+        pos = len(data["patients"]) - 1
+        for index in self._indexes:
+            index.note_append(pos, data["patients"][pos])
+
+    @retry_on_conflict
+    def link(self, pid, username):
+        data = self.load()
+        for index in self._indexes:
+            index.sync(data)
+        for pos in self._by_id.positions(pid, data):
+            old_entry = data["patients"][pos]
+            entry = dict(old_entry, user_username=username)
+            self.update(data, "patients", pos, entry)
+            for index in self._indexes:
+                index.note_update(pos, old_entry, data["patients"][pos])
+            return
+
+    # one journal line per patient, so discharging a few patients doesn't rewrite the map
+    @retry_on_conflict
+    def remove_patients(self, pids):
+        data = self.load()
+        for index in self._indexes:
+            index.sync(data)
+        for pid in pids:
+            for pos in list(self._by_id.positions(pid, data)):
+                removed = data["patients"][pos]
+                self.remove(data, "patients", pos)
+                for index in self._indexes:
+                    index.note_remove(pos, removed)
+                break
+
+    # map entries for patient records (bulk import, split)
+    @staticmethod
+    def entries(patients):
+        return [{"id": p.get("id"), "doctor": p.get("doctor"), "user_username": p.get("user_username", "")}
+                for p in patients]
+
+
+class ShardSet:
+    # One object per shard folder (a repository, inventory or schedule manager),
+    # created on first use; factory(folder) builds it.
+
+    def __init__(self, root: Path, factory):
+        self.root = Path(root)
+        self.factory = factory
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                shard = self._shards[name] = self.factory(self.root / name)
+            return shard
+
+    # every shard on disk (other processes may have added some) plus the ones opened here
+    def names(self):
+        names = set(self._shards)
+        if self.root.is_dir():
+            names.update(p.name for p in self.root.iterdir() if p.is_dir())
+        return sorted(names)
+
+    def all(self):
+        return [self.get(name) for name in self.names()]
+
+
+class ShardedStore:
+    # The whole-clinic view of one record type, for callers that work on every
+    # record (bulk import/export, forecasts, the reminder scheduler's full reload,
+    # the module-level _load/_save helpers). Same load/save/extend/iter_records API
+    # as a JSONStorageBase; records are written to the shard route(record) names.
+    # on_write(records, replace) hears about every write before it reaches the
+    # shards: replace=True for a save (records are now all there is), False for
+    # an extend. The patients view keeps the map up to date with it.
+
+    def __init__(self, shards: ShardSet, root_key, store_of, route, on_write=None):
+        self.shards = shards
+        self.root_key = root_key
+        self.store_of = store_of
+        self.route = route
+        self.on_write = on_write
+
+    def _stores(self):
+        return [self.store_of(shard) for shard in self.shards.all()]
+
+    def ensure(self):
+        for store in self._stores():
+            store.ensure()
+
+    # a new document concatenating every shard's records (the records themselves are the cached ones)
+    def load(self):
+        records = []
+        for store in self._stores():
+            records.extend(store.load().get(self.root_key, []))
+        return {self.root_key: records}
+
+    def _split(self, records):
+        parts = {}
+        for record in records:
+            parts.setdefault(self.route(record), []).append(record)
+        return parts
+
+    # replace every record: shards left without records are emptied, all are committed as one batch
+    def save(self, data):
+        records = data.get(self.root_key, [])
+        if self.on_write is not None:
+            self.on_write(records, replace=True)
+        parts = self._split(records)
+        writes = []
+        for name in sorted(set(self.shards.names()) | set(parts)):
+            store = self.store_of(self.shards.get(name))
+            writes.append((store, dict(store.load(), **{self.root_key: parts.get(name, [])})))
+        save_many(writes)
+
+    def extend(self, root_key, records):
+        records = list(records)
+        if not records:
+            return
+        if self.on_write is not None:
+            self.on_write(records, replace=False)
+        for name, part in self._split(records).items():
+            self.store_of(self.shards.get(name)).extend(root_key, part)
+
+    def iter_records(self, root_key):
+        for store in self._stores():
+            yield from store.iter_records(root_key)
+
+    @property
+    def streaming(self):
+        return False
+
+    # changes whenever any shard is reloaded or written, or a shard is added
+    @property
+    def version(self):
+        return tuple((name, self.store_of(self.shards.get(name)).version) for name in self.shards.names())
+
+    def poll_version(self):
+        for store in self._stores():
+            store.load()
+        return self.version
+
+    def invalidate(self):
+        for store in self._stores():
+            store.invalidate()
+
+
+# Copy the unsharded data/*.json files into the shards (split) or back (join).
+# The target must be empty so nothing is overwritten; the source is left as it is.
+def migrate(action, flat=None, sharded=None):
+    from services.patient_service import MED_FILE, PAT_FILE, SCH_FILE, PatientRepository, ShardedPatientRepository
+
+    flat = flat or PatientRepository(PAT_FILE, MED_FILE, SCH_FILE)
+    sharded = sharded or ShardedPatientRepository(SHARD_DIR)
+    source, target = (flat, sharded) if action == "split" else (sharded, flat)
+    kinds = (("pat_store", "patients"), ("med_store", "medicines"), ("sch_store", "schedules"))
+    if any(next(getattr(target, attr).iter_records(key), None) is not None for attr, key in kinds):
+        raise ValueError(f"the {action} target already has records; move them away first")
+    counts = {}
+    # patients first: the sharded medicines and schedules are routed through the map they fill
+    for attr, key in kinds:
+        records = getattr(source, attr).load().get(key, [])
+        store = getattr(target, attr)
+        store.save(dict(store.load(), **{key: list(records)}))
+        counts[key] = len(records)
+    return counts
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move the MediTracker JSON files into per-doctor shards or back")
+    parser.add_argument("action", choices=["split", "join"])
+    args = parser.parse_args()
+    counts = migrate(args.action)
+    print(", ".join(f"{n} {key}" for key, n in counts.items()) + f" moved ({args.action})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,577 @@
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from interface.validators import format_quantity, normalize_date, parse_date, parse_quantity
+from services.config import PAGE_SIZE
+from services.dose_log import Dose
+from services.fuzzy import rank as fuzzy_rank
+from services.ids import new_medicine_id, new_patient_id, new_schedule_id
+
+# Optional SQLite storage backend (MEDITRACKER_STORAGE=sqlite, see services/config.py).
+# Each class below exposes the same methods as its JSON/text counterpart so the
+# module-level wrappers used by main.py work unchanged, but single-record writes
+# become one row insert/update instead of rewriting a whole file.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    doctor TEXT NOT NULL,
+    user_username TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_patients_id ON patients(id);
+CREATE INDEX IF NOT EXISTS idx_patients_doctor ON patients(doctor);
+CREATE INDEX IF NOT EXISTS idx_patients_user ON patients(user_username);
+
+CREATE TABLE IF NOT EXISTS medicines (
+    id TEXT NOT NULL DEFAULT '',
+    patient_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dosage TEXT NOT NULL DEFAULT '',
+    quantity TEXT NOT NULL DEFAULT '',
+    expiry_date TEXT NOT NULL DEFAULT '',
+    added_by TEXT NOT NULL DEFAULT '',
+    added_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_medicines_patient ON medicines(patient_id);
+
+CREATE TABLE IF NOT EXISTS schedules (
+    id TEXT NOT NULL DEFAULT '',
+    patient_id TEXT NOT NULL,
+    medicine_name TEXT NOT NULL,
+    dosage TEXT NOT NULL DEFAULT '',
+    time TEXT NOT NULL DEFAULT '',
+    days TEXT NOT NULL DEFAULT '',
+    created_by TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_schedules_patient ON schedules(patient_id);
+
+CREATE TABLE IF NOT EXISTS doses (
+    taken_at TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    schedule_id TEXT NOT NULL DEFAULT '',
+    medicine_id TEXT NOT NULL DEFAULT '',
+    amount REAL NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    email TEXT NOT NULL DEFAULT '',
+    role TEXT NOT NULL DEFAULT '',
+    org TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# tables whose changes are counted in table_versions (see SQLiteStorageBase.version)
+VERSIONED_TABLES = ("patients", "medicines", "schedules", "doses", "users")
+
+
+# Triggers bump a table's row in table_versions in the same transaction as every
+# insert, update or delete, whichever connection, thread or process made it.
+def _version_schema(table):
+    sql = f"INSERT OR IGNORE INTO table_versions (name) VALUES ('{table}');\n"
+    for op in ("INSERT", "UPDATE", "DELETE"):
+        sql += (f"CREATE TRIGGER IF NOT EXISTS {table}_version_{op.lower()} AFTER {op} ON {table} BEGIN "
+                f"UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END;\n")
+    return sql
+
+
+SCHEMA += "".join(_version_schema(table) for table in VERSIONED_TABLES)
+
+PATIENT_COLUMNS = ("id", "name", "doctor", "user_username", "created_at")
+MEDICINE_COLUMNS = ("id", "patient_id", "name", "dosage", "quantity", "expiry_date", "added_by", "added_at")
+SCHEDULE_COLUMNS = ("id", "patient_id", "medicine_name", "dosage", "time", "days", "created_by", "created_at")
+USER_COLUMNS = ("username", "password_hash", "name", "email", "role", "org", "created_at")
+# ids per statement in batch deletes (SQLite allows 999 parameters on older builds)
+DELETE_CHUNK = 500
+# tables whose records carry a generated id, and the generator for it
+RECORD_IDS = {"medicines": new_medicine_id, "schedules": new_schedule_id}
+# expiry dates are stored as YYYY-MM-DD so text order is date order
+ISO_DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]"
+
+
+# Databases created before medicines/schedules had ids get the column, an id for
+# every existing row and the id index; expiry dates written before they were
+# normalized are rewritten as YYYY-MM-DD; schedules get their created_at column
+# (empty for reminders made before it existed). Runs once per database per process.
+def _migrate(conn):
+    with conn:
+        if "created_at" not in {row[1] for row in conn.execute("PRAGMA table_info(schedules)")}:
+            conn.execute("ALTER TABLE schedules ADD COLUMN created_at TEXT NOT NULL DEFAULT ''")
+        for table, new_id in RECORD_IDS.items():
+            if "id" not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN id TEXT NOT NULL DEFAULT ''")
+            missing = [row[0] for row in conn.execute(f"SELECT rowid FROM {table} WHERE id = ''")]
+            conn.executemany(f"UPDATE {table} SET id = ? WHERE rowid = ?", [(new_id(), r) for r in missing])
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_id ON {table}(id)")
+        rows = conn.execute("SELECT rowid, expiry_date FROM medicines WHERE expiry_date != '' "
+                            "AND expiry_date NOT GLOB ?", (ISO_DATE_GLOB,)).fetchall()
+        conn.executemany("UPDATE medicines SET expiry_date = ? WHERE rowid = ?",
+                         [(normalize_date(r[1]), r[0]) for r in rows if normalize_date(r[1]) != r[1]])
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_medicines_expiry ON medicines(expiry_date)")
+
+
+class SQLiteStorageBase:
+    # Opens one connection per thread (the notification daemon runs in its own
+    # thread) and creates the schema on first use. WAL mode lets readers keep
+    # going while a writer commits.
+
+    _schema_ready = set()
+    _schema_lock = threading.Lock()
+
+    # the table whose version this object reports
+    versioned_table = None
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with SQLiteStorageBase._schema_lock:
+                key = str(self.db_path.resolve())
+                if key not in SQLiteStorageBase._schema_ready:
+                    conn.executescript(SCHEMA)
+                    _migrate(conn)
+                    SQLiteStorageBase._schema_ready.add(key)
+            self._local.conn = conn
+        return conn
+
+    def ensure(self):
+        self._connect()
+
+    def _query(self, sql, params=()):
+        return self._connect().execute(sql, params).fetchall()
+
+    def _execute(self, sql, params=()):
+        conn = self._connect()
+        with conn:
+            cur = conn.execute(sql, params)
+        return cur
+
+    # rows of table matching where, in rowid order, from offset (limit None = all)
+    def _select(self, table, columns, where, params=(), offset=0, limit=None):
+        return self._query(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE {where} ORDER BY rowid LIMIT ? OFFSET ?",
+            (*params, -1 if limit is None else limit, offset))
+
+    # keyset pagination: the cursor is the rowid of the last row returned, which
+    # never moves, so pages stay stable while rows are added or deleted
+    def _page(self, table, columns, where, params=(), cursor=None, limit=PAGE_SIZE):
+        rows = self._query(
+            f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE {where} AND rowid > ? ORDER BY rowid LIMIT ?",
+            (*params, int(cursor or 0), limit + 1))
+        next_cursor = str(rows[limit - 1]["rowid"]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    # Change counter of versioned_table, kept by the table_versions triggers. Unlike
+    # PRAGMA data_version (per connection, and connections are per thread) every
+    # thread reads the same number for the same committed state, so a version
+    # taken before a write on one thread matches what the scheduler thread reads.
+    @property
+    def version(self):
+        return self._query("SELECT version FROM table_versions WHERE name = ?", (self.versioned_table,))[0][0]
+
+    def poll_version(self):
+        return self.version
+
+
+class SQLiteTableStore(SQLiteStorageBase):
+    # Document-style view of one table ({root_key: [records]}), used where the old
+    # code loads/saves whole JSON documents (e.g. the module-level _load/_save helpers).
+
+    def __init__(self, db_path: Path, table: str, columns, root_key=None):
+        super().__init__(db_path)
+        self.table = table
+        self.versioned_table = table
+        self.columns = columns
+        self.root_key = root_key or table
+
+    def _to_record(self, row):
+        return _row_to_record(self.table, row, self.columns)
+
+    def load(self):
+        rows = self._query(f"SELECT {', '.join(self.columns)} FROM {self.table} ORDER BY rowid")
+        return {self.root_key: [self._to_record(r) for r in rows]}
+
+    def save(self, data):
+        rows = [_record_to_row(self.table, r, self.columns) for r in data.get(self.root_key, [])]
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.executemany(
+                f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})",
+                rows)
+
+    # append many records in one transaction (bulk import)
+    def extend(self, root_key, records):
+        rows = [_record_to_row(self.table, r, self.columns) for r in records]
+        if not rows:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})",
+                rows)
+
+    # stream the table in rowid order without building the whole list (bulk export)
+    def iter_records(self, root_key, batch_size=500):
+        cur = self._connect().execute(f"SELECT {', '.join(self.columns)} FROM {self.table} ORDER BY rowid")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for r in rows:
+                yield self._to_record(r)
+
+
+# schedules keep "days" as a list in memory and a comma-separated string in the table
+def _row_to_record(table, row, columns):
+    rec = {c: row[c] for c in columns}
+    if table == "schedules":
+        rec["days"] = [d for d in rec["days"].split(",") if d]
+    return rec
+
+
+def _record_to_row(table, rec, columns):
+    values = []
+    for c in columns:
+        v = rec.get(c, "")
+        if table == "schedules" and c == "days":
+            v = ",".join(v or [])
+        elif c == "id" and not v and table in RECORD_IDS:
+            v = RECORD_IDS[table]()
+        elif table == "medicines" and c == "expiry_date":
+            v = normalize_date(v)
+        values.append("" if v is None else v)
+    return values
+
+
+class SQLitePatientRepository(SQLiteStorageBase):
+    # Same API as patient_service.PatientRepository.
+    versioned_table = "patients"
+
+    def __init__(self, db_path: Path):
+        super().__init__(db_path)
+        self.pat_store = SQLiteTableStore(db_path, "patients", PATIENT_COLUMNS)
+        self.med_store = SQLiteTableStore(db_path, "medicines", MEDICINE_COLUMNS)
+        self.sch_store = SQLiteTableStore(db_path, "schedules", SCHEDULE_COLUMNS)
+
+    def _ensure_files(self):
+        self.ensure()
+
+    def _load(self, store: SQLiteTableStore):
+        return store.load()
+
+    def _save(self, store: SQLiteTableStore, data):
+        store.save(data)
+
+    def _patients(self, where, params=(), limit=-1):
+        rows = self._query(
+            f"SELECT {', '.join(PATIENT_COLUMNS)} FROM patients WHERE {where} ORDER BY rowid LIMIT {int(limit)}", params)
+        return [dict(r) for r in rows]
+
+    def list_patients(self, doctor_username, offset=0, limit=None):
+        rows = self._select("patients", PATIENT_COLUMNS, "doctor = ?", (doctor_username,), offset, limit)
+        return [dict(r) for r in rows]
+
+    def page_patients(self, doctor_username, cursor=None, limit=PAGE_SIZE):
+        rows, next_cursor = self._page("patients", PATIENT_COLUMNS, "doctor = ?", (doctor_username,), cursor, limit)
+        return [{c: r[c] for c in PATIENT_COLUMNS} for r in rows], next_cursor
+
+    # no trigram index here: fuzzy search ranks the doctor's panel in Python
+    def search_patients(self, doctor_username, term, fuzzy=False, limit=None):
+        patients = self.list_patients(doctor_username)
+        if fuzzy:
+            needle = term.strip().lower()
+            by_id = [p for p in patients if needle and needle in p.get("id", "").lower()]
+            by_name = [p for p in fuzzy_rank(patients, "name", term) if p not in by_id]
+            return (by_id + by_name)[:limit]
+        term = term.lower()
+        return [p for p in patients
+                if term in p.get("name", "").lower() or term in p.get("id", "").lower()][:limit]
+
+    def add_patient(self, doctor_username, patient_name):
+        new_id = new_patient_id()
+        self._execute(
+            "INSERT INTO patients (id, name, doctor, user_username, created_at) VALUES (?, ?, ?, '', ?)",
+            (new_id, patient_name, doctor_username, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        return new_id
+
+    def add_patient_if_absent(self, doctor_username, patient_name, patient_username=""):
+        if patient_username:
+            for p in self._patients("user_username = ?", (patient_username,), limit=1):
+                return p["id"]
+        for p in self._patients("doctor = ? AND name = ?", (doctor_username, patient_name), limit=1):
+            return p["id"]
+        return self.add_patient(doctor_username, patient_name)
+
+    def delete_patient(self, doctor_username, patient_id):
+        return self.delete_patients(doctor_username, [patient_id]) > 0
+
+    # one transaction for the whole batch; ids go in chunks to stay under SQLite's parameter limit
+    def delete_patients(self, doctor_username, patient_ids):
+        ids = list(dict.fromkeys(patient_ids))
+        removed = 0
+        conn = self._connect()
+        with conn:
+            for start in range(0, len(ids), DELETE_CHUNK):
+                chunk = ids[start:start + DELETE_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                owned = [row[0] for row in conn.execute(
+                    f"SELECT id FROM patients WHERE doctor = ? AND id IN ({marks})", (doctor_username, *chunk))]
+                if not owned:
+                    continue
+                marks = ",".join("?" * len(owned))
+                removed += len(set(owned))
+                conn.execute(f"DELETE FROM patients WHERE doctor = ? AND id IN ({marks})", (doctor_username, *owned))
+                conn.execute(f"DELETE FROM medicines WHERE patient_id IN ({marks})", owned)
+                conn.execute(f"DELETE FROM schedules WHERE patient_id IN ({marks})", owned)
+        return removed
+
+    def get_patient_by_id(self, pid):
+        for p in self._patients("id = ?", (pid,), limit=1):
+            return p
+        return None
+
+    def doctor_of(self, pid):
+        for p in self._patients("id = ?", (pid,), limit=1):
+            return p["doctor"]
+        return None
+
+    def link_patient_user(self, pid, username):
+        cur = self._execute(
+            "UPDATE patients SET user_username = ? WHERE rowid = (SELECT rowid FROM patients WHERE id = ? ORDER BY rowid LIMIT 1)",
+            (username, pid))
+        return cur.rowcount > 0
+
+    def get_patient_id_for_user(self, username):
+        for p in self._patients("user_username = ?", (username,), limit=1):
+            return p["id"]
+        return None
+
+
+class SQLiteMedicineInventory(SQLiteStorageBase):
+    # Same API as inventory.MedicineInventory.
+    versioned_table = "medicines"
+
+    def __init__(self, db_path: Path):
+        super().__init__(db_path)
+        self.store = SQLiteTableStore(db_path, "medicines", MEDICINE_COLUMNS)
+
+    # _migrate already gave every row an id when the database was opened
+    def backfill_ids(self):
+        return 0
+
+    def _ensure(self):
+        return self.store.ensure()
+
+    def _load(self):
+        return self.store.load()
+
+    def _save(self, data):
+        return self.store.save(data)
+
+    def list_medicines(self, patient_id, offset=0, limit=None):
+        rows = self._select("medicines", MEDICINE_COLUMNS, "patient_id = ?", (patient_id,), offset, limit)
+        return [dict(r) for r in rows]
+
+    def page_medicines(self, patient_id, cursor=None, limit=PAGE_SIZE):
+        rows, next_cursor = self._page("medicines", MEDICINE_COLUMNS, "patient_id = ?", (patient_id,), cursor, limit)
+        return [{c: r[c] for c in MEDICINE_COLUMNS} for r in rows], next_cursor
+
+    def search_medicines(self, patient_id, term, fuzzy=False, limit=None):
+        if fuzzy:
+            return fuzzy_rank(self.list_medicines(patient_id), "name", term, limit)
+        term = term.lower()
+        return [m for m in self.list_medicines(patient_id) if term in m.get("name", "").lower()][:limit]
+
+    # substring search across every patient of a doctor, served by the patients(doctor) index
+    def search_doctor_medicines(self, doctor_username, term, fuzzy=False, limit=None):
+        cols = ", ".join(f"m.{c}" for c in MEDICINE_COLUMNS)
+        sql = f"SELECT {cols} FROM medicines m JOIN patients p ON p.id = m.patient_id WHERE p.doctor = ?"
+        if fuzzy:
+            rows = self._query(sql + " ORDER BY m.rowid", (doctor_username,))
+            return fuzzy_rank([dict(r) for r in rows], "name", term, limit)
+        rows = self._query(sql + " AND instr(lower(m.name), ?) > 0 ORDER BY m.rowid LIMIT ?",
+                           (doctor_username, term.lower(), -1 if limit is None else limit))
+        return [dict(r) for r in rows]
+
+    # range scan on the medicines(expiry_date) index, soonest first
+    def medicines_expiring_before(self, before, doctor=None):
+        bound = parse_date(before)
+        if bound is None:
+            raise ValueError(f"not a date: {before!r}")
+        cols = ", ".join(f"m.{c}" for c in MEDICINE_COLUMNS)
+        where = "m.expiry_date < ? AND m.expiry_date GLOB ?"
+        params = [bound.isoformat(), ISO_DATE_GLOB]
+        if doctor is None:
+            sql = f"SELECT {cols} FROM medicines m WHERE {where}"
+        else:
+            sql = f"SELECT {cols} FROM medicines m JOIN patients p ON p.id = m.patient_id WHERE p.doctor = ? AND {where}"
+            params.insert(0, doctor)
+        rows = self._query(sql + " ORDER BY m.expiry_date, m.rowid", params)
+        return [dict(r) for r in rows]
+
+    def add_medicine(self, patient_id, name, dosage, quantity, expiry_date, added_by):
+        medicine_id = new_medicine_id()
+        self._execute(
+            "INSERT INTO medicines (id, patient_id, name, dosage, quantity, expiry_date, added_by, added_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (medicine_id, patient_id, name, dosage, quantity, normalize_date(expiry_date), added_by,
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        return medicine_id
+
+    # single-row statements through the medicines(id) index
+    def edit_medicine(self, patient_id, medicine_id, name, dosage, quantity, expiry_date):
+        cur = self._execute(
+            "UPDATE medicines SET name = ?, dosage = ?, quantity = ?, expiry_date = ? WHERE id = ? AND patient_id = ?",
+            (name, dosage, quantity, normalize_date(expiry_date), medicine_id, patient_id))
+        return cur.rowcount > 0
+
+    # compare-and-set on the quantity text, so two sessions taking doses at once
+    # both count
+    def take_dose(self, patient_id, medicine_id, amount=1):
+        while True:
+            rows = self._query(f"SELECT {', '.join(MEDICINE_COLUMNS)} FROM medicines WHERE id = ? AND patient_id = ?",
+                               (medicine_id, patient_id))
+            if not rows:
+                return None
+            record = dict(rows[0])
+            quantity = parse_quantity(record["quantity"])
+            if quantity is None:
+                return None
+            new_quantity = format_quantity(max(0.0, quantity - amount))
+            cur = self._execute("UPDATE medicines SET quantity = ? WHERE id = ? AND quantity = ?",
+                                (new_quantity, medicine_id, record["quantity"]))
+            if cur.rowcount:
+                return dict(record, quantity=new_quantity)
+
+    def delete_medicine(self, patient_id, medicine_id):
+        cur = self._execute("DELETE FROM medicines WHERE id = ? AND patient_id = ?", (medicine_id, patient_id))
+        return cur.rowcount > 0
+
+
+class SQLiteScheduleStore(SQLiteStorageBase):
+    # Storage half of reminder_service.ScheduleManager; the reminder/notification
+    # logic is shared by mixing this into ScheduleManager (see reminder_service).
+    versioned_table = "schedules"
+
+    def __init__(self, db_path: Path):
+        super().__init__(db_path)
+        self.store = SQLiteTableStore(db_path, "schedules", SCHEDULE_COLUMNS)
+
+    # _migrate already gave every row an id when the database was opened
+    def backfill_ids(self):
+        return 0
+
+    def _ensure(self):
+        return self.store.ensure()
+
+    def _load(self):
+        return self.store.load()
+
+    def _save(self, data):
+        return self.store.save(data)
+
+    def add_reminder(self, patient_id, medicine_name, dosage, time_hms, days, created_by):
+        reminder_id = new_schedule_id()
+        self._execute(
+            "INSERT INTO schedules (id, patient_id, medicine_name, dosage, time, days, created_by, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (reminder_id, patient_id, medicine_name, dosage, time_hms, ",".join(days or []), created_by,
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        return reminder_id
+
+    def list_reminders(self, patient_id, offset=0, limit=None):
+        rows = self._select("schedules", SCHEDULE_COLUMNS, "patient_id = ?", (patient_id,), offset, limit)
+        return [_row_to_record("schedules", r, SCHEDULE_COLUMNS) for r in rows]
+
+    def page_reminders(self, patient_id, cursor=None, limit=PAGE_SIZE):
+        rows, next_cursor = self._page("schedules", SCHEDULE_COLUMNS, "patient_id = ?", (patient_id,), cursor, limit)
+        return [_row_to_record("schedules", r, SCHEDULE_COLUMNS) for r in rows], next_cursor
+
+    def edit_reminder(self, patient_id, reminder_id, medicine_name, dosage, time_hms, days):
+        cur = self._execute(
+            "UPDATE schedules SET medicine_name = ?, dosage = ?, time = ?, days = ? WHERE id = ? AND patient_id = ?",
+            (medicine_name, dosage, time_hms, ",".join(days or []), reminder_id, patient_id))
+        return cur.rowcount > 0
+
+
+class SQLiteDoseLog(SQLiteStorageBase):
+    # Same API as dose_log.DoseLog; offsets are rowids instead of byte offsets.
+    versioned_table = "doses"
+
+    def append(self, dose: Dose):
+        self._execute(f"INSERT INTO doses ({', '.join(Dose._fields)}) VALUES ({', '.join('?' * len(Dose._fields))})",
+                      tuple(dose))
+
+    def read_from(self, offset=0):
+        rows = self._query(f"SELECT rowid, {', '.join(Dose._fields)} FROM doses WHERE rowid > ? ORDER BY rowid",
+                           (offset,))
+        if not rows:
+            return [], offset
+        return [Dose(*tuple(r)[1:]) for r in rows], rows[-1]["rowid"]
+
+    def iter_doses(self):
+        return iter(self.read_from(0)[0])
+
+
+class SQLiteUserStore(SQLiteStorageBase):
+    # Storage half of user_service.UserRepository: rows instead of users.txt lines.
+    versioned_table = "users"
+
+    def save_user_record(self, record):
+        self._execute(
+            f"INSERT INTO users ({', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * len(USER_COLUMNS))})",
+            [record.get(c, "") for c in USER_COLUMNS])
+
+    def find_user(self, username_or_email):
+        rows = self._query(
+            "SELECT username, password_hash, name, email, role, org FROM users "
+            "WHERE username = ? OR email = ? ORDER BY rowid LIMIT 1",
+            (username_or_email, username_or_email))
+        return dict(rows[0]) if rows else None
+
+    def list_doctors(self):
+        rows = self._query("SELECT username, name, org FROM users WHERE role = 'doctor' ORDER BY rowid")
+        return [dict(r) for r in rows]
+
+    def update_password_hash(self, username, old_hash, new_hash):
+        cur = self._execute(
+            "UPDATE users SET password_hash = ? WHERE rowid = "
+            "(SELECT rowid FROM users WHERE username = ? ORDER BY rowid LIMIT 1) AND password_hash = ?",
+            (new_hash, username, old_hash))
+        return cur.rowcount > 0
+
+    # delete rows no lookup can reach: find_user returns the first row whose username
+    # or email matches, so a row is kept only if it is that first row for its own
+    # username or email
+    def delete_shadowed_users(self):
+        cur = self._execute(
+            "DELETE FROM users WHERE rowid NOT IN ("
+            "SELECT (SELECT MIN(rowid) FROM users WHERE username = k.key OR email = k.key) "
+            "FROM (SELECT username AS key FROM users WHERE username != '' "
+            "UNION SELECT email FROM users WHERE email != '') AS k)")
+        return cur.rowcount
@@ -0,0 +1,949 @@
+import functools
+import json
+import os
+import random
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, writers still detect conflicts
+    fcntl = None
+
+from services import fuzzy
+from services.config import STREAM_THRESHOLD_BYTES
+from services.jsonstream import iter_array, load_document
+from services.records import RECORD_TYPES, Record
+
+# Shared JSON storage layer used by the patient, inventory and reminder services.
+# Parsed documents are kept in memory and handed back on every load until the
+# file on disk changes (mtime or size), so repeated reads cost one os.stat()
+# instead of re-opening and re-parsing the whole file. The patients, medicines
+# and schedules arrays are cached as compact records (services/records.py),
+# which read like the dicts they replace and are written back as the same JSON.
+#
+# Single-record writes can go through a JSON-lines journal next to the snapshot
+# ("medicines.json.journal"): append()/update()/remove() write one line instead
+# of re-dumping the whole document, load() replays the journal on top of the
+# snapshot, and once the journal grows past JOURNAL_COMPACT_BYTES it is folded
+# back into the snapshot in a background thread. Every journal line carries a
+# sequence number and the snapshot records the last one it contains
+# (SEQ_KEY), so a crash in the middle of a compaction never replays a change twice.
+#
+# Several processes (doctor terminals, patient sessions) may share a data folder.
+# Each store has a "<file>.lock" file locked with fcntl.flock: shared while a
+# changed file is re-read, exclusive while writing, so cache hits never wait.
+# SEQ_KEY doubles as the store's version: every save and journal line bumps it,
+# and a write is only accepted if the document it was built from still has the
+# version on disk. Otherwise ConflictError is raised and the repository method,
+# wrapped in retry_on_conflict, runs again on the fresh data instead of
+# overwriting the other writer's change. A method that keeps losing the race
+# gets a last run with the store locked for its whole read-modify-write.
+
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+# batches removing up to this many records are journaled (log_many), larger ones rewrite the files
+JOURNAL_BATCH_MAX = 500
+SEQ_KEY = "_journal_seq"
+# optimistic attempts before retry_on_conflict locks the store for the last one
+CONFLICT_RETRIES = 5
+
+# One cache entry per resolved file path, shared by every store instance that
+# points at that file (e.g. PatientRepository.med_store and MedicineInventory).
+_cache = {}
+_cache_lock = threading.RLock()
+# Bumped every time a file's cached document is re-read or saved, so indexes
+# built on top of a store can tell whether they are still up to date.
+_versions = {}
+# Files whose journal is currently being compacted
+_compacting = set()
+# Files whose snapshot needed the tolerant reader; compacted on the next write
+_needs_repair = set()
+# File locks this process holds: cache key -> [fd, exclusive, depth]. Only
+# touched with _cache_lock held, which also makes them re-entrant.
+_held = {}
+
+
+class ConflictError(RuntimeError):
+    # Another writer changed a store after the document being written was
+    # loaded. stores are the ones the failed write covered: the store itself,
+    # or every store of a save_many/log_many batch.
+    def __init__(self, message, stores=()):
+        super().__init__(message)
+        self.stores = tuple(stores)
+
+
+# Re-run a read-modify-write method when its write lost the race to another
+# process; each retry loads the other writer's change first. After
+# CONFLICT_RETRIES lost races the method runs once more with the write lock of
+# every store those writes covered held throughout, so nobody can get in
+# between. The locks are taken in path order, like save_many takes them, so
+# two such runs (or a run and a batch) can't deadlock; the batch inside simply
+# re-enters them. Because that run holds _cache_lock, a decorated method must
+# not call out to listeners or other callbacks: notify after it returns.
+def retry_on_conflict(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        stores = []
+        for attempt in range(CONFLICT_RETRIES):
+            try:
+                return method(*args, **kwargs)
+            except ConflictError as e:
+                stores.extend(e.stores)
+            time.sleep(random.uniform(0, 0.002 * 2 ** attempt))
+        with _cache_lock, _locked_all(stores):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+class _CacheEntry:
+    __slots__ = ("data", "stamp")
+
+    def __init__(self, data, stamp):
+        self.data = data
+        self.stamp = stamp
+
+
+def _bump_version(key):
+    _versions[key] = _versions.get(key, 0) + 1
+
+
+def _stamp(path: Path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # the inode changes on every atomic replace, even within one mtime tick; size stays last
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _json_value(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# cached documents hold compact records; dicts written since (new records,
+# tolerant-loader output) are swapped in place so list positions stay valid
+def _as_records(data):
+    for key, cls in RECORD_TYPES.items():
+        records = data.get(key)
+        if type(records) is list:
+            for i, rec in enumerate(records):
+                if type(rec) is dict:
+                    records[i] = cls.from_dict(rec)
+
+
+def _as_record(key, record):
+    cls = RECORD_TYPES.get(key)
+    return cls.from_dict(record) if cls is not None and type(record) is dict else record
+
+
+# dump data to a synced temp file next to path and return the temp path
+def _write_temp(path: Path, data):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=_json_value)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp
+
+
+# write to a temp file next to the target and rename it over, so readers never see a half-written file
+def atomic_write_json(path: Path, data):
+    path = Path(path)
+    os.replace(_write_temp(path, data), path)
+
+
+# apply one journal entry to a loaded document
+def _apply(data, entry):
+    records = data.setdefault(entry["key"], [])
+    op = entry["op"]
+    if op == "add":
+        records.append(_as_record(entry["key"], entry["record"]))
+    elif op == "set":
+        records[entry["pos"]] = _as_record(entry["key"], entry["record"])
+    elif op == "del":
+        records.pop(entry["pos"])
+
+
+class JSONStorageBase:
+    # Base class to encapsulate JSON file storage responsibilities.
+    # load() returns the cached document: callers that mutate it must call save()
+    # (or use append/update/remove) so the change is written through to disk.
+
+    def __init__(self, file_path: Path, default_structure, compact_threshold=JOURNAL_COMPACT_BYTES,
+                 stream_threshold=STREAM_THRESHOLD_BYTES):
+        self.file_path = Path(file_path)
+        self.default_structure = default_structure
+        self.journal_path = self.file_path.with_name(self.file_path.name + JOURNAL_SUFFIX)
+        self.lock_path = self.file_path.with_name(self.file_path.name + LOCK_SUFFIX)
+        self.compact_threshold = compact_threshold
+        self.stream_threshold = stream_threshold
+        self._cache_key = os.path.abspath(self.file_path)
+
+    # make sure the JSON file exists. If it's missing, we create it with an empty structure;
+    # the link only succeeds while no file is there, so a process that lost the race
+    # never replaces the file (and the records) another one has written meanwhile
+    def ensure(self):
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.file_path.exists():
+            tmp = _write_temp(self.file_path, self.default_structure)
+            try:
+                os.link(tmp, self.file_path)
+            except FileExistsError:
+                pass
+            except OSError:  # no hard links on this filesystem
+                if not self.file_path.exists():
+                    os.replace(tmp, self.file_path)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+    def _stamps(self):
+        return (_stamp(self.file_path), _stamp(self.journal_path))
+
+    # the version moves first: a lock-free reader that sees the new entry also sees its version
+    def _remember(self, data):
+        _bump_version(self._cache_key)
+        _cache[self._cache_key] = _CacheEntry(data, self._stamps())
+
+    # Read and return the current JSON content, re-parsing only when the file changed.
+    # A cache hit is one stat() and no lock, so readers never queue behind a writer
+    # holding _cache_lock: a writer changes the file before it replaces the entry,
+    # so a stale entry never matches the stamps and that reader takes the slow path.
+    def load(self):
+        self.ensure()
+        entry = _cache.get(self._cache_key)
+        if entry is not None and entry.stamp == self._stamps():
+            return entry.data
+        with _cache_lock:
+            entry = _cache.get(self._cache_key)
+            if entry is not None and entry.stamp == self._stamps():
+                return entry.data
+            with self._locked(exclusive=False):
+                data = self._read_snapshot()
+                self._replay(data)
+                _as_records(data)
+                self._remember(data)
+            return data
+
+    # Advisory lock on the store's lock file, shared with other processes.
+    # Callers hold _cache_lock; nested use (a save inside extend) reuses the lock.
+    @contextmanager
+    def _locked(self, exclusive):
+        held = _held.get(self._cache_key)
+        if held is not None:
+            if exclusive and not held[1]:
+                fcntl.flock(held[0], fcntl.LOCK_EX)
+                held[1] = True
+            held[2] += 1
+            try:
+                yield
+            finally:
+                held[2] -= 1
+            return
+        if fcntl is None:
+            yield
+            return
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            _held[self._cache_key] = [fd, exclusive, 1]
+            yield
+        finally:
+            _held.pop(self._cache_key, None)
+            os.close(fd)  # releases the lock
+
+    # With the exclusive lock held: data must be built from the version that is
+    # on disk now, otherwise writing it would drop another writer's change
+    # (batch: every store of the save_many/log_many this write belongs to)
+    def _check_version(self, data, batch=None):
+        current = self.load()
+        if current is not data and current.get(SEQ_KEY, 0) != data.get(SEQ_KEY, 0):
+            raise ConflictError(f"{self.file_path.name} changed since it was loaded "
+                                f"(version {data.get(SEQ_KEY, 0)}, now {current.get(SEQ_KEY, 0)})",
+                                batch or (self,))
+
+    def _read_snapshot(self):
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+        except ValueError:
+            pass
+        data, _ = load_document(self.file_path)
+        for key, value in self.default_structure.items():
+            data.setdefault(key, json.loads(json.dumps(value)))
+        _needs_repair.add(self._cache_key)
+        return data
+
+    def _replay(self, data):
+        if not self.journal_path.exists():
+            return
+        seq = data.get(SEQ_KEY, 0)
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line from a crash mid-append: everything after it is lost anyway
+                    break
+                if entry.get("seq", 0) <= seq:
+                    continue
+                _apply(data, entry)
+                seq = entry["seq"]
+        if seq:
+            data[SEQ_KEY] = seq
+
+    # write updated data back to the JSON file and keep it as the cached copy
+    def save(self, data):
+        with _cache_lock, self._locked(exclusive=True):
+            self._check_version(data)
+            data[SEQ_KEY] = data.get(SEQ_KEY, 0) + 1
+            atomic_write_json(self.file_path, data)
+            # the snapshot now holds everything the journal had
+            self._committed(data)
+
+    # the snapshot on disk now matches data
+    def _committed(self, data):
+        if self.journal_path.exists():
+            open(self.journal_path, "w").close()
+        _needs_repair.discard(self._cache_key)
+        _as_records(data)
+        self._remember(data)
+
+    # append many records with a single snapshot write (bulk import); the cached
+    # document is only replaced once the new file is on disk
+    def extend(self, root_key, records):
+        if not records:
+            return
+        with _cache_lock, self._locked(exclusive=True):
+            data = self.load()
+            self.save(dict(data, **{root_key: data.get(root_key, []) + list(records)}))
+
+    def iter_records(self, root_key):
+        if self.streaming:
+            yield from iter_array(self.file_path, root_key)
+        else:
+            yield from self.load().get(root_key, [])
+
+    # True when lookups should stream the snapshot instead of loading it: the file is
+    # large, not already cached and has no pending journal entries to replay
+    @property
+    def streaming(self):
+        stamps = self._stamps()
+        snapshot, journal = stamps
+        if snapshot is None or snapshot[-1] < self.stream_threshold or (journal and journal[-1]):
+            return False
+        with _cache_lock:
+            entry = _cache.get(self._cache_key)
+            return entry is None or entry.stamp != stamps
+
+    # --- journaled single-record writes (O(1) I/O instead of a full rewrite) ---
+    def append(self, data, root_key, record):
+        self._log(data, {"op": "add", "key": root_key, "record": record})
+
+    def update(self, data, root_key, pos, record):
+        self._log(data, {"op": "set", "key": root_key, "pos": pos, "record": record})
+
+    def remove(self, data, root_key, pos):
+        self._log(data, {"op": "del", "key": root_key, "pos": pos})
+
+    def _log(self, data, entry):
+        with _cache_lock, self._locked(exclusive=True):
+            self._check_version(data)
+            self._write_journal(data, [entry])
+
+    # Append entries to the journal with one fsync and apply them to data, which
+    # becomes the cached copy (one version bump for the lot). Callers hold the
+    # exclusive lock and have checked the version.
+    def _write_journal(self, data, entries):
+        seq = data.get(SEQ_KEY, 0)
+        lines = []
+        for entry in entries:
+            seq += 1
+            entry["seq"] = seq
+            lines.append(json.dumps(entry, default=_json_value) + "\n")
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in entries:
+            _apply(data, entry)
+        data[SEQ_KEY] = seq
+        self._remember(data)
+        journal_size = self._stamps()[1][-1]
+        due = journal_size >= self.compact_threshold or self._cache_key in _needs_repair
+        if due and self._cache_key not in _compacting:
+            _compacting.add(self._cache_key)
+            threading.Thread(target=self._compact_worker, daemon=True).start()
+
+    # fold the journal into the snapshot file
+    def compact(self):
+        with _cache_lock, self._locked(exclusive=True):
+            self.save(self.load())
+
+    def _compact_worker(self):
+        try:
+            self.compact()
+        finally:
+            with _cache_lock:
+                _compacting.discard(self._cache_key)
+
+    # current version of the cached document (changes on every reload or save);
+    # a plain dict read, so index lookups don't take _cache_lock either
+    @property
+    def version(self):
+        return _versions.get(self._cache_key, 0)
+
+    # drop the cached copy so the next load re-reads the file
+    def invalidate(self):
+        with _cache_lock:
+            _cache.pop(self._cache_key, None)
+
+
+# Write locks on several stores, taken in path order so that two batches over
+# the same files can't deadlock; locks this process already holds are re-entered.
+# Callers hold _cache_lock.
+@contextmanager
+def _locked_all(stores):
+    with ExitStack() as locks:
+        for store in sorted({store._cache_key: store for store in stores}.values(), key=lambda s: s._cache_key):
+            locks.enter_context(store._locked(exclusive=True))
+        yield
+
+
+# Save several stores as one batch: every document is written and synced to its
+# temp file first, and only when all of them made it to disk are they renamed
+# over the originals, in the given order. A failure while writing leaves every
+# file untouched; the rename phase is a handful of os.replace calls, so put the
+# store whose change must land first (e.g. the patients, before their orphaned
+# medicines) at the front of the list. The stores are locked in path order, so
+# two batches over the same files can't deadlock, and all are version-checked
+# before anything is written.
+def save_many(writes):
+    stores = [store for store, _ in writes]
+    with _cache_lock, _locked_all(stores):
+        for store, data in writes:
+            store._check_version(data, batch=stores)
+        staged = []
+        try:
+            for store, data in writes:
+                data[SEQ_KEY] = data.get(SEQ_KEY, 0) + 1
+                staged.append((store, data, _write_temp(store.file_path, data)))
+        except BaseException:
+            for _, _, tmp in staged:
+                tmp.unlink(missing_ok=True)
+            raise
+        for store, data, tmp in staged:
+            os.replace(tmp, store.file_path)
+            store._committed(data)
+
+
+# Journal a batch of entries over several stores ([(store, data, entries)]) with
+# the same guarantees as save_many: the stores are locked in path order and all
+# version-checked before anything is written, then each store's lines go to its
+# journal with a single fsync, in the given order. For a few records out of big
+# files (a discharged patient's medicines) this skips rewriting the snapshots.
+def log_many(batches):
+    stores = [store for store, _, _ in batches]
+    with _cache_lock, _locked_all(stores):
+        for store, data, _ in batches:
+            store._check_version(data, batch=stores)
+        for store, data, entries in batches:
+            if entries:
+                store._write_journal(data, entries)
+
+
+class _Tombstones:
+    # Positions removed since an index was last rebuilt, so that a removal doesn't
+    # renumber every later position. The index keeps "slots": positions as they
+    # were before those removals (an append takes the next slot after them all),
+    # converted on the way out. Past LIMIT the index folds them into its slots.
+    LIMIT = 64
+
+    def __init__(self):
+        self.gone = []
+
+    def __len__(self):
+        return len(self.gone)
+
+    # slot -> current position
+    def pos(self, slot):
+        return slot - bisect_left(self.gone, slot)
+
+    # current position -> slot
+    def slot(self, pos):
+        slot = pos
+        while True:
+            after = pos + bisect_right(self.gone, slot)
+            if after == slot:
+                return slot
+            slot = after
+
+    # slot of the next appended record, given its current position
+    def next_slot(self, pos):
+        return pos + len(self.gone)
+
+    # True when the index should fold the tombstones in
+    def bury(self, slot):
+        insort(self.gone, slot)
+        return len(self.gone) >= self.LIMIT
+
+
+class FieldIndex:
+    # Hash index over one field of the records in store.load()[root_key]:
+    # field value -> positions of the matching records, in file order.
+    # It is rebuilt once whenever the store version moves on (reload or a save
+    # made elsewhere); repositories call note_append()/mark_synced() after
+    # their own writes so adds and in-place edits don't trigger a rebuild.
+    # Removals leave tombstones (_Tombstones) instead of renumbering every bucket.
+
+    def __init__(self, store: JSONStorageBase, root_key: str, field: str):
+        self.store = store
+        self.root_key = root_key
+        self.field = field
+        self._positions = {}   # value -> slots (see _Tombstones)
+        self._gone = _Tombstones()
+        self._version = None
+
+    def _rebuild(self, records):
+        positions = {}
+        for i, rec in enumerate(records):
+            positions.setdefault(rec.get(self.field), []).append(i)
+        self._positions = positions
+        self._gone = _Tombstones()
+
+    # renumber every bucket once for all the removals so far
+    def _fold(self):
+        pos = self._gone.pos
+        self._positions = {key: [pos(slot) for slot in bucket] for key, bucket in self._positions.items()}
+        self._gone = _Tombstones()
+
+    # make sure the index matches the given freshly loaded document
+    def sync(self, data):
+        version = self.store.version
+        if self._version != version:
+            self._rebuild(data.get(self.root_key, []))
+            self._version = version
+
+    def positions(self, key, data=None):
+        if data is None:
+            data = self.store.load()
+        self.sync(data)
+        bucket = self._positions.get(key, [])
+        if not self._gone:
+            return bucket
+        return [self._gone.pos(slot) for slot in bucket]
+
+    # matching records in file order; offset/limit only materialize that slice
+    def records(self, key, data=None, offset=0, limit=None):
+        stop = None if limit is None else offset + limit
+        if data is None and self.store.streaming:
+            matches = (r for r in self.store.iter_records(self.root_key) if r.get(self.field) == key)
+            return list(islice(matches, offset, stop))
+        if data is None:
+            data = self.store.load()
+        records = data.get(self.root_key, [])
+        return [records[i] for i in self.positions(key, data)[offset:stop]]
+
+    # One page of matching records after `cursor` (None = first page). Returns
+    # (records, next_cursor); next_cursor is None on the last page. The cursor is
+    # "<position>:<id>" of the last record returned, so with an id_field the next
+    # page still starts after that record when deletions have shifted positions.
+    def page(self, key, cursor=None, limit=20, data=None, id_field=None):
+        after = -1
+        if cursor:
+            pos, _, rid = str(cursor).partition(":")
+            after = int(pos)
+        if data is None and self.store.streaming:
+            matches = ((i, r) for i, r in enumerate(self.store.iter_records(self.root_key))
+                       if i > after and r.get(self.field) == key)
+            found = list(islice(matches, limit + 1))
+        else:
+            if data is None:
+                data = self.store.load()
+            records = data.get(self.root_key, [])
+            positions = self.positions(key, data)
+            if cursor and id_field and rid and not (after < len(records) and records[after].get(id_field) == rid):
+                for i in positions:
+                    if records[i].get(id_field) == rid:
+                        after = i
+                        break
+            start = bisect_right(positions, after)
+            found = [(i, records[i]) for i in positions[start:start + limit + 1]]
+        page = found[:limit]
+        next_cursor = None
+        if len(found) > limit:
+            last_pos, last = page[-1]
+            next_cursor = f"{last_pos}:{last.get(id_field, '')}" if id_field else str(last_pos)
+        return [r for _, r in page], next_cursor
+
+    # Give every record that has no value for the field one from make_value() and
+    # save the store once; used to backfill ids in files written before records
+    # had one. Returns how many records were filled in.
+    def fill_missing(self, make_value, data=None):
+        if data is None:
+            data = self.store.load()
+        missing = self.positions(None, data)
+        if not missing:
+            return 0
+        with _cache_lock:
+            records = data[self.root_key]
+            for pos in missing:
+                records[pos] = dict(records[pos], **{self.field: make_value()})
+            self.store.save(data)
+        return len(missing)
+
+    # record appended at position pos by the caller; call right after the store write
+    def note_append(self, pos, record):
+        if self._caught_up():
+            self._positions.setdefault(record.get(self.field), []).append(self._gone.next_slot(pos))
+
+    # record at position pos was removed by the caller; call right after the store write
+    def note_remove(self, pos, record):
+        if not self._caught_up():
+            return
+        key = record.get(self.field)
+        slot = self._gone.slot(pos)
+        bucket = self._positions.get(key, [])
+        if slot in bucket:
+            bucket.remove(slot)
+            if not bucket:
+                del self._positions[key]
+        if self._gone.bury(slot):
+            self._fold()
+
+    # record at position pos was replaced or edited; call right after the store write
+    def note_update(self, pos, old_record, new_record):
+        if not self._caught_up():
+            return
+        old_key, new_key = old_record.get(self.field), new_record.get(self.field)
+        if old_key == new_key:
+            return
+        slot = self._gone.slot(pos)
+        bucket = self._positions.get(old_key, [])
+        if slot in bucket:
+            bucket.remove(slot)
+            if not bucket:
+                del self._positions[old_key]
+        insort(self._positions.setdefault(new_key, []), slot)
+
+    # the caller's last save did not move any indexed value
+    def mark_synced(self):
+        self._caught_up()
+
+    # accept the caller's save only if nothing else touched the file since our
+    # last sync; otherwise leave the index stale so the next lookup rebuilds it
+    def _caught_up(self):
+        version = self.store.version
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+            return True
+        return False
+
+
+class SortedIndex:
+    # Records ordered by a computed key (e.g. expiry date -> day number), for
+    # range queries by bisection: (key, position) pairs sorted once per store
+    # version, for the whole store and per partition (partition_field or
+    # partition_of(that value), like NgramIndex). Records whose key is None are
+    # left out. Kept current the same way as FieldIndex, tombstones included.
+
+    def __init__(self, store: JSONStorageBase, root_key: str, key_of, partition_field=None, partition_of=None):
+        self.store = store
+        self.root_key = root_key
+        self.key_of = key_of
+        self.partition_field = partition_field
+        self.partition_of = partition_of
+        self._all = []     # [(key, position)] sorted
+        self._parts = {}   # partition -> [(key, position)] sorted
+        self._gone = _Tombstones()   # the positions above are slots
+        self._version = None
+
+    def _partition(self, record, memo=None):
+        value = record.get(self.partition_field)
+        if self.partition_of is None:
+            return value
+        if memo is None:
+            return self.partition_of(value)
+        if value not in memo:
+            memo[value] = self.partition_of(value)
+        return memo[value]
+
+    def _rebuild(self, records):
+        self._all, self._parts = [], {}
+        memo = {}
+        for pos, rec in enumerate(records):
+            key = self.key_of(rec)
+            if key is None:
+                continue
+            self._all.append((key, pos))
+            if self.partition_field is not None:
+                self._parts.setdefault(self._partition(rec, memo), []).append((key, pos))
+        self._all.sort()
+        for entries in self._parts.values():
+            entries.sort()
+        self._gone = _Tombstones()
+
+    def _fold(self):
+        pos = self._gone.pos
+        self._all = [(key, pos(slot)) for key, slot in self._all]
+        self._parts = {part: [(key, pos(slot)) for key, slot in entries] for part, entries in self._parts.items()}
+        self._gone = _Tombstones()
+
+    def sync(self, data):
+        version = self.store.version
+        if self._version != version:
+            self._rebuild(data.get(self.root_key, []))
+            self._version = version
+
+    # records with key < bound (key order, then file order), optionally of one partition
+    def below(self, bound, partition=None, data=None):
+        if data is None:
+            data = self.store.load()
+        self.sync(data)
+        if partition is None:
+            entries = self._all
+        else:
+            entries = self._parts.get(partition, [])
+        records = data.get(self.root_key, [])
+        pos = self._gone.pos
+        return [records[pos(slot)] for _, slot in entries[:bisect_right(entries, (bound, -1))]]
+
+    def _buckets(self, record):
+        if self.partition_field is None:
+            return (self._all,)
+        return (self._all, self._parts.setdefault(self._partition(record), []))
+
+    def note_append(self, pos, record):
+        if self._caught_up():
+            key = self.key_of(record)
+            if key is not None:
+                slot = self._gone.next_slot(pos)
+                for entries in self._buckets(record):
+                    insort(entries, (key, slot))
+
+    def _drop(self, key, slot, record):
+        if key is not None:
+            for entries in self._buckets(record):
+                i = bisect_right(entries, (key, slot)) - 1
+                if i >= 0 and entries[i] == (key, slot):
+                    del entries[i]
+
+    def note_remove(self, pos, record):
+        if not self._caught_up():
+            return
+        slot = self._gone.slot(pos)
+        self._drop(self.key_of(record), slot, record)
+        if self._gone.bury(slot):
+            self._fold()
+
+    def note_update(self, pos, old_record, new_record):
+        if not self._caught_up():
+            return
+        old_key, new_key = self.key_of(old_record), self.key_of(new_record)
+        slot = self._gone.slot(pos)
+        self._drop(old_key, slot, old_record)
+        if new_key is not None:
+            for entries in self._buckets(new_record):
+                insort(entries, (new_key, slot))
+
+    def mark_synced(self):
+        self._caught_up()
+
+    def _caught_up(self):
+        version = self.store.version
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+            return True
+        return False
+
+
+class NgramIndex:
+    # Substring index over one text field, split into partitions: the value of
+    # partition_field, or partition_of(that value) (e.g. patient_id -> doctor).
+    # Every record gets a stable entry id in
+    # file order; (partition, trigram) -> entry ids answers searches of 3+
+    # characters by set intersection, shorter terms just scan the partition.
+    # Kept current the same way as FieldIndex (rebuilt when the store version
+    # moves on, note_* after the repository's own writes).
+
+    GRAM = fuzzy.GRAM
+
+    def __init__(self, store: JSONStorageBase, root_key: str, field: str, partition_field: str, partition_of=None):
+        self.store = store
+        self.root_key = root_key
+        self.field = field
+        self.partition_field = partition_field
+        self.partition_of = partition_of
+        self._partition_memo = None  # only set while rebuilding
+        self._postings = {}   # (partition, gram) -> {entry id}
+        self._members = {}    # partition -> {entry id}
+        self._entries = {}    # entry id -> (partition, lowercased text, record, number of trigrams)
+        self._entry_at = []   # position in data[root_key] -> entry id
+        self._next_id = 0
+        self._version = None
+
+    def _grams(self, text):
+        return fuzzy.trigrams(text)
+
+    def _partition(self, record):
+        value = record.get(self.partition_field)
+        if self.partition_of is None:
+            return value
+        memo = self._partition_memo
+        if memo is None:
+            return self.partition_of(value)
+        if value not in memo:
+            memo[value] = self.partition_of(value)
+        return memo[value]
+
+    def _add(self, record, eid=None):
+        if eid is None:
+            eid = self._next_id
+            self._next_id += 1
+        part = self._partition(record)
+        text = str(record.get(self.field, "")).lower()
+        grams = self._grams(text)
+        self._entries[eid] = (part, text, record, len(grams))
+        self._members.setdefault(part, set()).add(eid)
+        for g in grams:
+            self._postings.setdefault((part, g), set()).add(eid)
+        return eid
+
+    def _drop(self, eid):
+        part, text, _, _ = self._entries.pop(eid)
+        self._members[part].discard(eid)
+        for g in self._grams(text):
+            bucket = self._postings.get((part, g))
+            if bucket is not None:
+                bucket.discard(eid)
+                if not bucket:
+                    del self._postings[(part, g)]
+
+    def _rebuild(self, records):
+        self._postings, self._members, self._entries, self._next_id = {}, {}, {}, 0
+        self._partition_memo = {}
+        try:
+            self._entry_at = [self._add(rec) for rec in records]
+        finally:
+            self._partition_memo = None
+
+    def sync(self, data):
+        version = self.store.version
+        if self._version != version:
+            self._rebuild(data.get(self.root_key, []))
+            self._version = version
+
+    # records of the partition whose field contains term (case-insensitive), in file order
+    def search(self, partition, term, data=None):
+        term = term.lower()
+        if data is None and self.store.streaming:
+            self._partition_memo = {}
+            try:
+                return [r for r in self.store.iter_records(self.root_key)
+                        if term in str(r.get(self.field, "")).lower() and self._partition(r) == partition]
+            finally:
+                self._partition_memo = None
+        if data is None:
+            data = self.store.load()
+        self.sync(data)
+        if len(term) < self.GRAM:
+            candidates = self._members.get(partition, ())
+        else:
+            buckets = sorted((self._postings.get((partition, g), set()) for g in self._grams(term)), key=len)
+            candidates = set.intersection(*buckets) if buckets[0] else ()
+        hits = sorted(eid for eid in candidates if term in self._entries[eid][1])
+        return [self._entries[eid][2] for eid in hits]
+
+    # typo-tolerant variant of search(): records of the partition ranked by
+    # fuzzy.score, at most limit of them
+    def fuzzy_search(self, partition, term, limit=None, data=None):
+        term = term.lower().strip()
+        if not term:
+            return []
+        if data is None and self.store.streaming:
+            self._partition_memo = {}
+            try:
+                members = [r for r in self.store.iter_records(self.root_key) if self._partition(r) == partition]
+            finally:
+                self._partition_memo = None
+            return fuzzy.rank(members, self.field, term, limit)
+        if data is None:
+            data = self.store.load()
+        self.sync(data)
+        entries = self._entries
+        grams = self._grams(term)
+        if not grams:
+            # too short for trigrams: plain substring matches, prefixes first
+            scored = []
+            for eid in self._members.get(partition, ()):
+                _, text, record, _ = entries[eid]
+                pos = text.find(term)
+                if pos >= 0:
+                    scored.append(((2, 1.0 if pos == 0 else 0.5), eid, record))
+            return fuzzy.ordered(scored, limit)
+        shared = Counter()
+        for g in grams:
+            shared.update(self._postings.get((partition, g), ()))
+        # substring matches share every trigram of the term; everything else is
+        # scored in order of shared trigrams, and once `limit` results beat the
+        # best score the next group could reach, the rest is skipped
+        n = len(grams)
+        least = fuzzy.min_shared(n)
+        by_shared = {}
+        for eid, count in shared.items():
+            if count >= least:
+                by_shared.setdefault(count, []).append(eid)
+        word_cache = {}
+        scored = []
+        for count in sorted(by_shared, reverse=True):
+            if limit is not None and len(scored) >= limit:
+                kth = fuzzy.best(scored, limit)[-1][0]
+                if kth > (1, fuzzy.upper_bound(count, n)):
+                    break
+            for eid in by_shared[count]:
+                _, text, record, size = entries[eid]
+                s = fuzzy.score(term, grams, text, 2 * count / (n + size), word_cache)
+                if s is not None:
+                    scored.append((s, eid, record))
+        return fuzzy.ordered(scored, limit)
+
+    def note_append(self, pos, record):
+        if self._caught_up():
+            self._entry_at.append(self._add(record))
+
+    def note_remove(self, pos, record):
+        if self._caught_up():
+            self._drop(self._entry_at.pop(pos))
+
+    # the new record keeps the old entry's place in file order
+    def note_update(self, pos, old_record, new_record):
+        if not self._caught_up():
+            return
+        eid = self._entry_at[pos]
+        self._drop(eid)
+        self._add(new_record, eid)
+
+    def mark_synced(self):
+        self._caught_up()
+
+    def _caught_up(self):
+        version = self.store.version
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+            return True
+        return False
@@ -1,13 +1,28 @@
 #!/usr/bin/python3
 import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, like services/storage.py
+    fcntl = None
+
+from services.config import SQLITE_FILE, use_sqlite
+from services.passwords import hash_password, needs_rehash, verify_password
+from services.sqlite_backend import SQLiteUserStore
+from services.storage import LOCK_SUFFIX
+
 #This is to help define base directory and the path where all users data will be saved
 BASE_DIR = Path(__file__).resolve().parents[1]
 USERS_FILE = BASE_DIR / "users.txt"
 
 
+# Original unsalted SHA-256 hash; new passwords go through services/passwords.py
 def _hash(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
@@ -19,33 +34,23 @@ class FileRepoBase:
     def ensure_parent(self):
         self.file_path.parent.mkdir(parents=True, exist_ok=True)
 
-#The function that will help to save a new user in the created user.txt
-class UserRepository(FileRepoBase):
-    def save_user(self, username, password, name, email, role, org=""):
-        self.ensure_parent()
-        with open(self.file_path, "a", encoding="utf-8") as f:
-            f.write("{}:{}:{}:{}:{}:{}:{}\n".format(
-                username,
-                _hash(password),
-                name,
-                email,
-                role,
-                org,
-                datetime.now()
-    ))
+# "#rehash:<username>:<hash>" lines replace the hash of the user's line before
+# them (a login upgrade); with three fields, older readers skip them as malformed
+REHASH_TAG = "#rehash"
 
-#The function that will select user's information by using username or email
-    def get_user(self, username_or_email):
-        if not self.file_path.exists():
-            return None
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                parts = line.strip().split(":")
-                if len(parts) >= 6:
-                    u, pwd_hash, name, email, role, org = parts[:6]
-                    if u == username_or_email or email == username_or_email:
-                        return {"username": u, "password_hash": pwd_hash, "name": name, "email": email, "role": role, "org": org}
-        return None
+
+# users.txt line -> user record, or None for malformed lines
+def _parse_user_line(line):
+    parts = line.strip().split(":")
+    if len(parts) >= 6:
+        u, pwd_hash, name, email, role, org = parts[:6]
+        return {"username": u, "password_hash": pwd_hash, "name": name, "email": email, "role": role, "org": org}
+    return None
+
+
+# Lookups shared by the users.txt and SQLite repositories; subclasses provide
+# get_user and update_password_hash
+class UserAuthMixin:
 #This will check the username already exists
     def user_exists(self, username_or_email):
         return self.get_user(username_or_email) is not None
@@ -55,27 +60,244 @@ class UserRepository(FileRepoBase):
         u = self.get_user(username_or_email)
         if not u:
             return None
-        if u["password_hash"] == _hash(password):
-            return u
-        return None
+        if not verify_password(password, u["password_hash"]):
+            return None
+        # transparently move legacy/cheaper hashes to the configured scheme and cost
+        if needs_rehash(u["password_hash"]):
+            new_hash = hash_password(password)
+            if self.update_password_hash(u["username"], u["password_hash"], new_hash):
+                u["password_hash"] = new_hash
+        return u
+
+
+#The function that will help to save a new user in the created user.txt
+# Lookups go through an in-memory index (username/email -> first matching line, the same
+# answer the old line-by-line scan gave). It is built once, extended by reading only the
+# bytes appended since the last read (e.g. by another terminal), and rebuilt if the file
+# is replaced or truncated.
+# Other terminals share users.txt through "users.txt.lock": appends hold it shared,
+# rewrites (compact) hold it exclusive and re-read the file first, so no signup
+# made in between is lost. Hash upgrades are appended too (REHASH_TAG lines) and
+# folded into the user's line by compact.
+class UserRepository(UserAuthMixin, FileRepoBase):
+    # rewrite users.txt once this many lines can no longer be returned by get_user
+    COMPACT_MIN_DEAD_LINES = 1000
+
+    def __init__(self, file_path: Path):
+        super().__init__(file_path)
+        self.lock_path = self.file_path.with_name(self.file_path.name + LOCK_SUFFIX)
+        self._lock = threading.RLock()
+        self._reset_index()
+
+    # fcntl lock shared with other processes; callers hold self._lock and don't nest it
+    @contextmanager
+    def _file_lock(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        self.ensure_parent()
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def _reset_index(self):
+        self._first = {}     # username or email -> (line number, record) of the first line carrying it
+        self._doctors = []   # doctor records in file order
+        self._lines = 0
+        self._dead = 0       # lines get_user can never return (malformed, or every key taken earlier)
+        self._rehashed = {}  # line number -> hash a REHASH_TAG line replaced it with
+        self._offset = 0     # bytes of users.txt already indexed
+        self._file_id = None
+
+    def _index_line(self, line):
+        if line.startswith(REHASH_TAG + ":"):
+            self._index_rehash(line)
+            return
+        rec = _parse_user_line(line)
+        line_no = self._lines
+        self._lines += 1
+        if rec is None:
+            self._dead += 1
+            return
+        live = False
+        for key in (rec["username"], rec["email"]):
+            if key and key not in self._first:
+                self._first[key] = (line_no, rec)
+                live = True
+        if not live:
+            self._dead += 1
+        if rec["role"] == "doctor":
+            self._doctors.append({"username": rec["username"], "name": rec["name"], "org": rec["org"]})
+
+    # the rehash line itself is dead weight until compact folds it into the user's line
+    def _index_rehash(self, line):
+        self._lines += 1
+        self._dead += 1
+        parts = line.split(":")
+        if len(parts) != 3:
+            return
+        hit = self._first.get(parts[1])
+        if hit and hit[1]["username"] == parts[1]:
+            hit[1]["password_hash"] = parts[2]
+            self._rehashed[hit[0]] = parts[2]
+
+    # bring the index up to date with the file, reading only what was appended
+    def _refresh(self):
+        try:
+            st = os.stat(self.file_path)
+        except FileNotFoundError:
+            self._reset_index()
+            return
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self._file_id or st.st_size < self._offset:
+            self._reset_index()
+            self._file_id = file_id
+        if st.st_size == self._offset:
+            return
+        with open(self.file_path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # only index complete lines; a half-written last line is picked up next time
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].split(b"\n")[:-1]:
+            self._index_line(line.decode("utf-8"))
+        self._offset += end
+
+    # line numbers get_user can still return
+    def _live_lines(self):
+        return {line_no for line_no, _ in self._first.values()}
+
+    def save_user(self, username, password, name, email, role, org=""):
+        self.ensure_parent()
+        with self._lock:
+            with self._file_lock(exclusive=False):
+                self._refresh()
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write("{}:{}:{}:{}:{}:{}:{}\n".format(
+                        username,
+                        hash_password(password),
+                        name,
+                        email,
+                        role,
+                        org,
+                        datetime.now()
+            ))
+                self._refresh()
+            self._compact_if_due()
+
+    def _compact_if_due(self):
+        if self._dead >= max(self.COMPACT_MIN_DEAD_LINES, self._lines // 2):
+            self.compact()
+
+    # indexed lines (without newlines) plus any not-yet-indexed bytes after them
+    def _read_lines(self):
+        raw = self.file_path.read_bytes()
+        return raw[:self._offset].split(b"\n")[:-1], raw[self._offset:]
+
+    # replace users.txt through a temp file of our own; callers hold the exclusive file lock
+    def _rewrite(self, lines, tail=b""):
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.file_path.name}.", suffix=".tmp", dir=self.file_path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.writelines(line + b"\n" for line in lines)
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.file_path.exists():
+                os.chmod(tmp, os.stat(self.file_path).st_mode & 0o777)
+            os.replace(tmp, self.file_path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    # drop lines get_user can never return (later duplicates of an existing username/email)
+    # and write upgraded hashes back into the users' own lines
+    def compact(self):
+        self.ensure_parent()
+        with self._lock, self._file_lock(exclusive=True):
+            # re-read under the lock: lines appended by another terminal are kept
+            self._refresh()
+            live = self._live_lines()
+            if self.file_path.exists():
+                lines, tail = self._read_lines()
+                kept = [self._with_hash(line, self._rehashed[line_no]) if line_no in self._rehashed else line
+                        for line_no, line in enumerate(lines) if line_no in live]
+                self._rewrite(kept, tail)
+            self._reset_index()
+            self._refresh()
+
+    @staticmethod
+    def _with_hash(line, new_hash):
+        parts = line.decode("utf-8").split(":")
+        parts[1] = new_hash
+        return ":".join(parts).encode("utf-8")
+
+    # Replace the user's stored hash (used to upgrade legacy hashes) by appending a
+    # REHASH_TAG line, so a login costs one short write instead of a rewrite of the
+    # file. The check and the append both happen under the exclusive lock.
+    def update_password_hash(self, username, old_hash, new_hash):
+        with self._lock:
+            with self._file_lock(exclusive=True):
+                self._refresh()
+                hit = self._first.get(username)
+                if not hit or hit[1]["username"] != username or hit[1]["password_hash"] != old_hash:
+                    return False
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write(f"{REHASH_TAG}:{username}:{new_hash}\n")
+                self._refresh()
+            self._compact_if_due()
+            return True
+
+#The function that will select user's information by using username or email
+    def get_user(self, username_or_email):
+        with self._lock:
+            self._refresh()
+            hit = self._first.get(username_or_email)
+            return dict(hit[1]) if hit else None
 
 #The function which displays list of doctors from file
     def list_doctors(self):
-        results = []
-        if not self.file_path.exists():
-            return results
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                parts = line.strip().split(":")
-                if len(parts) >= 6:
-                    u, _, name, email, role, org = parts[:6]
-                    if role == "doctor":
-                        results.append({"username": u, "name": name, "org": org})
-        return results
+        with self._lock:
+            self._refresh()
+            return [dict(d) for d in self._doctors]
+
+
+# Same repository API backed by the SQLite users table (MEDITRACKER_STORAGE=sqlite).
+# It shares none of the users.txt code: the database does its own locking.
+class SQLiteUserRepository(UserAuthMixin):
+    def __init__(self, db_path: Path):
+        self.store = SQLiteUserStore(db_path)
+
+    def save_user(self, username, password, name, email, role, org=""):
+        self.store.save_user_record({
+            "username": username,
+            "password_hash": hash_password(password),
+            "name": name,
+            "email": email,
+            "role": role,
+            "org": org,
+            "created_at": str(datetime.now())
+        })
+
+    def get_user(self, username_or_email):
+        return self.store.find_user(username_or_email)
+
+    def list_doctors(self):
+        return self.store.list_doctors()
+
+    def update_password_hash(self, username, old_hash, new_hash):
+        return self.store.update_password_hash(username, old_hash, new_hash)
+
+    # drop rows get_user can never return, like UserRepository.compact
+    def compact(self):
+        self.store.delete_shadowed_users()
 
 
 #This will create one shared UserRepository that the functions below will use
-_repo = UserRepository(USERS_FILE)
+_repo = SQLiteUserRepository(SQLITE_FILE) if use_sqlite() else UserRepository(USERS_FILE)
 
 #This will cover functions so that other files may use it easily
 def save_user(username, password, name, email, role, org=""):
@@ -0,0 +1,97 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from services import bulk_io
+from services.patient_service import PatientRepository
+
+# Run from the src folder: python -m unittest discover tests
+
+KINDS = ("patients", "medicines", "schedules")
+
+
+class BulkRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.source = self._repo("source")
+        self._import(self.source, "patients", [{"name": "Jolly Uwase"}, {"name": "Eric Mugisha", "user_username": "eric1"}])
+        pids = [p["id"] for p in self.source.list_patients("drsmith")]
+        self._import(self.source, "medicines", [
+            {"patient_id": pids[0], "name": "Amoxil", "dosage": "500mg", "quantity": "20", "expiry_date": "2027/1/5"},
+            {"patient_id": pids[1], "name": "Paracetamol", "dosage": "1g", "quantity": "2.5", "expiry_date": "2027-03-01"},
+        ])
+        self._import(self.source, "schedules", [
+            {"patient_id": pids[0], "medicine_name": "Amoxil", "dosage": "500mg", "time": "08:00:00", "days": "mon;wed"},
+            {"patient_id": pids[1], "medicine_name": "Paracetamol", "dosage": "1g", "time": "20:30:00", "days": ""},
+        ])
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _repo(self, name):
+        folder = self.folder / name
+        return PatientRepository(folder / "patients.json", folder / "medicines.json", folder / "schedules.json")
+
+    def _import(self, repo, kind, rows):
+        report = bulk_io.import_rows(kind, [(i, row, None) for i, row in enumerate(rows, 1)], actor="drsmith", repo=repo)
+        self.assertEqual((report.accepted, report.rejected), (len(rows), []))
+
+    def _records(self, repo, kind):
+        store = {"patients": repo.pat_store, "medicines": repo.med_store, "schedules": repo.sch_store}[kind]
+        return [{c: r.get(c, "") for c in bulk_io.COLUMNS[kind]} for r in store.iter_records(kind)]
+
+    def _round_trip(self, suffix):
+        target = self._repo("target" + suffix)
+        for kind in KINDS:
+            path = self.folder / f"{kind}{suffix}"
+            self.assertEqual(bulk_io.export_file(kind, path, repo=self.source), 2)
+            report = bulk_io.import_file(kind, path, repo=target)
+            self.assertEqual((report.accepted, report.rejected), (2, []))
+            self.assertEqual(self._records(target, kind), self._records(self.source, kind))
+
+    def test_csv_round_trip(self):
+        self._round_trip(".csv")
+
+    def test_jsonl_round_trip(self):
+        self._round_trip(".jsonl")
+
+    def test_imported_values_are_normalized(self):
+        medicines = self._records(self.source, "medicines")
+        self.assertEqual(medicines[0]["expiry_date"], "2027-01-05")
+        self.assertEqual(medicines[0]["added_by"], "drsmith")
+        schedules = self._records(self.source, "schedules")
+        self.assertEqual(schedules[0]["days"], ["Mon", "Wed"])
+        self.assertEqual(len(schedules[1]["days"]), 7)
+
+    def test_bad_rows_are_reported_and_the_rest_imported(self):
+        path = self.folder / "medicines.jsonl"
+        pid = self.source.list_patients("drsmith")[0]["id"]
+        good = '{"patient_id": "%s", "name": "Ibuprofen", "dosage": "200mg", "quantity": "5", "expiry_date": "2027-02-02"}' % pid
+        path.write_text("\n".join([
+            good,
+            "{not json",
+            good.replace(pid, "P-nobody"),
+            good.replace('"5"', '"five"'),
+            "[1, 2]",
+        ]) + "\n")
+        report = bulk_io.import_file("medicines", path, actor="drsmith", repo=self.source)
+        self.assertEqual(report.accepted, 1)
+        self.assertEqual([(line, reason) for line, reason, _ in report.rejected], [
+            (2, "not valid JSON"),
+            (3, "unknown patient_id 'P-nobody'"),
+            (4, "quantity must be a number"),
+            (5, "expected a JSON object"),
+        ])
+        self.assertEqual(len(self._records(self.source, "medicines")), 3)
+
+    def test_duplicate_ids_are_rejected(self):
+        path = self.folder / "patients.csv"
+        bulk_io.export_file("patients", path, repo=self.source)
+        report = bulk_io.import_file("patients", path, repo=self.source)
+        self.assertEqual(report.accepted, 0)
+        self.assertTrue(all(reason.startswith("duplicate patient id") for _, reason, _ in report.rejected))
+
+
+if __name__ == "__main__":
+    unittest.main()
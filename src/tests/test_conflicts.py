@@ -0,0 +1,115 @@
+import json
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+
+from services import storage
+from services.storage import SEQ_KEY, ConflictError, JSONStorageBase, retry_on_conflict, save_many
+
+# Run from the src folder: python -m unittest discover tests
+
+
+# a write made by another process: the file changes under our cached copy
+def _write_elsewhere(store, **changes):
+    on_disk = json.loads(store.file_path.read_text())
+    on_disk.update(changes, **{SEQ_KEY: on_disk.get(SEQ_KEY, 0) + 1})
+    storage.atomic_write_json(store.file_path, on_disk)
+
+
+class Counter(JSONStorageBase):
+    def __init__(self, file_path):
+        super().__init__(file_path, {"count": 0})
+
+    @retry_on_conflict
+    def increment(self):
+        data = self.load()
+        self.save(dict(data, count=data["count"] + 1))
+
+
+def _increment(path, times):
+    counter = Counter(path)
+    for _ in range(times):
+        counter.increment()
+
+
+class ConflictTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._tmp.name)
+        self.a = JSONStorageBase(self.folder / "a.json", {"items": []})
+        self.b = JSONStorageBase(self.folder / "b.json", {"items": []})
+        self._retries = storage.CONFLICT_RETRIES
+
+    def tearDown(self):
+        storage.CONFLICT_RETRIES = self._retries
+        self._tmp.cleanup()
+
+    def test_stale_save_is_refused(self):
+        stale = self.a.load()
+        _write_elsewhere(self.a, items=["theirs"])
+        with self.assertRaises(ConflictError) as caught:
+            self.a.save(dict(stale, items=["ours"]))
+        self.assertEqual(caught.exception.stores, (self.a,))
+        self.assertEqual(self.a.load()["items"], ["theirs"])
+
+    def test_stale_batch_names_every_store(self):
+        a, b = self.a.load(), self.b.load()
+        _write_elsewhere(self.b, items=["theirs"])
+        with self.assertRaises(ConflictError) as caught:
+            save_many([(self.a, dict(a, items=[1])), (self.b, dict(b, items=[2]))])
+        self.assertEqual(set(caught.exception.stores), {self.a, self.b})
+        # nothing of the batch was written
+        self.assertEqual(self.a.load()["items"], [])
+
+    def test_retry_runs_on_the_other_writers_data(self):
+        calls = []
+
+        @retry_on_conflict
+        def add(item):
+            data = self.a.load()
+            if not calls:
+                _write_elsewhere(self.a, items=["theirs"])
+            calls.append(item)
+            self.a.save(dict(data, items=data["items"] + [item]))
+
+        add("ours")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.a.load()["items"], ["theirs", "ours"])
+
+    def test_batch_that_keeps_losing_gets_a_locked_last_run(self):
+        storage.CONFLICT_RETRIES = 2
+        held = []
+
+        @retry_on_conflict
+        def move():
+            a, b = self.a.load(), self.b.load()
+            held.append({key: lock[1] for key, lock in storage._held.items()})
+            if len(held) <= storage.CONFLICT_RETRIES:
+                _write_elsewhere(self.b, items=b["items"] + ["theirs"])
+            save_many([(self.a, dict(a, items=a["items"] + ["moved"])), (self.b, dict(b, items=[]))])
+
+        move()
+        self.assertEqual(len(held), storage.CONFLICT_RETRIES + 1)
+        # only the last run holds both stores' write locks
+        self.assertEqual(held[0], {})
+        self.assertEqual(held[-1], {self.a._cache_key: True, self.b._cache_key: True})
+        self.assertEqual(self.a.load()["items"], ["moved"])
+        self.assertEqual(self.b.load()["items"], [])
+
+    def test_concurrent_processes_lose_no_update(self):
+        path = self.folder / "counter.json"
+        Counter(path).ensure()
+        workers = [multiprocessing.Process(target=_increment, args=(path, 40)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        counter = Counter(path)
+        counter.invalidate()
+        self.assertEqual(counter.load()["count"], 160)
+
+
+if __name__ == "__main__":
+    unittest.main()
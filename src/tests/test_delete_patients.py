@@ -0,0 +1,75 @@
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+
+from services import storage
+from services.inventory import MedicineInventory
+from services.patient_service import PatientRepository
+from services.reminder_service import ScheduleManager
+
+# Run from the src folder: python -m unittest discover tests
+
+
+def _open(folder):
+    folder = Path(folder)
+    return (PatientRepository(folder / "patients.json", folder / "medicines.json", folder / "schedules.json"),
+            MedicineInventory(folder / "medicines.json"),
+            ScheduleManager(folder / "schedules.json"))
+
+
+# another terminal signing up patients for drB while drA discharges theirs
+def _add_patients(folder, rounds):
+    repo, inventory, schedules = _open(folder)
+    for i in range(rounds):
+        pid = repo.add_patient("drB", f"B{i}")
+        inventory.add_medicine(pid, "Amoxil", "250mg", "10", "2027-01-01", "drB")
+        schedules.add_reminder(pid, "Amoxil", "250mg", "08:00:00", ["Mon"], "drB")
+
+
+class ConcurrentDeleteTest(unittest.TestCase):
+    ROUNDS = 25
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = self._tmp.name
+        self.repo, self.inventory, self.schedules = _open(self.folder)
+        self.pids = []
+        for i in range(self.ROUNDS):
+            pid = self.repo.add_patient("drA", f"A{i}")
+            self.inventory.add_medicine(pid, "Paracetamol", "500mg", "20", "2027-01-01", "drA")
+            self.schedules.add_reminder(pid, "Paracetamol", "500mg", "09:00:00", ["Tue"], "drA")
+            self.pids.append(pid)
+        # lose races early, so the locked last run is exercised too
+        self._retries = storage.CONFLICT_RETRIES
+        storage.CONFLICT_RETRIES = 1
+
+    def tearDown(self):
+        storage.CONFLICT_RETRIES = self._retries
+        self._tmp.cleanup()
+
+    def test_deletes_alongside_appends_from_another_process(self):
+        writers = [multiprocessing.Process(target=_add_patients, args=(self.folder, self.ROUNDS)) for _ in range(2)]
+        for writer in writers:
+            writer.start()
+        for pid in self.pids:
+            self.assertTrue(self.repo.delete_patient("drA", pid))
+        for writer in writers:
+            writer.join()
+            self.assertEqual(writer.exitcode, 0)
+
+        # what a fresh process sees
+        for store in (self.repo.pat_store, self.repo.med_store, self.repo.sch_store):
+            store.invalidate()
+        self.assertEqual(self.repo.list_patients("drA"), [])
+        self.assertEqual(len(self.repo.list_patients("drB")), 2 * self.ROUNDS)
+        medicines = self.inventory.load()["medicines"]
+        reminders = self.schedules.load()["schedules"]
+        self.assertEqual({m["added_by"] for m in medicines}, {"drB"})
+        self.assertEqual(len(medicines), 2 * self.ROUNDS)
+        self.assertEqual({r["created_by"] for r in reminders}, {"drB"})
+        self.assertEqual(len(reminders), 2 * self.ROUNDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
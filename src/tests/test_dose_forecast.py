@@ -0,0 +1,87 @@
+import random
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+from services import dose_service
+from services.dose_log import Dose, DoseLog
+
+# Run from the src folder: python -m unittest discover tests
+
+
+# day by day: the first day whose running total of doses reaches the stock
+def _simulated(q, first, full):
+    if q <= dose_service.EPS:
+        return 0
+    if not any(first) and not any(full):
+        return None
+    total = 0
+    for day in range(10000):
+        total += first[day] if day < 7 else full[(day - 7) % 7]
+        if total >= q - dose_service.EPS:
+            return day
+    return None
+
+
+class RunOutForecastTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.quantities, self.first, self.full = [], [], []
+        for _ in range(400):
+            full = [rng.choice([0, 0, 1, 2, 3]) for _ in range(7)]
+            self.full.append(full)
+            self.first.append([rng.randrange(full[0] + 1)] + full[1:])
+            self.quantities.append(rng.choice([0, 1, 2.5, 7, 30, 100, rng.randrange(500), rng.random() * 50]))
+        self.expected = [_simulated(*args) for args in zip(self.quantities, self.first, self.full)]
+
+    def test_matches_a_day_by_day_count(self):
+        self.assertEqual(dose_service.run_out_offsets(self.quantities, self.first, self.full), self.expected)
+
+    def test_plain_python_path(self):
+        with mock.patch.object(dose_service, "np", None):
+            self.assertEqual(dose_service.run_out_offsets(self.quantities, self.first, self.full), self.expected)
+
+    def test_weekly_doses_count_only_what_is_still_due_today(self):
+        # a Monday, 12:00
+        now = datetime(2026, 10, 19, 12, 0)
+        schedules = [
+            {"patient_id": "P1", "medicine_name": "Amoxil", "time": "08:00:00", "days": ["Mon", "Wed"]},
+            {"patient_id": "P1", "medicine_name": " amoxil ", "time": "20:00:00", "days": ["Mon"]},
+            {"patient_id": "P1", "medicine_name": "Amoxil", "time": "bad", "days": ["Tue"]},
+        ]
+        self.assertEqual(dose_service._weekly_doses(schedules, now),
+                         {("P1", "amoxil"): ([2, 0, 1, 0, 0, 0, 0], [1])})
+
+
+class DoseLogTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.log = DoseLog(Path(self._tmp.name) / "doses.log")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_incremental_reads(self):
+        self.log.append(Dose("2026-10-19 08:00:00", "P1", "S1", "M1", 1))
+        doses, offset = self.log.read_from()
+        self.assertEqual(doses, [Dose("2026-10-19 08:00:00", "P1", "S1", "M1", 1.0)])
+        self.log.append(Dose("2026-10-19 20:00:00", "P1", "S2", "", 2))
+        doses, end = self.log.read_from(offset)
+        self.assertEqual([d.schedule_id for d in doses], ["S2"])
+        self.assertEqual(end, self.log.version)
+
+    def test_torn_line_is_left_for_later_and_not_glued_onto(self):
+        self.log.append(Dose("2026-10-19 08:00:00", "P1", "S1", "M1", 1))
+        with open(self.log.file_path, "a") as f:
+            f.write("2026-10-19 09:00:00\tP1")
+        doses, offset = self.log.read_from()
+        self.assertEqual(len(doses), 1)
+        self.log.append(Dose("2026-10-19 20:00:00", "P1", "S2", "M1", 1))
+        doses, _ = self.log.read_from(offset)
+        self.assertEqual([d.schedule_id for d in doses], ["S2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from services.storage import FieldIndex, JSONStorageBase, NgramIndex, SortedIndex, _Tombstones
+
+# Run from the src folder: python -m unittest discover tests
+
+
+def _expiry(record):
+    return record.get("expiry_date") or None
+
+
+class IndexMaintenanceTest(unittest.TestCase):
+    # the indexes must answer like a scan of the records, whether they were kept
+    # current by note_* calls (with tombstones) or rebuilt
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.store = JSONStorageBase(Path(self._tmp.name) / "medicines.json", {"medicines": []})
+        self.rng = random.Random(7)
+        self.store.save({"medicines": [self._medicine() for _ in range(200)]})
+        self.by_patient = FieldIndex(self.store, "medicines", "patient_id")
+        self.by_expiry = SortedIndex(self.store, "medicines", _expiry, "added_by")
+        self.by_name = NgramIndex(self.store, "medicines", "name", "added_by")
+        self.indexes = (self.by_patient, self.by_expiry, self.by_name)
+        data = self.store.load()
+        for index in self.indexes:
+            index.sync(data)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _medicine(self):
+        rng = self.rng
+        return {"id": f"M{rng.getrandbits(40):x}", "patient_id": f"P{rng.randrange(12)}",
+                "name": rng.choice(["Paracetamol", "Amoxil", "Ibuprofen"]), "quantity": "1", "expiry_date": f"2027-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+                "added_by": f"dr{rng.randrange(3)}"}
+
+    # one random add, edit or remove through the journal, reported to every index
+    def _write(self):
+        data = self.store.load()
+        records = data["medicines"]
+        roll = self.rng.random()
+        if roll < 0.5:
+            pos = self.rng.randrange(len(records))
+            removed = records[pos]
+            self.store.remove(data, "medicines", pos)
+            for index in self.indexes:
+                index.note_remove(pos, removed)
+        elif roll < 0.75:
+            self.store.append(data, "medicines", self._medicine())
+            pos = len(records) - 1
+            for index in self.indexes:
+                index.note_append(pos, records[pos])
+        else:
+            pos = self.rng.randrange(len(records))
+            old = records[pos]
+            self.store.update(data, "medicines", pos, dict(self._medicine(), name=old["name"]))
+            for index in self.indexes:
+                index.note_update(pos, old, records[pos])
+
+    def _assert_matches_scan(self):
+        data = self.store.load()
+        records = data["medicines"]
+        for p in range(12):
+            expected = [i for i, r in enumerate(records) if r["patient_id"] == f"P{p}"]
+            self.assertEqual(self.by_patient.positions(f"P{p}", data), expected)
+        for doctor in (None, "dr0", "dr1", "dr2"):
+            mine = [(r["expiry_date"], i) for i, r in enumerate(records)
+                    if (doctor is None or r["added_by"] == doctor) and r["expiry_date"] < "2027-07-01"]
+            expected = [records[i] for _, i in sorted(mine)]
+            self.assertEqual([id(r) for r in self.by_expiry.below("2027-07-01", doctor, data)],
+                             [id(r) for r in expected])
+            if doctor is not None:
+                expected = [r for r in records if r["added_by"] == doctor and "amox" in r["name"].lower()]
+                self.assertEqual([id(r) for r in self.by_name.search(doctor, "amox", data)],
+                                 [id(r) for r in expected])
+
+    def test_writes_are_applied_without_a_rebuild(self):
+        versions = []
+        for step in range(300):
+            self._write()
+            versions.append(self.by_patient._version)
+            if step % 25 == 0:
+                self._assert_matches_scan()
+        self._assert_matches_scan()
+        # every write was taken incrementally: the index followed each version bump
+        self.assertEqual(versions[-1], self.store.version)
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_tombstones_are_folded_in(self):
+        for _ in range(_Tombstones.LIMIT - 1):
+            data = self.store.load()
+            removed = data["medicines"][0]
+            self.store.remove(data, "medicines", 0)
+            self.by_patient.note_remove(0, removed)
+        self.assertEqual(len(self.by_patient._gone), _Tombstones.LIMIT - 1)
+        data = self.store.load()
+        removed = data["medicines"][-1]
+        self.store.remove(data, "medicines", len(data["medicines"]) - 1)
+        self.by_patient.note_remove(len(data["medicines"]), removed)
+        self.assertEqual(len(self.by_patient._gone), 0)
+        records = self.store.load()["medicines"]
+        self.assertEqual(self.by_patient.positions("P3"), [i for i, r in enumerate(records) if r["patient_id"] == "P3"])
+
+    def test_change_made_elsewhere_triggers_a_rebuild(self):
+        data = self.store.load()
+        # a save nobody reported, like another terminal's write
+        self.store.save(dict(data, medicines=[dict(data["medicines"][0], patient_id="P99")] + data["medicines"][1:]))
+        self.assertEqual(self.by_patient.positions("P99"), [0])
+        self.assertEqual(self.by_patient._version, self.store.version)
+
+    def test_page_cursor_survives_deletions(self):
+        data = self.store.load()
+        patient = data["medicines"][0]["patient_id"]
+        expected_ids = [id(r) for r in self.by_patient.records(patient)]
+        page, cursor = self.by_patient.page(patient, limit=3, id_field="id")
+        self.assertEqual([id(r) for r in page], expected_ids[:3])
+        # remove records in front of the cursor
+        for pos in (1, 0):
+            removed = data["medicines"][pos]
+            self.store.remove(data, "medicines", pos)
+            self.by_patient.note_remove(pos, removed)
+        rest = []
+        while cursor:
+            page, cursor = self.by_patient.page(patient, cursor=cursor, limit=3, id_field="id")
+            rest.extend(id(r) for r in page)
+        self.assertEqual(rest, expected_ids[3:])
+
+    def test_slots_and_positions_convert_both_ways(self):
+        gone = _Tombstones()
+        for slot in (2, 5, 6, 7):
+            gone.bury(slot)
+        for slot in range(12):
+            if slot not in gone.gone:
+                self.assertEqual(gone.slot(gone.pos(slot)), slot)
+        self.assertEqual(gone.next_slot(8), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from services.storage import SEQ_KEY, JSONStorageBase
+
+# Run from the src folder: python -m unittest discover tests
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "medicines.json"
+        self.store = JSONStorageBase(self.path, {"medicines": []})
+        self.store.ensure()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _medicine(self, name):
+        return {"id": f"M-{name}", "patient_id": "P1", "name": name, "quantity": "1", "expiry_date": "2027-01-01"}
+
+    # what another process would read: the snapshot with the journal replayed
+    def _fresh(self):
+        self.store.invalidate()
+        return [dict(r) for r in self.store.load()["medicines"]]
+
+    def _write_some(self):
+        data = self.store.load()
+        for name in ("A", "B", "C"):
+            self.store.append(data, "medicines", self._medicine(name))
+        self.store.update(data, "medicines", 1, dict(self._medicine("B"), quantity="5"))
+        self.store.remove(data, "medicines", 0)
+        return [dict(r) for r in data["medicines"]]
+
+    def test_writes_go_to_the_journal_and_replay(self):
+        snapshot = self.path.read_bytes()
+        expected = self._write_some()
+        self.assertEqual(self.path.read_bytes(), snapshot)
+        lines = self.path.with_name("medicines.json.journal").read_text().splitlines()
+        self.assertEqual([json.loads(line)["op"] for line in lines], ["add", "add", "add", "set", "del"])
+        self.assertEqual(self._fresh(), expected)
+        self.assertEqual([m["quantity"] for m in expected], ["5", "1"])
+
+    def test_compaction_folds_the_journal_into_the_snapshot(self):
+        expected = self._write_some()
+        self.store.compact()
+        journal = self.path.with_name("medicines.json.journal")
+        self.assertEqual(journal.stat().st_size, 0)
+        on_disk = json.loads(self.path.read_text())
+        # five journal lines, then the compaction's own save
+        self.assertEqual(on_disk[SEQ_KEY], 6)
+        self.assertEqual(on_disk["medicines"], expected)
+        self.assertEqual(self._fresh(), expected)
+
+    def test_lines_already_in_the_snapshot_are_not_replayed(self):
+        expected = self._write_some()
+        journal = self.path.with_name("medicines.json.journal")
+        lines = journal.read_bytes()
+        self.store.compact()
+        # a crash between writing the snapshot and truncating the journal
+        journal.write_bytes(lines)
+        self.assertEqual(self._fresh(), expected)
+
+    def test_torn_last_line_is_ignored(self):
+        expected = self._write_some()
+        with open(self.path.with_name("medicines.json.journal"), "a") as f:
+            f.write('{"op": "add", "key": "medicines", "rec')
+        self.assertEqual(self._fresh(), expected)
+
+    def test_journal_past_the_threshold_is_compacted_in_the_background(self):
+        store = JSONStorageBase(self.path, {"medicines": []}, compact_threshold=200)
+        data = store.load()
+        for name in ("A", "B", "C"):
+            store.append(data, "medicines", self._medicine(name))
+        journal = self.path.with_name("medicines.json.journal")
+        deadline = time.monotonic() + 5
+        while journal.stat().st_size and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(journal.stat().st_size, 0)
+        self.assertEqual([m["name"] for m in json.loads(self.path.read_text())["medicines"]], ["A", "B", "C"])
+
+
+if __name__ == "__main__":
+    unittest.main()
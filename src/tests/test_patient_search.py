@@ -0,0 +1,35 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from services.patient_service import PatientRepository
+
+# Run from the src folder: python -m unittest discover tests
+
+
+class FuzzyIdSearchTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        folder = Path(self._tmp.name)
+        self.repo = PatientRepository(folder / "patients.json", folder / "medicines.json", folder / "schedules.json")
+        self.pid = self.repo.add_patient("drsmith", "Jolly Uwase")
+        self.repo.add_patient("drsmith", "Eric Mugisha")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_full_id_is_found(self):
+        found = self.repo.search_patients("drsmith", self.pid, fuzzy=True)
+        self.assertEqual(found[0]["id"], self.pid)
+
+    def test_id_prefix_in_any_case(self):
+        for term in (self.pid[:-3], self.pid.upper(), self.pid.lower()):
+            found = self.repo.search_patients("drsmith", term, fuzzy=True)
+            self.assertEqual(found[0]["id"], self.pid, term)
+
+    def test_other_doctors_patients_are_not_found(self):
+        self.assertEqual(self.repo.search_patients("drjones", self.pid, fuzzy=True), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from services.patient_service import PatientRepository
+from services.records import Medicine, Patient, Schedule
+
+# Run from the src folder: python -m unittest discover tests
+
+
+class RecordRoundTripTest(unittest.TestCase):
+    # a record must write back exactly the JSON object it was read from
+
+    def _round_trip(self, cls, data):
+        record = cls.from_dict(data)
+        self.assertEqual(json.dumps(record.to_dict()), json.dumps(data))
+        self.assertEqual(dict(record), data)
+        return record
+
+    def test_patient(self):
+        self._round_trip(Patient, {"id": "P1", "name": "Jolly Uwase", "doctor": "drsmith",
+                                   "user_username": "", "created_at": "2026-01-02 10:00:00"})
+
+    def test_medicine_quantities(self):
+        for quantity in ("10", "2.5", "10.0", "", "abc"):
+            self._round_trip(Medicine, {"id": "M1", "patient_id": "P1", "name": "Amoxil", "dosage": "1 tab",
+                                        "quantity": quantity, "expiry_date": "2027-01-01", "added_by": "drsmith"})
+
+    def test_schedule_compact_fields(self):
+        data = {"id": "S1", "patient_id": "P1", "medicine_name": "Amoxil", "dosage": "1 tab",
+                "time": "08:00:00", "days": ["Mon", "Wed"], "created_by": "drsmith"}
+        schedule = self._round_trip(Schedule, data)
+        self.assertEqual((schedule.time, schedule.days), (28800, 0b101))
+        self.assertTrue(schedule.due_at(datetime(2026, 10, 19, 8, 0, 30)))
+        self.assertFalse(schedule.due_at(datetime(2026, 10, 20, 8, 0)))
+        self.assertEqual(schedule.next_fire(datetime(2026, 10, 19, 8, 0)), datetime(2026, 10, 21, 8, 0))
+
+    def test_schedule_values_kept_verbatim(self):
+        # out-of-order days, a malformed time and an unknown key survive unchanged
+        self._round_trip(Schedule, {"time": "8am", "days": ["Wed", "Mon"], "note": {"a": 1}, "id": "S2"})
+
+    def test_keyword_construction(self):
+        schedule = Schedule(time="08:00:00", days=["Mon"])
+        self.assertEqual(schedule.to_dict(), {"time": "08:00:00", "days": ["Mon"]})
+        schedule.time = 9 * 3600
+        self.assertEqual(schedule["time"], "09:00:00")
+
+    def test_item_assignment(self):
+        medicine = Medicine.from_dict({"id": "M1", "quantity": "10.0"})
+        medicine["quantity"] = "4"
+        medicine["added_by"] = "drsmith"
+        self.assertEqual(medicine.quantity, 4)
+        self.assertEqual(medicine.to_dict(), {"id": "M1", "quantity": "4", "added_by": "drsmith"})
+
+
+class CachedRecordsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        folder = Path(self._tmp.name)
+        self.repo = PatientRepository(folder / "patients.json", folder / "medicines.json", folder / "schedules.json")
+        self.pid = self.repo.add_patient("drsmith", "Jolly Uwase")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_cache_holds_records(self):
+        patients = self.repo._load(self.repo.pat_store)["patients"]
+        self.assertTrue(all(type(p) is Patient for p in patients))
+        self.repo.pat_store.invalidate()
+        patients = self.repo._load(self.repo.pat_store)["patients"]
+        self.assertTrue(all(type(p) is Patient for p in patients))
+
+    def test_search_returns_the_cached_records(self):
+        cached = self.repo._load(self.repo.pat_store)["patients"]
+        found = self.repo.search_patients("drsmith", "jolly")
+        self.assertEqual([p["id"] for p in found], [self.pid])
+        self.assertIs(found[0], cached[0])
+
+    def test_file_keeps_plain_json(self):
+        self.repo.pat_store.compact()
+        on_disk = json.loads(self.repo.pat_store.file_path.read_text())["patients"]
+        cached = self.repo._load(self.repo.pat_store)["patients"]
+        self.assertEqual(on_disk, [p.to_dict() for p in cached])
+        self.assertEqual(on_disk[0]["id"], self.pid)
+
+
+if __name__ == "__main__":
+    unittest.main()
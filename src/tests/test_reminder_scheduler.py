@@ -0,0 +1,89 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from services import storage
+from services.reminder_scheduler import ReminderScheduler
+from services.reminder_service import ScheduleManager
+from services.storage import SEQ_KEY
+
+# Run from the src folder: python -m unittest discover tests
+
+EVERY_DAY = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+class ReminderSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.manager = ScheduleManager(Path(self._tmp.name) / "schedules.json")
+        self.manager.ensure()
+        # listener updates use the wall clock, so the test times are taken around it
+        self.now = datetime.now().replace(second=0, microsecond=0)
+        self.fire_at = self.now + timedelta(minutes=5)
+        self.rid = self._add("P1", self.fire_at)
+        self.scheduler = ReminderScheduler(self.manager, recheck_seconds=60)
+        self.scheduler.rebuild(self.now)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self._tmp.cleanup()
+
+    def _add(self, pid, at, days=EVERY_DAY):
+        return self.manager.add_reminder(pid, "Amoxil", "1 tab", at.strftime("%H:%M:%S"), days, "drsmith")
+
+    def test_reminder_fires_once_at_its_time(self):
+        self.assertEqual(self.scheduler.next_due(), self.fire_at)
+        self.assertEqual(self.scheduler.pop_due(self.fire_at - timedelta(seconds=1)), [])
+        due = self.scheduler.pop_due(self.fire_at)
+        self.assertEqual([(at, r["id"], late) for at, r, late in due], [(self.fire_at, self.rid, False)])
+        self.assertEqual(self.scheduler.pop_due(self.fire_at), [])
+        # the next occurrence is queued for tomorrow
+        self.assertEqual(self.scheduler.next_due(), self.fire_at + timedelta(days=1))
+
+    def test_missed_occurrence_is_delivered_late(self):
+        due = self.scheduler.pop_due(self.fire_at + timedelta(minutes=3))
+        self.assertEqual([(at, late) for at, _, late in due], [(self.fire_at, True)])
+
+    def test_occurrences_past_the_catch_up_window_are_dropped(self):
+        self.scheduler.max_catch_up = timedelta(hours=1)
+        self.assertEqual(self.scheduler.pop_due(self.fire_at + timedelta(hours=2)), [])
+        self.assertEqual(self.scheduler.next_due(), self.fire_at + timedelta(days=1))
+
+    def test_sleep_is_bounded_by_the_next_reminder(self):
+        self.assertEqual(self.scheduler.sleep_seconds(self.fire_at - timedelta(seconds=20)), 20)
+        self.assertEqual(self.scheduler.sleep_seconds(self.fire_at - timedelta(minutes=3)), 60)
+
+    def test_edit_replaces_the_queued_occurrence(self):
+        later = self.fire_at + timedelta(minutes=30)
+        self.assertTrue(self.manager.edit_reminder("P1", self.rid, "Amoxil", "2 tabs", later.strftime("%H:%M:%S"), EVERY_DAY))
+        self.assertEqual(self.scheduler.next_due(), later)
+        # taken incrementally, without marking the heap for a rebuild
+        self.assertEqual(self.scheduler._known_version, self.manager.version)
+        self.assertFalse(self.scheduler._stale)
+
+    def test_change_from_another_process_is_picked_up(self):
+        self.manager.compact()
+        on_disk = json.loads(self.manager.file_path.read_text())
+        earlier = self.fire_at - timedelta(minutes=2)
+        on_disk["schedules"].append(dict(on_disk["schedules"][0], id="S-other", patient_id="P2",
+                                         time=earlier.strftime("%H:%M:%S")))
+        on_disk[SEQ_KEY] = on_disk.get(SEQ_KEY, 0) + 1
+        storage.atomic_write_json(self.manager.file_path, on_disk)
+        self.assertEqual(self.scheduler.next_due(), self.fire_at)
+        self.scheduler.check_external_changes()
+        self.assertEqual(self.scheduler.next_due(), earlier)
+
+    def test_patient_filter(self):
+        self._add("P2", self.fire_at - timedelta(minutes=1))
+        only_p1 = ReminderScheduler(self.manager, patient_ids=["P1"])
+        only_p1.rebuild(self.now)
+        self.assertEqual(only_p1.next_due(), self.fire_at)
+        only_p1.remove_patient("P1")
+        self.assertIsNone(only_p1.next_due())
+        only_p1.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
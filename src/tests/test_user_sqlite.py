@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from services.user_service import SQLiteUserRepository, _hash
+
+# Run from the src folder: python -m unittest discover tests
+
+
+class SQLiteUserRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.repo = SQLiteUserRepository(Path(self._tmp.name) / "meditracker.db")
+        self.repo.save_user("drsmith", "secret", "Dr Smith", "smith@clinic.rw", "doctor", "CHUK")
+        self.repo.save_user("jolly", "pass", "Jolly Uwase", "jolly@mail.rw", "patient")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_lookup_and_login(self):
+        self.assertTrue(self.repo.user_exists("smith@clinic.rw"))
+        self.assertEqual(self.repo.authenticate("drsmith", "secret")["name"], "Dr Smith")
+        self.assertIsNone(self.repo.authenticate("drsmith", "wrong"))
+        self.assertEqual([d["username"] for d in self.repo.list_doctors()], ["drsmith"])
+
+    def test_legacy_hash_is_upgraded_at_login(self):
+        self.repo.store.save_user_record({"username": "old", "password_hash": _hash("pw"), "role": "patient"})
+        self.assertIsNotNone(self.repo.authenticate("old", "pw"))
+        self.assertNotEqual(self.repo.get_user("old")["password_hash"], _hash("pw"))
+
+    def test_compact_keeps_what_get_user_returns(self):
+        # a signup reusing both a taken username and a taken email can never be returned
+        self.repo.save_user("drsmith", "other", "Impostor", "jolly@mail.rw", "doctor")
+        self.repo.save_user("eric", "pw", "Eric", "smith@clinic.rw", "patient")
+        keys = ("drsmith", "smith@clinic.rw", "jolly", "jolly@mail.rw", "eric")
+        before = {key: self.repo.get_user(key) for key in keys}
+        self.repo.compact()
+        self.assertEqual({key: self.repo.get_user(key) for key in keys}, before)
+        self.assertEqual(len(self.repo.store._query("SELECT rowid FROM users")), 3)
+        self.assertEqual([d["username"] for d in self.repo.list_doctors()], ["drsmith"])
+
+if __name__ == "__main__":
+    unittest.main()